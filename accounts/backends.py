@@ -0,0 +1,74 @@
+"""Authentication backend serving the users of sessions from a cache.
+
+`AuthenticationMiddleware` loads the user of the session on every request.
+`CachedModelBackend` keeps users in the `sessions` cache, next to the
+sessions themselves, so browsing does not touch the database. A cached
+user is dropped when the user is saved (password changes, admin edits,
+`last_login` updates) or deleted, when their groups or permissions change
+and when they log out; otherwise it expires after `USER_CACHE_TIMEOUT`.
+Logging in caches the user right away.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+
+def get_cache():
+    return caches[settings.SESSION_CACHE_ALIAS]
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = _user_key(user_id)
+        user = get_cache().get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            get_cache().set(key, user, timeout=settings.USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
+
+
+def invalidate(user_id):
+    get_cache().delete(_user_key(user_id))
+
+
+def _user_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def _user_changed(instance, **kwargs):
+    # Again after the commit: a concurrent request may have cached the old row meanwhile
+    invalidate(instance.pk)
+    transaction.on_commit(lambda: invalidate(instance.pk))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def _user_permissions_changed(instance, reverse, pk_set, **kwargs):
+    if not reverse:
+        invalidate(instance.pk)
+    elif pk_set:
+        # Users added to or removed from a group
+        for user_id in pk_set:
+            invalidate(user_id)
+
+
+@receiver(user_logged_in)
+def _logged_in(user, **kwargs):
+    # Connected after `update_last_login`, whose save dropped the user: the
+    # next request, the first of the new session, finds it cached
+    get_cache().set(_user_key(user.pk), user, timeout=settings.USER_CACHE_TIMEOUT)
+
+
+@receiver(user_logged_out)
+def _logged_out(user, **kwargs):
+    if user is not None:
+        invalidate(user.pk)
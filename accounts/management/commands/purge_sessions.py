@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from accounts import sessions
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired sessions and cached users from the sessions cache, run periodically'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of cache files checked per batch')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to wait between batches')
+
+    def handle(self, *args, **options):
+        purged = sessions.purge_expired(options['batch_size'], options['pause'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} expired entries'))
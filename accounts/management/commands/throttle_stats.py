@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from accounts import throttling
+
+
+class Command(BaseCommand):
+    help = 'Shows the counters of rejected login and signup attempts'
+
+    def handle(self, *args, **options):
+        for endpoint, counters in throttling.stats().items():
+            rejected = ', '.join(f'{key}: {count}' for key, count in counters.items())
+            self.stdout.write(f'{endpoint}: rejected by {rejected}')
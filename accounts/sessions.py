@@ -0,0 +1,54 @@
+"""Purging of expired sessions from the `sessions` cache.
+
+Sessions are stored with the cache session engine, nothing is written to
+the database. The file based cache only deletes expired files it happens
+to read, so `manage.py purge_sessions` sweeps the cache directory for
+sessions (and cached users) that expired but were never read again.
+"""
+import glob
+import os
+import pickle
+import time
+
+from django.conf import settings
+from django.core.cache.backends.filebased import FileBasedCache
+
+from accounts.backends import get_cache
+
+
+def purge_expired(batch_size=1000, pause=0):
+    """Deletes the expired entries of the cache, returns how many.
+
+    Files are checked in batches with `pause` seconds in between, so the
+    sweep does not compete with requests for the disk. Other backends
+    expire their entries themselves and are left alone.
+    """
+    cache = get_cache()
+    if not isinstance(cache, FileBasedCache):
+        return 0
+    location = settings.CACHES[settings.SESSION_CACHE_ALIAS]['LOCATION']
+    paths = glob.glob(os.path.join(location, f'*{FileBasedCache.cache_suffix}'))
+
+    purged = 0
+    for start in range(0, len(paths), batch_size):
+        now = time.time()
+        for path in paths[start:start + batch_size]:
+            if _expires(path) < now:
+                try:
+                    os.remove(path)
+                    purged += 1
+                except FileNotFoundError:
+                    pass
+        if pause and start + batch_size < len(paths):
+            time.sleep(pause)
+    return purged
+
+
+def _expires(path):
+    # Every cache file starts with the pickled expiry time, `None` for never
+    try:
+        with open(path, 'rb') as file:
+            expires = pickle.load(file)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return float('inf')
+    return float('inf') if expires is None else expires
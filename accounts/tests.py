@@ -1,12 +1,30 @@
+import copy
+import fcntl
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
 from django.contrib import auth
-from django.test import TestCase
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.models import User
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.utils.translation import gettext as _
 
+from accounts import backends, throttling
+from producthuntclone.queries import record_queries
 from producthuntclone.test_utils import CONTEXT_INDEX
 
 
 class SignUpTests(TestCase):
+    def setUp(self):
+        throttling.reset()
+
     def get_post_response(self, data=None):
         return self.client.post(reverse('signup'), data=data or {'username': '', 'password1': '', 'password2': ''})
 
@@ -85,6 +103,9 @@ class SignUpTests(TestCase):
 
 
 class LoginTests(TestCase):
+    def setUp(self):
+        throttling.reset()
+
     def get_post_response(self, data=None):
         return self.client.post(reverse('login'), data=data or {'username': '', 'password': ''})
 
@@ -140,6 +161,9 @@ class LoginTests(TestCase):
 
 
 class LogoutTests(TestCase):
+    def setUp(self):
+        throttling.reset()
+
     def test_get_method_raises_value_error(self):
         try:
             self.client.get(reverse('logout'))
@@ -159,3 +183,155 @@ class LogoutTests(TestCase):
         response = self.client.post(reverse('logout'))
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response['Location'], '/')
+
+
+@override_settings(THROTTLE_RATES={'login': {'ip': '5/min', 'username': '2/min'}, 'signup': {'ip': '2/hour'}})
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        caches = copy.deepcopy(settings.CACHES)
+        caches['throttle']['LOCATION'] = os.path.join(self.directory, 'throttle')
+        cache_settings = override_settings(CACHES=caches,
+                                           THROTTLE_LOCK_FILE=os.path.join(self.directory, 'throttle.lock'))
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+        User.objects.create_user('test', password='test')
+
+    def login(self, username='test', password='wrong', address='127.0.0.1'):
+        return self.client.post(reverse('login'), {'username': username, 'password': password}, REMOTE_ADDR=address)
+
+    def signup(self, username):
+        return self.client.post(reverse('signup'), {'username': username, 'password1': 'pass', 'password2': 'pass'})
+
+    def test_attempts_over_the_username_limit_are_rejected(self):
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login().status_code, 200)
+
+        response = self.login(password='test')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.context[CONTEXT_INDEX]['error'], _('too_many_attempts'))
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertFalse(auth.get_user(self.client).is_authenticated)
+
+    def test_rejected_attempts_hash_nothing(self):
+        self.login()
+        self.login()
+        with mock.patch.object(PBKDF2PasswordHasher, 'encode', autospec=True,
+                               side_effect=PBKDF2PasswordHasher.encode) as encode:
+            self.login()
+            self.signup('another')
+            self.signup('third')
+            self.signup('fourth')
+        self.assertEqual(encode.call_count, 2)
+
+    def test_address_limit_applies_to_all_usernames(self):
+        for i in range(5):
+            self.assertEqual(self.login(username=f'user{i}').status_code, 200)
+        self.assertEqual(self.login(username='user5').status_code, 429)
+        self.assertEqual(self.login(username='user5', address='10.0.0.1').status_code, 200)
+
+    def test_tokens_are_refilled(self):
+        with mock.patch('accounts.throttling.time.time', return_value=1000):
+            self.login()
+            self.login()
+            self.assertEqual(self.login().status_code, 429)
+        with mock.patch('accounts.throttling.time.time', return_value=1030):
+            self.assertEqual(self.login().status_code, 200)
+            self.assertEqual(self.login().status_code, 429)
+
+    @override_settings(THROTTLE_CLIENT_IP_HEADER='HTTP_X_REAL_IP')
+    def test_address_is_read_from_the_proxy_header(self):
+        for i in range(5):
+            self.client.post(reverse('login'), {'username': f'user{i}', 'password': 'x'}, HTTP_X_REAL_IP='1.2.3.4')
+        response = self.client.post(reverse('login'), {'username': 'user5', 'password': 'x'}, HTTP_X_REAL_IP='1.2.3.4')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.login(username='user5').status_code, 200)
+
+    def test_rejections_are_counted(self):
+        for _ in range(3):
+            self.login()
+        for i in range(3):
+            self.signup(f'new{i}')
+        self.assertEqual(throttling.stats(), {'login': {'ip': 0, 'username': 1}, 'signup': {'ip': 1}})
+
+        out = StringIO()
+        call_command('throttle_stats', stdout=out)
+        self.assertIn('login: rejected by ip: 0, username: 1', out.getvalue())
+
+    def test_buckets_and_counters_are_shared_with_other_processes(self):
+        for _ in range(3):
+            self.login()
+        # What another process reads from the same files
+        other = FileBasedCache(settings.CACHES['throttle']['LOCATION'], {})
+        with mock.patch.object(throttling, 'get_cache', return_value=other):
+            self.assertEqual(throttling.stats()['login']['username'], 1)
+            self.assertEqual(self.login().status_code, 429)
+
+    def test_buckets_are_updated_under_a_file_lock(self):
+        with throttling._locked(), open(settings.THROTTLE_LOCK_FILE) as lock_file:
+            with self.assertRaises(BlockingIOError):
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_signup_of_an_existing_username_fails_without_a_second_user(self):
+        response = self.signup('test')
+        self.assertEqual(response.context[CONTEXT_INDEX]['error'], _('username_exists_error'))
+        self.assertEqual(User.objects.filter(username='test').count(), 1)
+
+    def test_signup_of_an_existing_username_does_not_hash_the_password(self):
+        with mock.patch('django.contrib.auth.base_user.make_password') as make_password:
+            response = self.signup('test')
+        self.assertEqual(response.context[CONTEXT_INDEX]['error'], _('username_exists_error'))
+        make_password.assert_not_called()
+
+    def test_signup_racing_past_the_username_check_fails(self):
+        with mock.patch('django.db.models.query.QuerySet.exists', return_value=False):
+            response = self.signup('test')
+        self.assertEqual(response.context[CONTEXT_INDEX]['error'], _('username_exists_error'))
+        self.assertEqual(User.objects.filter(username='test').count(), 1)
+
+
+class SessionCacheTests(TestCase):
+    def setUp(self):
+        # Entries left by other runs must not count as purged by this one
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        caches = copy.deepcopy(settings.CACHES)
+        caches['sessions']['LOCATION'] = self.directory
+        cache_settings = override_settings(CACHES=caches)
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+        throttling.reset()
+        self.client.post(reverse('signup'), {'username': 'test', 'password1': 'test', 'password2': 'test'})
+        self.user = User.objects.get(username='test')
+
+    def test_browsing_reads_neither_sessions_nor_users_from_the_database(self):
+        self.client.get(reverse('home'))
+        with record_queries() as recorder:
+            response = self.client.get(reverse('home'))
+        self.assertTrue(response.context['user'].is_authenticated)
+        self.assertFalse([sql for sql, _, _ in recorder.queries if 'django_session' in sql or 'auth_user' in sql])
+
+    def test_password_change_ends_other_sessions(self):
+        self.client.get(reverse('home'))
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertFalse(auth.get_user(self.client).is_authenticated)
+
+    def test_deactivated_user_is_logged_out(self):
+        self.client.get(reverse('home'))
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(auth.get_user(self.client).is_authenticated)
+
+    def test_logout_drops_the_cached_user(self):
+        self.client.get(reverse('home'))
+        self.client.post(reverse('logout'))
+        self.assertIsNone(backends.get_cache().get(f'auth-user:{self.user.pk}'))
+
+    def test_expired_entries_are_purged(self):
+        backends.get_cache().set('expired', 1, timeout=0)
+        out = StringIO()
+        call_command('purge_sessions', '--batch-size=1', stdout=out)
+        self.assertIn('Purged 1 expired entries', out.getvalue())
+        self.assertTrue(auth.get_user(self.client).is_authenticated)
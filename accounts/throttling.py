@@ -0,0 +1,131 @@
+"""Token bucket throttling of login and signup attempts.
+
+Every attempt takes a token from the bucket of the client's address and,
+for logins, from the bucket of the username it tries. Buckets hold up to N
+tokens and refill at N per period, as set by `THROTTLE_RATES`; an attempt
+finding an empty bucket is rejected before any password is hashed or the
+database is asked. Buckets live in the `throttle` cache, a file cache shared
+by the processes of the host. The cache has no atomic read-modify-write, so
+buckets are read and written while holding an exclusive lock on
+`THROTTLE_LOCK_FILE`: two processes cannot both take the last token.
+
+Rejected attempts are counted per endpoint and key, see `stats` and
+`manage.py throttle_stats`.
+"""
+import fcntl
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+
+CACHE_ALIAS = 'throttle'
+
+PERIODS = {'s': 1, 'sec': 1, 'min': 60, 'hour': 60 * 60, 'day': 24 * 60 * 60}
+
+# Serialises the threads of the process, the file lock the processes
+_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def parse_rate(rate):
+    """'5/min' -> (capacity 5, 5 / 60 tokens per second)."""
+    count, period = rate.split('/')
+    return int(count), int(count) / PERIODS[period]
+
+
+def client_ip(request):
+    header = getattr(settings, 'THROTTLE_CLIENT_IP_HEADER', None)
+    # A proxy in front of the application may append the addresses it saw
+    address = request.META.get(header) if header else None
+    return (address or request.META.get('REMOTE_ADDR') or '').split(',')[0].strip()
+
+
+def attempt(request, endpoint, username=None):
+    """Takes a token from every bucket of the attempt.
+
+    Returns 0 if the attempt is allowed, or the seconds until it would be.
+    Nothing is taken from any bucket when one of them is empty.
+    """
+    identities = {'ip': client_ip(request), 'username': username.lower() if username else None}
+    buckets = [(key, capacity, refill, _bucket_key(endpoint, key, identities[key]))
+               for key, rate in settings.THROTTLE_RATES.get(endpoint, {}).items()
+               if identities.get(key)
+               for capacity, refill in [parse_rate(rate)]]
+    if not buckets:
+        return 0
+
+    # Wall clock: buckets may be shared with other processes
+    now = time.time()
+    cache = get_cache()
+    with _locked():
+        states = cache.get_many([cache_key for _, _, _, cache_key in buckets])
+        tokens = {}
+        for key, capacity, refill, cache_key in buckets:
+            level, updated = states.get(cache_key, (capacity, now))
+            tokens[cache_key] = min(capacity, level + max(now - updated, 0) * refill)
+
+        empty = [(key, (1 - tokens[cache_key]) / refill)
+                 for key, _, refill, cache_key in buckets if tokens[cache_key] < 1]
+        if not empty:
+            # Full buckets expire: a missing bucket is a full one
+            for _, capacity, refill, cache_key in buckets:
+                cache.set(cache_key, (tokens[cache_key] - 1, now), timeout=int(capacity / refill) + 1)
+            return 0
+
+        for key, _ in empty:
+            _count_rejection(endpoint, key)
+    return max(wait for _, wait in empty)
+
+
+def stats():
+    """Rejected attempts per endpoint and key, e.g. {'login': {'ip': 3, 'username': 10}}."""
+    keys = {(endpoint, key): _stats_key(endpoint, key)
+            for endpoint, rates in settings.THROTTLE_RATES.items() for key in rates}
+    counters = get_cache().get_many(keys.values())
+    result = {}
+    for (endpoint, key), stats_key in keys.items():
+        result.setdefault(endpoint, {})[key] = counters.get(stats_key, 0)
+    return result
+
+
+def reset():
+    get_cache().clear()
+
+
+@contextmanager
+def _locked():
+    with _lock:
+        path = settings.THROTTLE_LOCK_FILE
+        if not path:
+            yield
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _bucket_key(endpoint, key, identity):
+    # Usernames of attempts are arbitrary text, unfit for cache keys
+    return f'throttle:{endpoint}:{key}:{hashlib.md5(identity.encode()).hexdigest()}'
+
+
+def _stats_key(endpoint, key):
+    return f'throttle-stats:{endpoint}:{key}'
+
+
+def _count_rejection(endpoint, key):
+    try:
+        get_cache().incr(_stats_key(endpoint, key))
+    except ValueError:
+        get_cache().set(_stats_key(endpoint, key), 1, timeout=None)
@@ -1,8 +1,13 @@
+import math
+
 from django.contrib import auth
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
 from django.shortcuts import render, redirect
 from django.utils.translation import gettext as _
 
+from accounts import throttling
+
 
 def signup(request):
     if request.method == 'POST':
@@ -15,13 +20,20 @@ def signup(request):
             return render(request, 'accounts/signup.html', {'error': _('password_empty_error')})
         if password1 != password2:
             return render(request, 'accounts/signup.html', {'error': _('passwords_not_equal_error')})
+        wait = throttling.attempt(request, 'signup', username)
+        if wait:
+            return _throttled(request, 'accounts/signup.html', wait)
+        if User.objects.filter(username=username).exists():
+            # Answered before the password is hashed, which is slow on purpose
+            return render(request, 'accounts/signup.html', {'error': _('username_exists_error')})
         try:
-            User.objects.get(username=username)
+            # The unique username still decides when two signups race past the check
+            with transaction.atomic():
+                user = User.objects.create_user(username, password=password1)
+        except IntegrityError:
             return render(request, 'accounts/signup.html', {'error': _('username_exists_error')})
-        except User.DoesNotExist:
-            user = User.objects.create_user(username, password=password1)
-            auth.login(request, user)
-            return redirect('home')
+        auth.login(request, user)
+        return redirect('home')
     else:
         return render(request, 'accounts/signup.html')
 
@@ -34,6 +46,9 @@ def login(request):
             return render(request, 'accounts/login.html', {'error': _('username_empty_error')})
         if not password:
             return render(request, 'accounts/login.html', {'error': _('password_empty_error')})
+        wait = throttling.attempt(request, 'login', username)
+        if wait:
+            return _throttled(request, 'accounts/login.html', wait)
         user = auth.authenticate(request, username=username, password=password)
         if user:
             auth.login(request, user)
@@ -48,3 +63,9 @@ def logout(request):
     if request.method == 'POST':
         auth.logout(request)
         return redirect('home')
+
+
+def _throttled(request, template_name, wait):
+    response = render(request, template_name, {'error': _('too_many_attempts')}, status=429)
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
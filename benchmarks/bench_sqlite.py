@@ -0,0 +1,140 @@
+"""Compares the default SQLite setup with the tuned production profile.
+
+    python benchmarks/bench_sqlite.py --users 100 --products 50 --threads 8 --requests 4000
+
+Threads replay a mix of home page reads, detail page reads and votes. The
+`baseline` profile uses SQLite's defaults (rollback journal, full fsync,
+a new connection per request, no retries), the `tuned` profile the
+settings of `producthuntclone.settings`. Each profile runs in its own
+process on its own database.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import Timer, seed_products, seed_users, setup_django  # noqa: E402
+
+PROFILES = ('baseline', 'tuned')
+
+
+def replay(operations, threads):
+    from django.contrib.auth.models import AnonymousUser
+    from django.db import OperationalError, close_old_connections, connection
+    from django.http import Http404
+    from django.test import RequestFactory
+
+    from products import views
+
+    factory = RequestFactory()
+    home = views.HomeView.as_view()
+    detail = views.ProductDetailView.as_view()
+
+    def render(response):
+        # Page cache hits are plain responses, already rendered
+        if hasattr(response, 'render'):
+            response.render()
+
+    def run(operation):
+        kind, user, product = operation
+        if kind == 'vote':
+            request = factory.post(f'/products/{product.pk}/upvote')
+            request.user = user
+            try:
+                views.upvote(request, product.pk)
+            except Http404:
+                pass
+        elif kind == 'home':
+            request = factory.get('/')
+            request.user = AnonymousUser()
+            render(home(request))
+        else:
+            request = factory.get(f'/products/{product.pk}')
+            request.user = user
+            render(detail(request, pk=product.pk))
+
+    def worker(chunk):
+        latencies, failed = [], 0
+        for operation in chunk:
+            with Timer() as timer:
+                try:
+                    run(operation)
+                except OperationalError:
+                    # "database is locked"
+                    failed += 1
+                finally:
+                    # What `request_finished` does: honours CONN_MAX_AGE
+                    close_old_connections()
+            latencies.append(timer.elapsed)
+        connection.close()
+        return latencies, failed
+
+    chunks = [operations[i::threads] for i in range(threads)]
+    with ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(worker, chunks))
+    return [latency for latencies, _ in results for latency in latencies], sum(failed for _, failed in results)
+
+
+def run_profile(args):
+    overrides = {}
+    if args.profile == 'baseline':
+        overrides = {'SQLITE_PRAGMAS': {}, 'SQLITE_LOCK_RETRIES': 1}
+    setup_django(args.db, **overrides)
+    from django.conf import settings
+    if args.profile == 'baseline':
+        settings.DATABASES['default']['CONN_MAX_AGE'] = 0
+
+    random.seed(args.seed)
+    hunter, = seed_users(1, prefix='hunter')
+    voters = seed_users(args.users)
+    products = seed_products(args.products, hunter)
+    operations = []
+    for _ in range(args.requests):
+        roll = random.random()
+        kind = 'vote' if roll < args.vote_ratio else 'home' if roll < (1 + args.vote_ratio) / 2 else 'detail'
+        operations.append((kind, random.choice(voters), random.choice(products)))
+
+    with Timer() as timer:
+        latencies, failed = replay(operations, args.threads)
+    latencies.sort()
+    print(json.dumps({
+        'profile': args.profile,
+        'throughput': len(operations) / timer.elapsed,
+        'p50': latencies[len(latencies) // 2] * 1000,
+        'p95': latencies[int(len(latencies) * 0.95)] * 1000,
+        'failed': failed,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--vote-ratio', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--profile', choices=PROFILES, help='Run a single profile and print its result as JSON')
+    parser.add_argument('--db', help='SQLite file to use instead of a temporary one')
+    args = parser.parse_args()
+
+    if args.profile:
+        run_profile(args)
+        return
+
+    for profile in PROFILES:
+        command = [sys.executable, __file__, '--profile', profile] + [
+            f'--{name.replace("_", "-")}={getattr(args, name)}'
+            for name in ('users', 'products', 'threads', 'requests', 'vote_ratio', 'seed')]
+        result = json.loads(subprocess.run(command, check=True, stdout=subprocess.PIPE).stdout.splitlines()[-1])
+        print(f'{profile:<10} {result["throughput"]:>8.1f} req/s  p50 {result["p50"]:6.1f} ms  '
+              f'p95 {result["p95"]:6.1f} ms  failed {result["failed"]}')
+
+
+if __name__ == '__main__':
+    main()
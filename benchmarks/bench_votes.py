@@ -0,0 +1,94 @@
+"""Compares votes per second of the direct and the buffered `upvote` paths.
+
+    python benchmarks/bench_votes.py --users 200 --products 10 --threads 8
+
+Each user votes once on every product. The direct path writes every vote
+to the database inside the request, the buffered path only journals it;
+for the latter both the request rate and the rate including the final
+flush are reported.
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import Timer, seed_products, seed_users, setup_django  # noqa: E402
+
+
+def cast_votes(pairs, threads):
+    from django.db import OperationalError, connection
+    from django.http import Http404
+    from django.test import RequestFactory
+
+    from products import views
+
+    factory = RequestFactory()
+
+    def worker(chunk):
+        accepted = rejected = failed = 0
+        for user, product in chunk:
+            request = factory.post(f'/products/{product.pk}/upvote')
+            request.user = user
+            try:
+                views.upvote(request, product.pk)
+                accepted += 1
+            except Http404:
+                rejected += 1
+            except OperationalError:
+                # "database is locked"
+                failed += 1
+        connection.close()
+        return accepted, rejected, failed
+
+    chunks = [pairs[i::threads] for i in range(threads)]
+    with ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(worker, chunks))
+    return tuple(sum(column) for column in zip(*results))
+
+
+def report(name, votes, elapsed, counts):
+    accepted, rejected, failed = counts
+    print(f'{name:<24} {votes / elapsed:>10.1f} votes/s  '
+          f'(accepted {accepted}, rejected {rejected}, failed {failed}, {elapsed:.2f}s)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--products', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--db', help='SQLite file to use instead of a temporary one')
+    args = parser.parse_args()
+
+    work_dir = setup_django(args.db, VOTE_BUFFER_FLUSH_INTERVAL=0)
+    from django.conf import settings
+    from django.test.utils import override_settings
+
+    from products import vote_buffer
+
+    settings.VOTE_BUFFER_JOURNAL = os.path.join(work_dir, 'journal.sqlite3')
+
+    hunter, = seed_users(1, prefix='hunter')
+    voters = seed_users(args.users)
+    direct_products = seed_products(args.products, hunter)
+    buffered_products = seed_products(args.products, hunter)
+
+    pairs = [(user, product) for user in voters for product in direct_products]
+    with Timer() as timer:
+        counts = cast_votes(pairs, args.threads)
+    report('direct', len(pairs), timer.elapsed, counts)
+
+    pairs = [(user, product) for user in voters for product in buffered_products]
+    with override_settings(VOTE_BUFFER_ENABLED=True):
+        with Timer() as timer:
+            counts = cast_votes(pairs, args.threads)
+        report('buffered (requests)', len(pairs), timer.elapsed, counts)
+        with Timer() as flush_timer:
+            vote_buffer.get_buffer().flush()
+    report('buffered (with flush)', len(pairs), timer.elapsed + flush_timer.elapsed, counts)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Shared setup for the benchmark scripts.
+
+Benchmarks never touch the project database: every run works on a fresh
+SQLite file in a temporary directory (or in the given `--db` path).
+"""
+import os
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(db_path=None, **overrides):
+    """Configures Django against a throwaway database and creates the schema."""
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'producthuntclone.settings')
+
+    import django
+    from django.conf import settings
+
+    work_dir = tempfile.mkdtemp(prefix='mnprojects-bench-')
+    settings.DATABASES['default']['NAME'] = db_path or os.path.join(work_dir, 'bench.sqlite3')
+    settings.MEDIA_ROOT = os.path.join(work_dir, 'media')
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    return work_dir
+
+
+def seed_users(count, prefix='user'):
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+
+    # Hashing once keeps seeding fast, every user gets the same password
+    password = make_password(prefix)
+    last_pk = User.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    User.objects.bulk_create([User(username=f'{prefix}{i}', password=password) for i in range(count)],
+                             batch_size=500)
+    return list(User.objects.filter(pk__gt=last_pk).order_by('pk'))
+
+
+def seed_products(count, hunter):
+    from django.utils import timezone
+
+    from products.models import Product
+
+    now = timezone.now()
+    last_pk = Product.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    Product.objects.bulk_create([Product(title_en=f'Project {i}', body_en=f'Description of project {i}',
+                                         url='http://example.com', icon='images/icon.png',
+                                         image='images/image.png', pub_date=now, hunter=hunter)
+                                 for i in range(count)], batch_size=500)
+    return list(Product.objects.filter(pk__gt=last_pk).order_by('pk'))
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.start
@@ -0,0 +1,293 @@
+"""End-to-end latency and throughput of the products and accounts flows.
+
+    python benchmarks/run.py --users 500 --products 200 --votes 5000 \\
+        --requests 300 --concurrency 8 --output results.json
+    git checkout other-branch && python benchmarks/run.py --compare results.json
+
+After seeding users, products and votes in bulk, every endpoint is driven
+through `producthuntclone.wsgi.application` with raw WSGI environs from a
+pool of threads, so the whole middleware stack, sessions and CSRF checks
+are included. Latency percentiles, throughput, status codes and SQL
+queries per request are reported for every endpoint; `--output` writes
+them as JSON and `--compare` prints the change against an earlier run.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import string
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import BASE_DIR, Timer, seed_products, seed_users, setup_django  # noqa: E402
+
+ENDPOINTS = ('home', 'detail', 'upvote', 'create', 'signup', 'login')
+PASSWORD = 'user'
+
+_local = threading.local()
+
+
+class Client:
+    """Calls the WSGI application the way a server would."""
+
+    def __init__(self, application, host):
+        self.application = application
+        self.host = host
+        # Any 64 characters form a valid masked token; cookie and header must match
+        self.csrf_token = ''.join(random.choices(string.ascii_letters + string.digits, k=64))
+
+    def request(self, method, path, query='', body=b'', content_type='', session_key=None):
+        cookies = f'csrftoken={self.csrf_token}'
+        if session_key:
+            cookies += f'; sessionid={session_key}'
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': self.host,
+            # Many clients: one address would soon be throttled on login and signup
+            'REMOTE_ADDR': f'10.{random.randrange(256)}.{random.randrange(256)}.{random.randrange(1, 255)}',
+            'HTTP_COOKIE': cookies,
+            'HTTP_X_CSRFTOKEN': self.csrf_token,
+            'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.url_scheme': 'http',
+            'wsgi.version': (1, 0),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        status = []
+        result = self.application(environ, lambda status_line, headers, exc_info=None: status.append(status_line))
+        try:
+            for _ in result:
+                pass
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return int(status[0].split()[0])
+
+    def post(self, path, data, session_key=None, files=None):
+        from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+        body = encode_multipart(BOUNDARY, dict(data, **(files or {})))
+        return self.request('POST', path, body=body, content_type=MULTIPART_CONTENT,
+                            session_key=session_key)
+
+
+class Scenario:
+    """Builds the requests of every endpoint from the seeded data."""
+
+    def __init__(self, client, users, products, sessions, image):
+        self.client = client
+        self.users = users
+        self.products = products
+        self.sessions = sessions
+        self.image = image
+        self.pages = max(1, len(products) // 5)
+        self._counter = iter(range(10 ** 9))
+        self._lock = threading.Lock()
+
+    def _unique(self):
+        with self._lock:
+            return next(self._counter)
+
+    def home(self):
+        page = random.randint(1, min(self.pages, 20))
+        return self.client.request('GET', '/', query=f'page={page}' if page > 1 else '')
+
+    def detail(self):
+        product = random.choice(self.products)
+        # Half of the visitors are logged in
+        session_key = random.choice(self.sessions) if random.random() < 0.5 else None
+        return self.client.request('GET', f'/products/{product.pk}', session_key=session_key)
+
+    def upvote(self):
+        product = random.choice(self.products)
+        return self.client.post(f'/products/{product.pk}/upvote', {}, session_key=random.choice(self.sessions))
+
+    def create(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        number = self._unique()
+        files = {name: SimpleUploadedFile(f'{name}.png', self.image, 'image/png') for name in ('icon', 'image')}
+        return self.client.post('/products/create', {
+            'title': f'Benchmark project {number}', 'title-ru': '', 'url': 'example.com',
+            'body': f'Created by the benchmark ({number})', 'body-ru': '',
+        }, session_key=random.choice(self.sessions), files=files)
+
+    def signup(self):
+        username = f'signup-{os.getpid()}-{self._unique()}'
+        return self.client.post('/accounts/signup/', {
+            'username': username, 'password1': PASSWORD, 'password2': PASSWORD})
+
+    def login(self):
+        return self.client.post('/accounts/login/', {
+            'username': random.choice(self.users).username, 'password': PASSWORD})
+
+
+def seed(args):
+    from django.db.models import Count
+
+    from products.models import Product, ProductVote
+
+    hunters = seed_users(max(1, args.users // 10), prefix='hunter')
+    users = seed_users(args.users, prefix='user')
+    products = []
+    for index, hunter in enumerate(hunters):
+        products += seed_products(args.products // len(hunters) + (index < args.products % len(hunters)), hunter)
+
+    pairs = set()
+    votes = min(args.votes, len(users) * len(products))
+    while len(pairs) < votes:
+        pairs.add((random.choice(users).pk, random.choice(products).pk))
+    ProductVote.objects.bulk_create([ProductVote(user_id=user_id, product_id=product_id)
+                                     for user_id, product_id in pairs], batch_size=500)
+    for product in Product.objects.annotate(counted=Count('productvote')):
+        Product.objects.filter(pk=product.pk).update(votes_total=product.counted + 1)
+    return users, list(Product.objects.order_by('pk'))
+
+
+def create_sessions(users, count):
+    from django.conf import settings
+    from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+    from django.utils.module_loading import import_string
+
+    store = import_string(settings.SESSION_ENGINE + '.SessionStore')
+    keys = []
+    for user in random.sample(users, min(count, len(users))):
+        session = store()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        keys.append(session.session_key)
+    return keys
+
+
+def png(size=(640, 480)):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (218, 85, 47)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def measure(scenario, endpoint, requests, concurrency):
+    from django.db import connection
+
+    def count_queries(execute, sql, params, many, context):
+        _local.queries += 1
+        return execute(sql, params, many, context)
+
+    def call(_):
+        _local.queries = 0
+        with connection.execute_wrapper(count_queries):
+            with Timer() as timer:
+                status = getattr(scenario, endpoint)()
+        return timer.elapsed, status, _local.queries
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        with Timer() as timer:
+            results = list(executor.map(call, range(requests)))
+
+    latencies = sorted(latency for latency, _, _ in results)
+    queries = [count for _, _, count in results]
+    return {
+        'requests': requests,
+        'throughput': requests / timer.elapsed,
+        'p50': _percentile(latencies, 50) * 1000,
+        'p95': _percentile(latencies, 95) * 1000,
+        'p99': _percentile(latencies, 99) * 1000,
+        'queries': sum(queries) / len(queries),
+        'max_queries': max(queries),
+        'statuses': dict(Counter(str(status) for _, status, _ in results)),
+    }
+
+
+def compare(results, previous):
+    print(f'\n{"endpoint":<10} {"p95 before":>12} {"p95 after":>12} {"change":>8} {"req/s change":>14}')
+    for endpoint, after in results['endpoints'].items():
+        before = previous['endpoints'].get(endpoint)
+        if before:
+            print(f'{endpoint:<10} {before["p95"]:>10.1f}ms {after["p95"]:>10.1f}ms '
+                  f'{_change(before["p95"], after["p95"]):>8} '
+                  f'{_change(before["throughput"], after["throughput"]):>14}')
+
+
+def _percentile(values, percent):
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def _change(before, after):
+    return f'{(after - before) / before * 100:+.1f}%' if before else 'n/a'
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, check=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--votes', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--sessions', type=int, default=50, help='Logged in visitors')
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--db', help='SQLite file to use instead of a temporary one')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    setup_django(args.db)
+    from django.conf import settings
+
+    with Timer() as seed_timer:
+        users, products = seed(args)
+        sessions = create_sessions(users, args.sessions)
+    print(f'Seeded {len(users)} users, {len(products)} products in {seed_timer.elapsed:.1f}s')
+
+    # Imported after seeding: the in-memory leaderboard is built from the seeded data
+    from producthuntclone.wsgi import application
+    scenario = Scenario(Client(application, settings.ALLOWED_HOSTS[0]), users, products, sessions, png())
+
+    results = {
+        'commit': _commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'parameters': {name: value for name, value in vars(args).items() if name not in ('output', 'compare')},
+        'endpoints': {},
+    }
+    print(f'{"endpoint":<10} {"req/s":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"queries":>8}  statuses')
+    for endpoint in args.endpoints:
+        result = measure(scenario, endpoint, args.requests, args.concurrency)
+        results['endpoints'][endpoint] = result
+        print(f'{endpoint:<10} {result["throughput"]:>8.1f} {result["p50"]:>6.1f}ms {result["p95"]:>6.1f}ms '
+              f'{result["p99"]:>6.1f}ms {result["queries"]:>8.1f}  {result["statuses"]}')
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
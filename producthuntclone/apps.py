@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class ProducthuntcloneConfig(AppConfig):
+    name = 'producthuntclone'
+
+    def ready(self):
+        from producthuntclone.sqlite import configure_connection
+        connection_created.connect(configure_connection)
@@ -0,0 +1,171 @@
+"""WSGI middleware that serves STATIC_ROOT and MEDIA_ROOT in front of Django.
+
+Files are handed to the server's `wsgi.file_wrapper`, which servers such as
+gunicorn and uWSGI implement with `sendfile()`, so the bytes never pass
+through Python. Conditional requests (ETag / Last-Modified), single byte
+ranges and precompressed `.br` / `.gz` variants built by `collectstatic`
+are supported.
+"""
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.utils.http import http_date, parse_http_date_safe
+
+from products.storage import is_content_addressed
+
+BLOCK_SIZE = 64 * 1024
+
+_HASHED_STATIC_NAME = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Preferred first
+_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class FileServer:
+    def __init__(self, application):
+        self.application = application
+        self.mounts = [
+            (settings.STATIC_URL, settings.STATIC_ROOT, True),
+            (settings.MEDIA_URL, settings.MEDIA_ROOT, False),
+        ]
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        for url, root, is_static in self.mounts:
+            if url and root and path.startswith(url):
+                return self.serve(environ, start_response, root, path[len(url):], is_static)
+        return self.application(environ, start_response)
+
+    def serve(self, environ, start_response, root, name, is_static):
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return _respond(start_response, '405 Method Not Allowed', [('Allow', 'GET, HEAD')])
+
+        # WSGI passes the path as latin-1 decoded bytes
+        name = name.encode('latin-1').decode('utf-8', 'replace')
+        path = _safe_join(root, name)
+        stat_result = _stat_file(path)
+        if stat_result is None:
+            return _respond(start_response, '404 Not Found')
+
+        content_type, _ = mimetypes.guess_type(path)
+        headers = [
+            ('Content-Type', content_type or 'application/octet-stream'),
+            ('Last-Modified', http_date(stat_result.st_mtime)),
+            ('Cache-Control', _cache_control(name, is_static)),
+            ('Accept-Ranges', 'bytes'),
+        ]
+
+        encoding = None
+        if is_static:
+            headers.append(('Vary', 'Accept-Encoding'))
+            if 'HTTP_RANGE' not in environ:
+                encoding, path, stat_result = _precompressed(environ, path, stat_result)
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+        etag = f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}{"-" + encoding if encoding else ""}"'
+        headers.append(('ETag', etag))
+
+        if _not_modified(environ, etag, stat_result.st_mtime):
+            return _respond(start_response, '304 Not Modified', [h for h in headers if h[0] != 'Content-Type'])
+
+        size = stat_result.st_size
+        byte_range = _byte_range(environ, etag, stat_result.st_mtime, size)
+        if byte_range == ():
+            return _respond(start_response, '416 Range Not Satisfiable', [('Content-Range', f'bytes */{size}')])
+
+        file = open(path, 'rb')
+        if byte_range:
+            start, end = byte_range
+            headers += [('Content-Range', f'bytes {start}-{end}/{size}'), ('Content-Length', str(end - start + 1))]
+            start_response('206 Partial Content', headers)
+            if environ['REQUEST_METHOD'] == 'HEAD':
+                file.close()
+                return []
+            return _read_range(file, start, end - start + 1)
+
+        headers.append(('Content-Length', str(size)))
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            file.close()
+            return []
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        return file_wrapper(file, BLOCK_SIZE) if file_wrapper else _read_range(file, 0, size)
+
+
+def _respond(start_response, status, headers=()):
+    start_response(status, list(headers) + [('Content-Length', '0')])
+    return []
+
+
+def _safe_join(root, name):
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, name.lstrip('/')))
+    return path if path.startswith(root + os.sep) else None
+
+
+def _stat_file(path):
+    if path is None:
+        return None
+    try:
+        stat_result = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    return stat_result if stat.S_ISREG(stat_result.st_mode) else None
+
+
+def _cache_control(name, is_static):
+    if is_static:
+        return settings.STATIC_CACHE_CONTROL if _HASHED_STATIC_NAME.search(name) else 'no-cache'
+    return settings.MEDIA_CACHE_CONTROL if is_content_addressed(name) else 'no-cache'
+
+
+def _precompressed(environ, path, stat_result):
+    accepted = {value.split(';')[0].strip() for value in environ.get('HTTP_ACCEPT_ENCODING', '').split(',')}
+    for encoding, suffix in _ENCODINGS:
+        if encoding in accepted:
+            variant = _stat_file(path + suffix)
+            if variant is not None:
+                return encoding, path + suffix, variant
+    return None, path, stat_result
+
+
+def _not_modified(environ, etag, mtime):
+    if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+    if_modified_since = parse_http_date_safe(environ.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+def _byte_range(environ, etag, mtime, size):
+    """Returns `(start, end)`, `None` to send the whole file or `()` if unsatisfiable."""
+    match = _RANGE.match(environ.get('HTTP_RANGE', '').replace(' ', ''))
+    if not match or not any(match.groups()):
+        # Missing, malformed or multiple ranges: the whole file is a valid answer
+        return None
+    if_range = environ.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != int(mtime):
+        return None
+
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return ()
+    return start, end
+
+
+def _read_range(file, start, length):
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(BLOCK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
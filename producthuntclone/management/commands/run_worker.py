@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from producthuntclone import tasks
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background tasks until interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.TASK_WORKERS,
+                            help='Number of tasks run at the same time, each in its own thread')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no task is due instead of waiting for more')
+
+    def handle(self, *args, **options):
+        try:
+            processed = tasks.run(options['workers'], once=options['once'])
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(self.style.SUCCESS(f'Ran {processed} tasks'))
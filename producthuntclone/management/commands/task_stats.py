@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from producthuntclone import tasks
+
+
+class Command(BaseCommand):
+    help = 'Shows the depth of the background task queue and the latency of the tasks'
+
+    def handle(self, *args, **options):
+        stats = tasks.stats()
+        self.stdout.write(f"due: {stats['pending']}, scheduled: {stats['scheduled']}, running: {stats['running']}, "
+                          f"done: {stats['done']}, failed: {stats['failed']}")
+        self.stdout.write(f"oldest due: {stats['oldest_pending']:.1f}s, average wait: {stats['wait']:.3f}s, "
+                          f"average run: {stats['run']:.3f}s")
@@ -0,0 +1,39 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Task(models.Model):
+    """A call of a background function, queued in the database, see `producthuntclone.tasks`."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    # Dotted path of the function
+    name = models.CharField(max_length=200)
+    # JSON list of the arguments
+    args = models.TextField(default='[]')
+    # Tasks with the key of a task still kept are not queued again
+    key = models.CharField(max_length=200, null=True, unique=True)
+    state = models.CharField(max_length=7, choices=STATES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    created = models.DateTimeField(default=timezone.now)
+    # Not claimed before, retries are pushed back
+    run_at = models.DateTimeField(default=timezone.now)
+    # Set when a worker claims the task, which may be taken over once `claimed_until` passed
+    claimed_by = models.CharField(max_length=32, blank=True)
+    claimed_until = models.DateTimeField(null=True)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+    # Traceback of the last failed attempt
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers look for due tasks
+            models.Index(fields=['state', 'run_at'], name='task_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.state})'
@@ -0,0 +1,81 @@
+"""Per-request SQL instrumentation.
+
+`QueryMiddleware` records every query a view runs and reports the count,
+the repeated queries and the time spent in the database in a
+`Server-Timing` header and in the `producthuntclone.queries` log. Tests
+use `record_queries` through `test_utils.query_budget`.
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder:
+    """Execute wrapper that remembers the queries run through it."""
+
+    def __init__(self):
+        self.queries = []
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.duration += elapsed
+            self.queries.append((sql, params, elapsed))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def duplicates(self):
+        """Queries run more than once with the same parameters, with their count."""
+        counts = Counter((sql, repr(params)) for sql, params, _ in self.queries)
+        return {sql: count for (sql, _), count in counts.items() if count > 1}
+
+    def similar(self):
+        """Statements run more than once with any parameters: the shape of an N+1."""
+        counts = Counter(sql for sql, _, _ in self.queries)
+        return {sql: count for sql, count in counts.items() if count > 1}
+
+
+@contextmanager
+def record_queries():
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+class QueryMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_INSTRUMENTATION:
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        duplicates = sum(count - 1 for count in recorder.duplicates().values())
+        response['Server-Timing'] = (
+            f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries, {duplicates} duplicates", '
+            f'app;dur={total * 1000:.1f}')
+
+        view = request.resolver_match.view_name if request.resolver_match else request.path
+        level = logging.WARNING if recorder.count > settings.QUERY_COUNT_WARNING or duplicates else logging.DEBUG
+        logger.log(level, '%s %s: %d queries (%d duplicates) in %.1f ms, %.1f ms total',
+                   request.method, view, recorder.count, duplicates, recorder.duration * 1000, total * 1000)
+        return response
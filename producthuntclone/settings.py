@@ -39,13 +39,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'producthuntclone',
+    'producthuntclone.apps.ProducthuntcloneConfig',
     'products.apps.ProductsConfig',
     'accounts.apps.AccountsConfig',
     'django_translation_flags',
 ]
 
 MIDDLEWARE = [
+    'producthuntclone.queries.QueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -58,6 +59,11 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'producthuntclone.urls'
 
+# Query count and time of every request in the Server-Timing header and the log
+QUERY_INSTRUMENTATION = True
+# Requests running more queries (or any query twice) are logged as warnings
+QUERY_COUNT_WARNING = 10
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -84,9 +90,116 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Seconds a connection is reused between requests
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# Applied to every new SQLite connection, see `producthuntclone.sqlite`
+SQLITE_PRAGMAS = {
+    # Readers do not block the writer and vice versa
+    'journal_mode': 'WAL',
+    # In WAL mode only a power loss may lose the last transactions, never corrupt the database
+    'synchronous': 'NORMAL',
+    # Milliseconds to wait for the write lock before "database is locked"
+    'busy_timeout': 20000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative values are KiB
+    'cache_size': -16000,
+    'temp_store': 'MEMORY',
+}
+
+# Attempts and first delay (seconds) of writes retried on "database is locked"
+SQLITE_LOCK_RETRIES = 5
+SQLITE_LOCK_BACKOFF = 0.05
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# `django.core.cache.backends.filebased.FileBasedCache` shares the entries
+# between the worker processes of one host
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered fragments of product templates, see `products.fragments`
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # Rendered home and detail pages, see `products.page_cache`. Keys carry the
+    # version of the page, so every process may keep its own copy
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pages',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 2000,
+        },
+    },
+    # Sessions and their users, see `accounts.backends`; files are shared
+    # by the worker processes of the host
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'sessions'),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            # Reaching it would drop random sessions: `manage.py purge_sessions`
+            # deletes the expired ones instead
+            'MAX_ENTRIES': 1000000,
+        },
+    },
+    # Token buckets of login and signup attempts and their rejection counters,
+    # see `accounts.throttling`; files are shared by the worker processes of the host
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'throttle'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+    # Versions of the product listings, see `products.versions`; files are
+    # shared by the worker processes of the host
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'versions'),
+        'TIMEOUT': None,
+    },
+    # Products users have voted on, see `products.vote_state`; files are shared
+    # by the worker processes of the host
+    'vote_states': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'vote_states'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+
+# Attempts per period allowed for every key of an endpoint, see `accounts.throttling`.
+# A burst of that many attempts is allowed, then they are spread over the period.
+THROTTLE_RATES = {
+    'login': {'ip': '30/min', 'username': '10/min'},
+    'signup': {'ip': '10/hour'},
+}
+
+# `request.META` key of the client address set by a reverse proxy, e.g.
+# 'HTTP_X_REAL_IP'; REMOTE_ADDR is used if None
+THROTTLE_CLIENT_IP_HEADER = None
+
+# Held while buckets are updated, so processes sharing the `throttle` cache take tokens one at a time.
+# None only serialises the threads of each process.
+THROTTLE_LOCK_FILE = os.path.join(BASE_DIR, 'cache', 'throttle.lock')
+
+
+# Moves the file-based caches to a temporary directory while the tests run
+TEST_RUNNER = 'producthuntclone.test_runner.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -106,6 +219,16 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Sessions and the users they belong to are read from the `sessions` cache,
+# browsing runs no session or user query
+SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
+SESSION_CACHE_ALIAS = 'sessions'
+
+AUTHENTICATION_BACKENDS = ['accounts.backends.CachedModelBackend']
+
+# Seconds a user stays cached; changes made through the ORM drop it earlier
+USER_CACHE_TIMEOUT = 60 * 60
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/2.2/topics/i18n/
@@ -142,5 +265,97 @@ STATICFILES_DIRS = [
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 STATIC_URL = '/static/'
 
+STATICFILES_STORAGE = 'producthuntclone.staticfiles.CompressedManifestStaticFilesStorage'
+
+# Applied to static files with a content hash in their name
+STATIC_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Serve STATIC_ROOT and MEDIA_ROOT from the WSGI application, see `producthuntclone.fileserver`
+WSGI_FILE_SERVER = True
+
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
+
+# Uploads are stored under the hash of their content and never change
+DEFAULT_FILE_STORAGE = 'products.storage.ContentAddressedStorage'
+
+# Limits of uploaded product images, enforced while the request is read, see `products.uploads`
+UPLOAD_MAX_FILE_SIZE = 5 * 1024 * 1024
+# Both images and the text fields
+UPLOAD_MAX_REQUEST_SIZE = 2 * UPLOAD_MAX_FILE_SIZE + 1024 * 1024
+UPLOAD_IMAGE_FORMATS = ('PNG', 'JPEG', 'GIF', 'WEBP')
+# Width times height; larger images are rejected from their header as decompression bombs
+UPLOAD_MAX_IMAGE_PIXELS = 40 * 1000 * 1000
+
+MEDIA_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Seconds an unreferenced file is kept, it may belong to a product being created
+MEDIA_ORPHAN_GRACE_PERIOD = 60 * 60
+
+# Widths of the derivatives generated from uploaded images, icons are square
+PRODUCT_ICON_WIDTHS = (64, 128, 256)
+PRODUCT_IMAGE_WIDTHS = (480, 960, 1440)
+
+
+# Background tasks
+# Queued in the database and run by `manage.py run_worker`, see `producthuntclone.tasks`
+
+# Tasks run at the same time by a worker, each in its own thread
+TASK_WORKERS = 2
+
+# Seconds an idle worker waits before looking for due tasks again
+TASK_POLL_INTERVAL = 1
+
+TASK_MAX_ATTEMPTS = 5
+
+# Seconds before the first retry of a failed task, doubled for every further attempt
+TASK_RETRY_DELAY = 10
+
+# Seconds a task may run before other workers take it over, its worker is assumed dead
+TASK_LEASE = 10 * 60
+
+# Seconds finished and failed tasks are kept, along with their idempotency keys
+TASK_RETENTION = 7 * 24 * 60 * 60
+
+
+# Buffered voting
+# Votes are journaled to a separate SQLite file and applied to the database in batches
+
+VOTE_BUFFER_ENABLED = False
+
+VOTE_BUFFER_JOURNAL = os.path.join(BASE_DIR, 'votes_journal.sqlite3')
+
+VOTE_BUFFER_BATCH_SIZE = 500
+
+# Seconds between in-process flushes, 0 leaves flushing to `manage.py flush_votes`
+VOTE_BUFFER_FLUSH_INTERVAL = 2
+
+# Seconds the vote states of a user stay in the 'vote_states' cache.
+# Votes drop the states of the voter in every process.
+VOTED_SET_CACHE_TIMEOUT = 300
+
+# Products whose vote state is cached per user, a few pages worth
+VOTED_STATES_CACHE_SIZE = 200
+
+
+# In-memory home page ranking, built when the WSGI application starts
+
+LEADERBOARD_ENABLED = True
+
+# Seconds between comparisons of the ranking with the database, made by a
+# background thread of every process
+LEADERBOARD_VERIFY_INTERVAL = 60
+
+
+# "Hot" ranking, see `products.hot`
+
+# How fast the score of a product decays with its age
+HOT_SCORE_GRAVITY = 1.8
+
+# Seconds between runs of `manage.py refresh_hot_scores`; browsers revalidate
+# hot pages they cached in an earlier interval
+HOT_SCORE_REFRESH_INTERVAL = 10 * 60
+
+
+# Hours the hourly vote counts are kept, see `products.rollups`
+VOTE_ROLLUP_HOURS = 7 * 24
@@ -0,0 +1,51 @@
+"""SQLite tuning for production.
+
+Every new connection gets `settings.SQLITE_PRAGMAS` (WAL journal, relaxed
+fsync, larger page cache, mmap, busy timeout), connections are kept open
+between requests with `CONN_MAX_AGE` and short write transactions are
+retried with a bounded exponential backoff when the database is locked.
+"""
+import logging
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_locked_error(error):
+    return isinstance(error, OperationalError) and 'locked' in str(error)
+
+
+def retry_on_locked(func):
+    """Retries `func` while SQLite reports that the database is locked.
+
+    `func` must be safe to run again, i.e. do its writes in its own
+    transaction. Inside an outer transaction nothing is retried: the
+    transaction is already broken.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        delay = settings.SQLITE_LOCK_BACKOFF
+        for attempt in range(1, settings.SQLITE_LOCK_RETRIES + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as error:
+                if (not is_locked_error(error) or attempt == settings.SQLITE_LOCK_RETRIES
+                        or transaction.get_connection().in_atomic_block):
+                    raise
+                logger.info('Database is locked, retrying %s (attempt %d)', func.__name__, attempt)
+                time.sleep(delay * random.uniform(0.5, 1.5))
+                delay *= 2
+    return wrapper
@@ -0,0 +1,47 @@
+// Suggests product titles while typing into search inputs.
+//
+// Inputs with `data-suggest-url` fill the <datalist> they are linked to;
+// requests wait for a short pause in typing and late answers to older
+// input are dropped.
+(function () {
+    'use strict';
+
+    var DELAY = 150;
+
+    function attach(input) {
+        var list = document.getElementById(input.getAttribute('list'));
+        var timer = null;
+        var latest = 0;
+
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            var query = input.value.trim();
+            if (query.length < 2 || !window.fetch) {
+                return;
+            }
+            timer = setTimeout(function () {
+                var request = ++latest;
+                fetch(input.getAttribute('data-suggest-url') + '?q=' + encodeURIComponent(query), {
+                    credentials: 'same-origin',
+                    headers: {'Accept': 'application/json'}
+                }).then(function (response) {
+                    return response.json();
+                }).then(function (answer) {
+                    if (request !== latest) {
+                        return;
+                    }
+                    list.innerHTML = '';
+                    answer.suggestions.forEach(function (suggestion) {
+                        var option = document.createElement('option');
+                        option.value = suggestion.title;
+                        list.appendChild(option);
+                    });
+                }).catch(function () {
+                    // Suggestions are optional
+                });
+            }, DELAY);
+        });
+    }
+
+    document.querySelectorAll('input[data-suggest-url]').forEach(attach);
+})();
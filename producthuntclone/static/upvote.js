@@ -0,0 +1,85 @@
+// Casts votes without leaving the page.
+//
+// Upvote forms carry the URL of the JSON endpoint in `data-upvote-url`;
+// without JavaScript they are posted as usual. Elements of the product
+// with `data-votes-total`, `data-votes-label` and `data-vote-message`
+// are updated from the answer.
+(function () {
+    'use strict';
+
+    function update(form, answer) {
+        document.querySelectorAll('[data-product="' + answer.product + '"]').forEach(function (element) {
+            element.querySelectorAll('[data-votes-total]').forEach(function (node) {
+                node.textContent = answer.votes_total;
+            });
+            element.querySelectorAll('[data-votes-label]').forEach(function (node) {
+                node.innerHTML = answer.votes_label;
+            });
+            element.querySelectorAll('[data-vote-message]').forEach(function (node) {
+                node.textContent = answer.message;
+                node.hidden = false;
+            });
+            element.querySelectorAll('[data-upvote-button]').forEach(function (node) {
+                node.classList.add('disabled');
+                node.setAttribute('aria-disabled', 'true');
+            });
+        });
+
+        var badge = form.getAttribute('data-' + answer.state + '-label');
+        if (badge) {
+            var span = document.createElement('span');
+            span.className = 'badge ' + (answer.state === 'yours' ? 'badge-secondary' : 'badge-success');
+            span.textContent = badge;
+            form.parentNode.replaceChild(span, form);
+        }
+    }
+
+    function vote(form) {
+        if (form.dataset.pending) {
+            return;
+        }
+        form.dataset.pending = 'true';
+        fetch(form.getAttribute('data-upvote-url'), {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {
+                'Accept': 'application/json',
+                'X-CSRFToken': form.querySelector('[name=csrfmiddlewaretoken]').value
+            }
+        }).then(function (response) {
+            if (response.status === 401) {
+                // Session expired: the form post leads to the login page
+                form.submit();
+                return null;
+            }
+            // 403 (own product) and 409 (already voted) carry the state too
+            return response.status === 404 ? null : response.json();
+        }).then(function (answer) {
+            if (answer && answer.state) {
+                update(form, answer);
+            }
+        }).catch(function () {
+            form.submit();
+        }).then(function () {
+            delete form.dataset.pending;
+        });
+    }
+
+    document.addEventListener('submit', function (event) {
+        var form = event.target;
+        if (form.hasAttribute('data-upvote-url') && window.fetch) {
+            event.preventDefault();
+            vote(form);
+        }
+    });
+
+    document.addEventListener('click', function (event) {
+        var link = event.target.closest && event.target.closest('[data-upvote-form]');
+        if (link && window.fetch) {
+            event.preventDefault();
+            if (!link.classList.contains('disabled')) {
+                vote(document.getElementById(link.getAttribute('data-upvote-form')));
+            }
+        }
+    });
+})();
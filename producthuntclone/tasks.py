@@ -0,0 +1,220 @@
+"""Background tasks queued in the database.
+
+Slow follow-up work of a request is queued as a `Task` row once the
+transaction commits and run later by `manage.py run_worker`, so it adds
+nothing to the latency of the request and survives restarts; no broker is
+needed. Functions are registered with `@task` and queued with `enqueue`:
+
+    @tasks.task
+    def generate_derivatives(pk, field, name):
+        ...
+
+    tasks.enqueue(generate_derivatives, product.pk, 'icon', product.icon.name, key=...)
+
+Arguments are stored as JSON. A task with the `key` of a task that is still
+kept (pending, running, or finished less than `TASK_RETENTION` ago) is not
+queued again, so the same work is not done twice. Workers claim due tasks
+for `TASK_LEASE` seconds; a task whose worker died is taken over once its
+lease expires, or fails if that was its last attempt. Failed attempts are
+retried after `TASK_RETRY_DELAY` seconds, doubled for every further
+attempt, up to `TASK_MAX_ATTEMPTS`.
+
+Queue depth and latency are reported by `stats` and `manage.py task_stats`.
+"""
+import json
+import logging
+import time
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from producthuntclone.models import Task
+from producthuntclone.sqlite import retry_on_locked
+
+logger = logging.getLogger(__name__)
+
+# Finished tasks are purged by idle workers at most this often (seconds)
+PURGE_INTERVAL = 60 * 60
+
+# Finished tasks whose waiting and running times are averaged by `stats`
+STATS_SAMPLE = 1000
+
+
+def task(function):
+    """Registers `function` as a task, under its dotted path."""
+    function.task_name = f'{function.__module__}.{function.__name__}'
+    return function
+
+
+def enqueue(function, *args, key=None, delay=0):
+    """Queues `function(*args)` once the current transaction commits, right away outside of one."""
+    name = getattr(function, 'task_name', None)
+    if name is None:
+        raise ValueError(f'{function!r} is not registered with @task')
+    # Fails in the caller if the arguments cannot be stored
+    encoded = json.dumps(args)
+    transaction.on_commit(lambda: _add(name, encoded, key, delay))
+
+
+def claim(limit, worker):
+    """Marks up to `limit` due tasks as run by `worker` and returns them."""
+    if limit <= 0:
+        return []
+    return _claim(limit, worker)
+
+
+def execute(task):
+    """Runs a claimed task and records how it went."""
+    started = time.monotonic()
+    try:
+        function = import_string(task.name)
+        if getattr(function, 'task_name', None) != task.name:
+            raise ValueError(f'{task.name} is not registered with @task')
+        function(*json.loads(task.args))
+    except Exception:
+        retried = _fail(task, traceback.format_exc())
+        logger.warning('Task %s #%s failed, %s', task.name, task.pk, 'will be retried' if retried else 'giving up',
+                       exc_info=True)
+    else:
+        _finish(task)
+        logger.info('Task %s #%s done in %.3fs after waiting %.3fs', task.name, task.pk,
+                    time.monotonic() - started, (task.started - task.run_at).total_seconds())
+
+
+def run(workers=None, once=False):
+    """Runs tasks until interrupted, or until none is due if `once`; returns how many ran.
+
+    With more than one worker the tasks run in a thread pool, one task per
+    thread at a time; otherwise in the calling thread.
+    """
+    workers = workers or settings.TASK_WORKERS
+    worker = uuid.uuid4().hex
+    processed = 0
+    purged = 0
+    pool = ThreadPoolExecutor(workers) if workers > 1 else None
+    running = set()
+    try:
+        while True:
+            claimed = claim(workers - len(running), worker)
+            if pool is None:
+                for claimed_task in claimed:
+                    execute(claimed_task)
+                processed += len(claimed)
+            else:
+                running |= {pool.submit(_execute_in_thread, claimed_task) for claimed_task in claimed}
+                if running:
+                    done, running = wait(running, timeout=settings.TASK_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                    processed += len(done)
+                    continue
+            if claimed:
+                continue
+
+            if once:
+                return processed
+            if time.monotonic() - purged > PURGE_INTERVAL:
+                purge()
+                purged = time.monotonic()
+            time.sleep(settings.TASK_POLL_INTERVAL)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def purge():
+    """Deletes the tasks that finished or failed longer than `TASK_RETENTION` ago, returns how many."""
+    threshold = timezone.now() - timedelta(seconds=settings.TASK_RETENTION)
+    deleted, _ = Task.objects.filter(state__in=(Task.DONE, Task.FAILED), finished__lt=threshold).delete()
+    return deleted
+
+
+def stats():
+    """Depth of the queue and latency of the tasks.
+
+    `pending` tasks are due, `scheduled` ones wait for their time (retries);
+    `oldest_pending` is the seconds the longest waiting due task has been
+    due. `wait` and `run` are the average seconds the recently finished
+    tasks waited for a worker and ran.
+    """
+    now = timezone.now()
+    counts = dict.fromkeys([Task.PENDING, Task.RUNNING, Task.DONE, Task.FAILED], 0)
+    counts.update(Task.objects.order_by().values_list('state').annotate(Count('pk')))
+    counts['scheduled'] = Task.objects.filter(state=Task.PENDING, run_at__gt=now).count()
+    counts[Task.PENDING] -= counts['scheduled']
+    oldest = Task.objects.filter(state=Task.PENDING, run_at__lte=now).aggregate(oldest=Min('run_at'))['oldest']
+
+    recent = list(Task.objects.filter(state=Task.DONE).order_by('-finished')
+                  .values_list('run_at', 'started', 'finished')[:STATS_SAMPLE])
+    return {
+        **counts,
+        'oldest_pending': (now - oldest).total_seconds() if oldest else 0,
+        'wait': _average(started - run_at for run_at, started, _ in recent),
+        'run': _average(finished - started for _, started, finished in recent),
+    }
+
+
+@retry_on_locked
+def _add(name, encoded, key, delay):
+    now = timezone.now()
+    # A task with the same key is kept: nothing is inserted
+    Task.objects.bulk_create([Task(name=name, args=encoded, key=key, created=now,
+                                   run_at=now + timedelta(seconds=delay))], ignore_conflicts=True)
+
+
+@retry_on_locked
+def _claim(limit, worker):
+    now = timezone.now()
+    with transaction.atomic():
+        expired = Q(state=Task.RUNNING, claimed_until__lt=now)
+        # A task that kills its worker (out of memory, a crash in a C extension) never reaches `_fail`
+        lost = Task.objects.filter(expired, attempts__gte=settings.TASK_MAX_ATTEMPTS).update(
+            state=Task.FAILED, finished=now, claimed_until=None, error='The worker of the last attempt was lost')
+        if lost:
+            logger.warning('%d tasks failed, their workers were lost on the last attempt', lost)
+        due = Q(state=Task.PENDING, run_at__lte=now) | expired
+        ids = list(Task.objects.filter(due).order_by('run_at', 'pk').values_list('pk', flat=True)[:limit])
+        # Another worker may have claimed some of them since
+        Task.objects.filter(due, pk__in=ids).update(state=Task.RUNNING, claimed_by=worker, started=now,
+                                                    claimed_until=now + timedelta(seconds=settings.TASK_LEASE),
+                                                    attempts=F('attempts') + 1)
+    return list(Task.objects.filter(pk__in=ids, claimed_by=worker).order_by('run_at', 'pk'))
+
+
+@retry_on_locked
+def _finish(task):
+    # Not recorded if another worker took the task over meanwhile
+    Task.objects.filter(pk=task.pk, claimed_by=task.claimed_by).update(state=Task.DONE, finished=timezone.now(),
+                                                                       error='')
+
+
+@retry_on_locked
+def _fail(task, error):
+    """Schedules the next attempt, returns False if there is none."""
+    now = timezone.now()
+    retried = task.attempts < settings.TASK_MAX_ATTEMPTS
+    if retried:
+        delay = settings.TASK_RETRY_DELAY * 2 ** (task.attempts - 1)
+        changes = {'state': Task.PENDING, 'run_at': now + timedelta(seconds=delay)}
+    else:
+        changes = {'state': Task.FAILED, 'finished': now}
+    Task.objects.filter(pk=task.pk, claimed_by=task.claimed_by).update(error=error, claimed_until=None, **changes)
+    return retried
+
+
+def _execute_in_thread(task):
+    try:
+        execute(task)
+    finally:
+        # Threads of the pool do not end with a request, which would close their connections
+        connection.close()
+
+
+def _average(durations):
+    durations = [duration.total_seconds() for duration in durations]
+    return sum(durations) / len(durations) if durations else 0
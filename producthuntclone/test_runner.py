@@ -0,0 +1,33 @@
+"""Test runner keeping the tests away from the files of the running site.
+
+The file-based caches (sessions, throttle buckets, listing versions, vote
+states) and the throttle lock file are moved to a temporary directory for
+the whole run, so tests neither read nor clear the entries of a site served
+from the same checkout.
+"""
+import copy
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_dir = tempfile.mkdtemp()
+        caches = copy.deepcopy(settings.CACHES)
+        for alias, cache in caches.items():
+            if cache['BACKEND'] == 'django.core.cache.backends.filebased.FileBasedCache':
+                cache['LOCATION'] = os.path.join(self._cache_dir, alias)
+        self._settings = override_settings(CACHES=caches,
+                                           THROTTLE_LOCK_FILE=os.path.join(self._cache_dir, 'throttle.lock'))
+        self._settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._settings.disable()
+        shutil.rmtree(self._cache_dir)
+        super().teardown_test_environment(**kwargs)
@@ -1,18 +1,42 @@
+from contextlib import contextmanager
+from io import BytesIO
+
 from django.contrib import auth
+from django.db import connection
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 from django.utils import timezone
+from PIL import Image
 
+from accounts import throttling
+from producthuntclone.queries import record_queries
 from products.models import Product
 
 
 CONTEXT_INDEX = 0
 
 
-test_image = SimpleUploadedFile('image.png', b'file_content', content_type='image/png')
+def png(width=1, height=1):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_image(name='image.png', content=None):
+    # A fresh file for every upload: the test client reads files to their end
+    return SimpleUploadedFile(name, png() if content is None else content, content_type='image/png')
+
+
+def run_on_commit_callbacks():
+    """Runs the callbacks that `transaction.on_commit` holds back in a TestCase, as if it committed."""
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _, callback in callbacks:
+        callback()
 
 
 def create_test_user_with_endpoint(client, username='test', password='test'):
+    # Fixtures are not attempts to throttle, though all come from one address
+    throttling.reset()
     client.post(reverse('signup'), {'username': username, 'password1': password, 'password2': password})
 
 
@@ -23,8 +47,8 @@ def create_test_product_with_endpoint(client, title='title', body='body', url='g
                         'body': body,
                         'body-ru': '',
                         'url': url,
-                        'icon': test_image,
-                        'image': test_image,
+                        'icon': test_image(),
+                        'image': test_image(),
                         })
 
 
@@ -37,11 +61,21 @@ def create_test_product(client, title='title', body='body', url='google.com'):
     return Product.objects.create(title=title,
                                   body=body,
                                   url=url,
-                                  icon=test_image,
-                                  image=test_image,
+                                  icon=test_image(),
+                                  image=test_image(),
                                   pub_date=timezone.datetime.now(),
                                   hunter_id=auth.get_user(client).id)
 
 
 def logout_test_user_with_endpoint(client):
     client.post(reverse('logout'))
+
+
+@contextmanager
+def query_budget(test_case, max_queries):
+    """Fails the test if the block runs more than `max_queries` queries or one statement twice (N+1)."""
+    with record_queries() as recorder:
+        yield recorder
+    queries = '\n'.join(sql for sql, _, _ in recorder.queries)
+    test_case.assertLessEqual(recorder.count, max_queries, f'Query budget exceeded:\n{queries}')
+    test_case.assertEqual(recorder.similar(), {}, f'Statements run more than once:\n{queries}')
@@ -0,0 +1,309 @@
+import gzip
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+
+from producthuntclone import tasks
+from producthuntclone.fileserver import FileServer
+from producthuntclone.models import Task
+from producthuntclone.sqlite import retry_on_locked
+from producthuntclone.test_utils import run_on_commit_callbacks
+
+# Arguments of the calls of `record`
+recorded = []
+
+
+class FileServerTests(SimpleTestCase):
+    CONTENT = b'body { color: red; }' * 10
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(STATIC_ROOT=self.static_root, MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        with open(os.path.join(self.static_root, 'style.0123456789ab.css'), 'wb') as file:
+            file.write(self.CONTENT)
+        with open(os.path.join(self.static_root, 'style.0123456789ab.css.gz'), 'wb') as file:
+            file.write(gzip.compress(self.CONTENT))
+        self.server = FileServer(self.application)
+
+    @staticmethod
+    def application(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'django']
+
+    def request(self, path, **headers):
+        environ = {'PATH_INFO': path, **headers}
+        setup_testing_defaults(environ)
+        response = {}
+
+        def start_response(status, response_headers):
+            response['status'] = int(status.split()[0])
+            response['headers'] = dict(response_headers)
+
+        response['body'] = b''.join(self.server(environ, start_response))
+        return response
+
+    def test_other_paths_are_passed_to_application(self):
+        self.assertEqual(self.request('/products/1')['body'], b'django')
+
+    def test_file_is_served_with_validators(self):
+        response = self.request('/static/style.0123456789ab.css')
+        self.assertEqual(response['status'], 200)
+        self.assertEqual(response['body'], self.CONTENT)
+        self.assertEqual(response['headers']['Content-Type'], 'text/css')
+        self.assertIn('immutable', response['headers']['Cache-Control'])
+        self.assertIn('ETag', response['headers'])
+
+    def test_missing_file_and_traversal_return_404(self):
+        self.assertEqual(self.request('/static/missing.css')['status'], 404)
+        self.assertEqual(self.request('/media/../' + os.path.basename(self.static_root))['status'], 404)
+
+    def test_matching_etag_returns_304(self):
+        etag = self.request('/static/style.0123456789ab.css')['headers']['ETag']
+        response = self.request('/static/style.0123456789ab.css', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response['status'], 304)
+        self.assertEqual(response['body'], b'')
+
+    def test_if_modified_since_returns_304(self):
+        mtime = os.path.getmtime(os.path.join(self.static_root, 'style.0123456789ab.css'))
+        response = self.request('/static/style.0123456789ab.css', HTTP_IF_MODIFIED_SINCE=http_date(mtime + 1))
+        self.assertEqual(response['status'], 304)
+
+    def test_range_returns_partial_content(self):
+        response = self.request('/static/style.0123456789ab.css', HTTP_RANGE='bytes=5-9')
+        self.assertEqual(response['status'], 206)
+        self.assertEqual(response['body'], self.CONTENT[5:10])
+        self.assertEqual(response['headers']['Content-Range'], f'bytes 5-9/{len(self.CONTENT)}')
+
+    def test_suffix_range(self):
+        response = self.request('/static/style.0123456789ab.css', HTTP_RANGE='bytes=-4')
+        self.assertEqual(response['body'], self.CONTENT[-4:])
+
+    def test_unsatisfiable_range_returns_416(self):
+        response = self.request('/static/style.0123456789ab.css', HTTP_RANGE=f'bytes={len(self.CONTENT)}-')
+        self.assertEqual(response['status'], 416)
+
+    def test_precompressed_variant_is_served(self):
+        response = self.request('/static/style.0123456789ab.css', HTTP_ACCEPT_ENCODING='br, gzip')
+        self.assertEqual(response['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response['body']), self.CONTENT)
+
+    def test_post_is_not_allowed(self):
+        response = self.request('/static/style.0123456789ab.css', REQUEST_METHOD='POST')
+        self.assertEqual(response['status'], 405)
+
+
+class TestRunnerTests(SimpleTestCase):
+    def test_file_based_caches_are_outside_of_the_project(self):
+        for alias in ('sessions', 'throttle', 'versions', 'vote_states'):
+            self.assertFalse(caches[alias]._dir.startswith(settings.BASE_DIR))
+        self.assertFalse(settings.THROTTLE_LOCK_FILE.startswith(settings.BASE_DIR))
+
+
+class SqliteTests(TestCase):
+    def test_pragmas_are_applied_to_new_connections(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+
+
+@override_settings(SQLITE_LOCK_RETRIES=3, SQLITE_LOCK_BACKOFF=0)
+class RetryOnLockedTests(SimpleTestCase):
+    def flaky(self, failures, message='database is locked'):
+        calls = []
+
+        @retry_on_locked
+        def write():
+            calls.append(None)
+            if len(calls) <= failures:
+                raise OperationalError(message)
+            return 'done'
+        return write, calls
+
+    def test_locked_write_is_retried(self):
+        write, calls = self.flaky(2)
+        self.assertEqual(write(), 'done')
+        self.assertEqual(len(calls), 3)
+
+    def test_gives_up_after_the_last_attempt(self):
+        write, calls = self.flaky(3)
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 3)
+
+    def test_other_errors_are_not_retried(self):
+        write, calls = self.flaky(1, 'no such table: products_product')
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
+
+
+class QueryMiddlewareTests(TestCase):
+    def test_server_timing_reports_queries(self):
+        response = self.client.get('/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries, 0 duplicates", app;dur=[\d.]+$')
+
+    @override_settings(QUERY_INSTRUMENTATION=False)
+    def test_can_be_disabled(self):
+        self.assertFalse(self.client.get('/').has_header('Server-Timing'))
+
+
+@tasks.task
+def record(*args):
+    recorded.append(list(args))
+
+
+@tasks.task
+def fail():
+    raise ValueError('failed')
+
+
+def unregistered():
+    pass
+
+
+@override_settings(TASK_MAX_ATTEMPTS=3, TASK_RETRY_DELAY=10, TASK_LEASE=60)
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        recorded.clear()
+
+    def enqueue(self, function, *args, **kwargs):
+        tasks.enqueue(function, *args, **kwargs)
+        run_on_commit_callbacks()
+        return Task.objects.latest('pk')
+
+    def make_due(self, task):
+        Task.objects.filter(pk=task.pk).update(run_at=timezone.now())
+
+    def test_task_is_queued_when_the_transaction_commits(self):
+        tasks.enqueue(record, 1, 'a')
+        self.assertFalse(Task.objects.exists())
+
+        run_on_commit_callbacks()
+        task = Task.objects.get()
+        self.assertEqual((task.name, task.args, task.state), ('producthuntclone.tests.record', '[1, "a"]', 'pending'))
+
+    def test_only_registered_functions_are_queued(self):
+        with self.assertRaises(ValueError):
+            tasks.enqueue(unregistered)
+
+    def test_task_with_a_kept_key_is_not_queued_again(self):
+        self.enqueue(record, 1, key='record:1')
+        tasks.run(1, once=True)
+        self.enqueue(record, 1, key='record:1')
+        self.enqueue(record, 2, key='record:2')
+
+        self.assertEqual(Task.objects.count(), 2)
+        tasks.run(1, once=True)
+        self.assertEqual(recorded, [[1], [2]])
+
+    def test_worker_runs_due_tasks(self):
+        task = self.enqueue(record, [1, 2])
+
+        self.assertEqual(tasks.run(1, once=True), 1)
+        self.assertEqual(recorded, [[[1, 2]]])
+        task.refresh_from_db()
+        self.assertEqual((task.state, task.attempts), ('done', 1))
+        self.assertIsNotNone(task.finished)
+
+    def test_delayed_task_waits_for_its_time(self):
+        task = self.enqueue(record, delay=60)
+
+        self.assertEqual(tasks.run(1, once=True), 0)
+        self.make_due(task)
+        self.assertEqual(tasks.run(1, once=True), 1)
+
+    def test_failed_task_is_retried_with_backoff(self):
+        task = self.enqueue(fail)
+
+        delays = []
+        for _ in range(2):
+            tasks.run(1, once=True)
+            task.refresh_from_db()
+            self.assertEqual(task.state, 'pending')
+            self.assertIn('ValueError: failed', task.error)
+            delays.append(round((task.run_at - timezone.now()).total_seconds()))
+            self.make_due(task)
+        self.assertEqual(delays, [10, 20])
+
+    def test_task_fails_after_the_last_attempt(self):
+        task = self.enqueue(fail)
+        for _ in range(3):
+            tasks.run(1, once=True)
+            self.make_due(task)
+
+        task.refresh_from_db()
+        self.assertEqual((task.state, task.attempts), ('failed', 3))
+        self.assertEqual(tasks.run(1, once=True), 0)
+
+    def test_task_of_a_dead_worker_is_taken_over_when_its_lease_expires(self):
+        task = self.enqueue(record)
+        tasks.claim(1, 'dead')
+        self.assertEqual(tasks.claim(1, 'alive'), [])
+
+        Task.objects.filter(pk=task.pk).update(claimed_until=timezone.now() - timedelta(seconds=1))
+        [task] = tasks.claim(1, 'alive')
+        self.assertEqual((task.claimed_by, task.attempts), ('alive', 2))
+
+    def test_task_whose_worker_died_on_the_last_attempt_fails(self):
+        task = self.enqueue(record)
+        Task.objects.filter(pk=task.pk).update(state='running', attempts=3, claimed_by='dead',
+                                               claimed_until=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(tasks.claim(1, 'alive'), [])
+        task.refresh_from_db()
+        self.assertEqual((task.state, task.attempts), ('failed', 3))
+        self.assertIsNotNone(task.finished)
+        self.assertEqual(recorded, [])
+
+    @override_settings(TASK_RETENTION=60)
+    def test_old_finished_tasks_are_purged(self):
+        old = self.enqueue(record, key='old')
+        self.enqueue(record, key='new')
+        tasks.run(1, once=True)
+        Task.objects.filter(pk=old.pk).update(finished=timezone.now() - timedelta(seconds=61))
+
+        self.assertEqual(tasks.purge(), 1)
+        self.assertEqual(list(Task.objects.values_list('key', flat=True)), ['new'])
+
+    def test_stats_report_depth_and_latency(self):
+        self.enqueue(record)
+        tasks.run(1, once=True)
+        self.enqueue(record)
+        self.enqueue(record, delay=60)
+        Task.objects.filter(state='pending', run_at__lte=timezone.now()).update(
+            run_at=timezone.now() - timedelta(seconds=30))
+
+        stats = tasks.stats()
+        self.assertEqual((stats['pending'], stats['scheduled'], stats['running'], stats['done'], stats['failed']),
+                         (1, 1, 0, 1, 0))
+        self.assertGreaterEqual(stats['oldest_pending'], 30)
+        self.assertGreaterEqual(stats['wait'], 0)
+
+    def test_worker_command_runs_the_queue(self):
+        self.enqueue(record, 1)
+        out = StringIO()
+        call_command('run_worker', '--once', '--workers=1', stdout=out)
+        self.assertIn('Ran 1 tasks', out.getvalue())
+
+        out = StringIO()
+        call_command('task_stats', stdout=out)
+        self.assertIn('done: 1', out.getvalue())
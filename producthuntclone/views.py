@@ -1,2 +1,12 @@
+from django.conf import settings
+from django.views.static import serve
 
+from products.storage import is_content_addressed
 
+
+def serve_media(request, path):
+    """Development server for MEDIA_ROOT, content-addressed files are cached forever."""
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if is_content_addressed(path):
+        response['Cache-Control'] = settings.MEDIA_CACHE_CONTROL
+    return response
@@ -14,3 +14,14 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'producthuntclone.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.WSGI_FILE_SERVER:
+    from producthuntclone.fileserver import FileServer
+    application = FileServer(application)
+
+if settings.LEADERBOARD_ENABLED:
+    from products.leaderboard import leaderboard
+    leaderboard.rebuild()
+    leaderboard.start_verifier(settings.LEADERBOARD_VERIFY_INTERVAL)
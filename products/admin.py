@@ -3,4 +3,13 @@ from django.contrib import admin
 from products.models import Product, ProductVote
 
 admin.site.register(Product)
-admin.site.register(ProductVote)
+
+
+@admin.register(ProductVote)
+class ProductVoteAdmin(admin.ModelAdmin):
+    # `__str__` shows the user and the product of every row
+    list_select_related = ('user', 'product')
+    # Select boxes would load every user and product
+    raw_id_fields = ('user', 'product')
+    # Skips the second COUNT(*) over the whole table on filtered lists
+    show_full_result_count = False
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ProductsConfig(AppConfig):
     name = 'products'
+
+    def ready(self):
+        # Connects the signal receivers
+        from products import hot, leaderboard, media, search, versions, vote_state  # noqa: F401
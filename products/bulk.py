@@ -0,0 +1,330 @@
+"""Bulk loading of users, products and votes.
+
+Records are read from JSON lines or CSV files (optionally gzipped) and
+inserted with `bulk_create` in batches, one transaction per batch. Users
+are matched by username, votes refer to products by id; products keep the
+`id` of their record if it has one. `votes_total` and the vote rollups of
+every product that received votes are recomputed from the vote rows at the
+end. `batch_size` is the number of rows per transaction, Django splits
+every batch into the largest INSERTs the database accepts.
+
+`generate` creates synthetic data at a given scale with the same code
+paths, for benchmarks.
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from PIL import Image
+
+from products import hot, rollups, search
+from products.images import metadata_fields, read_metadata, render_derivatives
+from products.models import Product, ProductVote
+
+BATCH_SIZE = 5000
+
+PLACEHOLDER_COLOR = (218, 85, 47)
+
+
+class BulkLoadError(ValueError):
+    pass
+
+
+def read_records(path):
+    """Yields the records of a `.jsonl` or `.csv` file, `.gz` files are decompressed."""
+    name = path[:-3] if path.endswith('.gz') else path
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as file:
+        if name.endswith('.csv'):
+            yield from csv.DictReader(file)
+        elif name.endswith('.jsonl'):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            raise BulkLoadError(f'{path}: expected a .jsonl or .csv file')
+
+
+def import_users(records, batch_size=BATCH_SIZE):
+    """Creates users from records with `username` and optionally `email`, `password`
+    (raw), `password_hash` and `date_joined`. Existing usernames are skipped."""
+    hashes = {}
+
+    def build(record):
+        if record.get('password_hash'):
+            password = record['password_hash']
+        elif record.get('password'):
+            # Hashing is slow on purpose, equal passwords are hashed once
+            password = hashes.get(record['password'])
+            if password is None:
+                password = hashes[record['password']] = make_password(record['password'])
+        else:
+            password = make_password(None)
+        return User(username=record['username'], email=record.get('email') or '', password=password,
+                    date_joined=_parse_time(record.get('date_joined')) or timezone.now())
+
+    created = 0
+    for batch in _batches(records, batch_size):
+        with transaction.atomic():
+            existing = set(User.objects.filter(username__in={record['username'] for record in batch})
+                           .values_list('username', flat=True))
+            users = []
+            for record in batch:
+                if record['username'] not in existing:
+                    existing.add(record['username'])
+                    users.append(build(record))
+            User.objects.bulk_create(users, ignore_conflicts=True)
+            created += len(users)
+    return created
+
+
+def import_products(records, batch_size=BATCH_SIZE, media_dir=None):
+    """Creates products from records with `hunter` (a username), `title_en`, `title_ru`,
+    `body_en`, `body_ru`, `url` and optionally `id`, `pub_date`, `icon` and `image`.
+
+    `icon` and `image` are paths relative to `media_dir`, which are uploaded
+    to the storage, or names of files already in the storage if no
+    `media_dir` is given. Products without images get a placeholder. The
+    image metadata of files already in the storage is left to
+    `manage.py backfill_image_metadata`. Returns the number of products
+    created and the number skipped because their hunter does not exist.
+    """
+    placeholder = placeholder_images()
+    uploaded = {}
+    # Stored name -> image metadata
+    metadata = {placeholder[field]: placeholder[f'{field}_metadata'] for field in ('icon', 'image')}
+
+    def stored_name(value, field):
+        if not value:
+            return placeholder[field]
+        if media_dir is None:
+            return value
+        if value not in uploaded:
+            with open(os.path.join(media_dir, value), 'rb') as file:
+                uploaded[value] = default_storage.save(f'images/{os.path.basename(value)}', File(file))
+            metadata[uploaded[value]] = read_metadata(default_storage.path(uploaded[value]))
+        return uploaded[value]
+
+    created = skipped = 0
+    for batch in _batches(records, batch_size):
+        hunters = dict(User.objects.filter(username__in={record['hunter'] for record in batch})
+                       .values_list('username', 'pk'))
+        products = []
+        for record in batch:
+            if record['hunter'] not in hunters:
+                skipped += 1
+                continue
+            icon, image = stored_name(record.get('icon'), 'icon'), stored_name(record.get('image'), 'image')
+            products.append(Product(
+                pk=int(record['id']) if record.get('id') else None,
+                title_en=record['title_en'], title_ru=record.get('title_ru') or '',
+                body_en=record['body_en'], body_ru=record.get('body_ru') or '',
+                url=record['url'], icon=icon, image=image,
+                icon_widths=placeholder['icon_widths'] if icon == placeholder['icon'] else '',
+                image_widths=placeholder['image_widths'] if image == placeholder['image'] else '',
+                **metadata_fields('icon', metadata.get(icon, {})), **metadata_fields('image', metadata.get(image, {})),
+                pub_date=_parse_time(record.get('pub_date')) or timezone.now(),
+                hunter_id=hunters[record['hunter']]))
+        with transaction.atomic():
+            # Only products that keep the id of their record can conflict
+            taken = set(Product.objects.filter(pk__in={product.pk for product in products if product.pk})
+                        .values_list('pk', flat=True))
+            new = []
+            for product in products:
+                if product.pk not in taken:
+                    new.append(product)
+                    if product.pk:
+                        taken.add(product.pk)
+            last_pk = Product.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+            Product.objects.bulk_create(new, ignore_conflicts=True)
+            created += len(new)
+            # `bulk_create` sends no signals
+            search.index_products(Product.objects.filter(
+                Q(pk__gt=last_pk) | Q(pk__in=[product.pk for product in products if product.pk])))
+    return created, skipped
+
+
+def import_votes(records, batch_size=BATCH_SIZE):
+    """Creates votes from records with `product_id`, `user` (a username) or `user_id` and optionally `created`.
+
+    Votes on missing products, by missing users, on the voter's own product
+    or repeating an existing vote are skipped. Returns the number of votes
+    created and the number skipped.
+    """
+    created = skipped = 0
+    voted_products = set()
+    for batch in _batches(records, batch_size):
+        usernames = {record['user'] for record in batch if record.get('user')}
+        user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+        now = timezone.now()
+        pairs = {}
+        for record in batch:
+            user_id = user_ids.get(record['user']) if record.get('user') else int(record['user_id'])
+            if user_id:
+                pairs.setdefault((user_id, int(record['product_id'])), _parse_time(record.get('created')) or now)
+        hunters = dict(Product.objects.filter(pk__in={product_id for _, product_id in pairs})
+                       .values_list('pk', 'hunter_id'))
+        existing_users = set(User.objects.filter(pk__in={user_id for user_id, _ in pairs})
+                             .values_list('pk', flat=True))
+        votes = [(user_id, product_id, created) for (user_id, product_id), created in pairs.items()
+                 if product_id in hunters and user_id in existing_users and hunters[product_id] != user_id]
+
+        with transaction.atomic():
+            # Repeated votes are ignored by the unique index
+            inserted = _insert_votes(votes, ignore_conflicts=True)
+        created += inserted
+        skipped += len(batch) - inserted
+        voted_products.update(product_id for _, product_id, _ in votes)
+
+    recount_votes_total(voted_products, batch_size)
+    rollups.rebuild(voted_products, batch_size)
+    return created, skipped
+
+
+def recount_votes_total(product_ids, batch_size=BATCH_SIZE):
+    """Sets `votes_total` (the hunter's vote included) and `hot_score` of the products from their vote rows."""
+    product_ids = sorted(product_ids)
+    now = timezone.now()
+    for start in range(0, len(product_ids), batch_size):
+        with transaction.atomic():
+            Product.objects.filter(pk__in=product_ids[start:start + batch_size]).update(
+                votes_total=counted_votes() + 1, hot_score=hot.expression(counted_votes() + 1, now), updated=now)
+
+
+def counted_votes():
+    """Number of `ProductVote` rows of the outer product, for updates and annotations."""
+    votes = (ProductVote.objects
+             .filter(product=OuterRef('pk'))
+             .order_by()
+             .values('product')
+             .annotate(count=Count('pk'))
+             .values('count'))
+    return Coalesce(Subquery(votes), Value(0))
+
+
+def generate(users, products, votes, batch_size=BATCH_SIZE, password='synthetic', seed=None):
+    """Creates synthetic users, products and distinct votes, returns how many of each.
+
+    Votes a hunter would cast on their own product are dropped, so slightly
+    fewer votes than asked for may be created.
+    """
+    if votes > users * products:
+        raise BulkLoadError(f'{users} users can cast at most {users * products} votes on {products} products')
+    rng = random.Random(seed)
+    tag = uuid.UUID(int=rng.getrandbits(128)).hex[:8]
+
+    password = make_password(password)
+    now = timezone.now()
+    import_users(({'username': f'synthetic-{tag}-{i}', 'password_hash': password} for i in range(users)),
+                 batch_size)
+    user_ids = list(User.objects.filter(username__startswith=f'synthetic-{tag}-')
+                    .order_by('pk').values_list('pk', flat=True))
+
+    # Votes are picked first, so products are created with their final `votes_total`
+    hunters = [rng.choice(user_ids) for _ in range(products)]
+    pairs = [divmod(index, products) for index in rng.sample(range(users * products), votes)]
+    # Sorted, the (user, product) unique index is filled in order
+    pairs = sorted((user_ids[user], product) for user, product in pairs if user_ids[user] != hunters[product])
+    counts = Counter(product for _, product in pairs)
+
+    placeholder = placeholder_images()
+    last_pk = Product.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    pub_dates = [now - timedelta(seconds=rng.randrange(365 * 24 * 60 * 60)) for _ in range(products)]
+    for batch in _batches(range(products), batch_size):
+        with transaction.atomic():
+            Product.objects.bulk_create([Product(
+                title_en=f'Synthetic project {i}', title_ru=f'Синтетический проект {i}',
+                body_en=f'Description of synthetic project {i}', body_ru=f'Описание синтетического проекта {i}',
+                url=f'http://example.com/{tag}/{i}', icon=placeholder['icon'], image=placeholder['image'],
+                icon_widths=placeholder['icon_widths'], image_widths=placeholder['image_widths'],
+                **metadata_fields('icon', placeholder['icon_metadata']),
+                **metadata_fields('image', placeholder['image_metadata']),
+                pub_date=pub_dates[i], votes_total=counts[i] + 1,
+                hot_score=hot.score(counts[i] + 1, pub_dates[i], now), hunter_id=hunters[i]) for i in batch])
+    product_ids = list(Product.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True))
+    search.index_products(Product.objects.filter(pk__gt=last_pk))
+
+    rollup_counts = Counter()
+    for batch in _batches(pairs, batch_size):
+        # Every vote is cast at a random time since its product was published
+        votes = [(user_id, product_ids[product], pub_dates[product] + (now - pub_dates[product]) * rng.random())
+                 for user_id, product in batch]
+        with transaction.atomic():
+            _insert_votes(votes)
+        rollups.count(((product_id, created) for _, product_id, created in votes), rollup_counts)
+    # Votes are sorted by user: rollups written per batch would be updated over and over
+    with transaction.atomic():
+        rollups.add_counts(rollup_counts)
+    return len(user_ids), len(product_ids), len(pairs)
+
+
+def placeholder_images():
+    """Stores the placeholder icon and image once and renders their derivatives.
+
+    The storage is content addressed, so every call returns the same files.
+    """
+    placeholder = {}
+    for field, size, widths, square in (('icon', (256, 256), settings.PRODUCT_ICON_WIDTHS, True),
+                                        ('image', (1440, 960), settings.PRODUCT_IMAGE_WIDTHS, False)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, PLACEHOLDER_COLOR).save(buffer, 'PNG')
+        name = default_storage.save(f'images/placeholder-{field}.png', ContentFile(buffer.getvalue()))
+        placeholder[field] = name
+        placeholder[f'{field}_widths'] = ','.join(map(str, render_derivatives(default_storage.path(name),
+                                                                              widths, square)))
+        placeholder[f'{field}_metadata'] = read_metadata(default_storage.path(name))
+    return placeholder
+
+
+def _insert_votes(votes, ignore_conflicts=False):
+    """Inserts (user_id, product_id, created) rows, returns how many were inserted."""
+    # Millions of votes: building and compiling model instances would take
+    # several times longer than the inserts themselves
+    if not votes:
+        return 0
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.executemany(f'{connection.ops.insert_statement(ignore_conflicts=ignore_conflicts)} '
+                           f'{quote(ProductVote._meta.db_table)} '
+                           f'({quote("user_id")}, {quote("product_id")}, {quote("created")}) VALUES (%s, %s, %s) '
+                           f'{connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts=ignore_conflicts)}',
+                           [(user_id, product_id, connection.ops.adapt_datetimefield_value(created))
+                            for user_id, product_id, created in votes])
+        return cursor.rowcount
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise BulkLoadError(f'{value!r} is not an ISO 8601 time')
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
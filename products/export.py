@@ -0,0 +1,156 @@
+"""Streaming export of products, votes and hunters as CSV or JSON lines.
+
+Rows are read with `values_list(...).iterator()`, so neither model instances
+nor whole tables are held in memory, and are encoded in small batches that
+can be written to a file or streamed in an HTTP response, optionally
+gzipped on the fly. Exports are ordered by id: `after_id` continues a
+previous export, `since` limits products to those updated and votes to
+those cast since then.
+"""
+import csv
+import json
+import zlib
+from datetime import date, datetime
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from products.models import Product, ProductVote
+
+FORMATS = ('csv', 'jsonl')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# Column name -> field looked up with `values_list`
+DATASETS = {
+    'products': {
+        'id': 'pk',
+        'title_en': 'title_en',
+        'title_ru': 'title_ru',
+        'body_en': 'body_en',
+        'body_ru': 'body_ru',
+        'url': 'url',
+        'icon': 'icon',
+        'image': 'image',
+        'pub_date': 'pub_date',
+        'updated': 'updated',
+        'votes_total': 'votes_total',
+        'hunter_id': 'hunter_id',
+        'hunter': 'hunter__username',
+    },
+    'votes': {
+        'id': 'pk',
+        'user_id': 'user_id',
+        'user': 'user__username',
+        'product_id': 'product_id',
+        'created': 'created',
+    },
+    'hunters': {
+        'id': 'pk',
+        'username': 'username',
+        'date_joined': 'date_joined',
+        'last_login': 'last_login',
+    },
+}
+
+# Dataset -> time field `since` is compared with
+SINCE_FIELDS = {
+    'products': 'updated',
+    'votes': 'created',
+}
+
+ROWS_PER_CHUNK = 500
+
+
+class ExportError(ValueError):
+    pass
+
+
+def rows(dataset, since=None, after_id=None, chunk_size=2000):
+    """Yields the rows of `dataset` as tuples, in the order of `DATASETS[dataset]`."""
+    if dataset not in DATASETS:
+        raise ExportError(f'Unknown dataset {dataset!r}, choose from {", ".join(DATASETS)}')
+    if since and dataset not in SINCE_FIELDS:
+        raise ExportError(f'Only {" and ".join(SINCE_FIELDS)} can be filtered by time, use after_id for {dataset}')
+    if dataset == 'products':
+        queryset = Product.objects.all()
+    elif dataset == 'votes':
+        queryset = ProductVote.objects.all()
+    else:
+        queryset = User.objects.filter(product__isnull=False).distinct()
+
+    if since:
+        queryset = queryset.filter(**{f'{SINCE_FIELDS[dataset]}__gte': since})
+    if after_id:
+        queryset = queryset.filter(pk__gt=after_id)
+    return queryset.order_by('pk').values_list(*DATASETS[dataset].values()).iterator(chunk_size=chunk_size)
+
+
+def parse_since(value):
+    """Parses an ISO 8601 time or date, times without an offset are in the current time zone."""
+    since = parse_datetime(value)
+    if since is None:
+        day = parse_date(value)
+        if day is None:
+            raise ExportError(f'{value!r} is not an ISO 8601 time')
+        since = datetime.combine(day, datetime.min.time())
+    return timezone.make_aware(since) if timezone.is_naive(since) else since
+
+
+def encode(dataset, rows, format):
+    """Yields the rows as text in batches of `ROWS_PER_CHUNK`, CSV starts with a header."""
+    columns = list(DATASETS[dataset])
+    if format == 'csv':
+        buffer = _LineBuffer()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for number, row in enumerate(rows, 1):
+            writer.writerow([_format_value(value) for value in row])
+            if number % ROWS_PER_CHUNK == 0:
+                yield buffer.pop()
+        yield buffer.pop()
+    elif format == 'jsonl':
+        lines = []
+        for row in rows:
+            lines.append(json.dumps(dict(zip(columns, map(_format_value, row))), ensure_ascii=False) + '\n')
+            if len(lines) == ROWS_PER_CHUNK:
+                yield ''.join(lines)
+                lines = []
+        yield ''.join(lines)
+    else:
+        raise ExportError(f'Unknown format {format!r}, choose from {", ".join(FORMATS)}')
+
+
+def compress(chunks):
+    """Gzips the text chunks on the fly."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _format_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+class _LineBuffer:
+    """File-like target of `csv.writer` that hands the written text out in batches."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def pop(self):
+        text = ''.join(self.parts)
+        self.parts = []
+        return text
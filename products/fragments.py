@@ -0,0 +1,47 @@
+"""Cache of rendered per-product template fragments.
+
+A fragment is keyed on the product id, `votes_total`, the active language
+and `updated`, which every edit, vote and image change of the product
+sets. The row read by the request thus names the fragments rendered from
+it, in every process, and the fragments of the old row are no longer
+reached; fragments of other products stay cached.
+"""
+from django.core.cache import caches
+from django.utils import translation
+
+CACHE_ALIAS = 'fragments'
+
+_HITS_KEY = 'fragment-stats:hits'
+_MISSES_KEY = 'fragment-stats:misses'
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def fragment_key(name, product):
+    version = product.updated.timestamp()
+    return f'fragment:{name}:{product.pk}:{product.votes_total}:{translation.get_language()}:{version}'
+
+
+def get_fragment(key):
+    content = get_cache().get(key)
+    _count(_MISSES_KEY if content is None else _HITS_KEY)
+    return content
+
+
+def set_fragment(key, content):
+    get_cache().set(key, content)
+
+
+def stats():
+    counters = get_cache().get_many([_HITS_KEY, _MISSES_KEY])
+    return {'hits': counters.get(_HITS_KEY, 0), 'misses': counters.get(_MISSES_KEY, 0)}
+
+
+def _count(key):
+    try:
+        get_cache().incr(key)
+    except ValueError:
+        get_cache().set(key, 1, timeout=None)
+
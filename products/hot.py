@@ -0,0 +1,109 @@
+"""Time-decayed "hot" ranking of products.
+
+The score follows Hacker News: the votes besides the hunter's own divided
+by (age in hours + 2) ** `HOT_SCORE_GRAVITY`. Computed in ORDER BY it would
+scan the whole table on every request, so it is stored in the indexed
+`Product.hot_score` column. A vote recomputes the score of its product in
+the UPDATE that counts it. Scores of products nobody votes on would stay
+too high as they age, so `manage.py refresh_hot_scores` recomputes them in
+batches every `HOT_SCORE_REFRESH_INTERVAL` seconds.
+
+On SQLite the database computes the score with the `hot_score()` function
+registered on every connection; other databases compute it with POWER()
+and GREATEST() from the seconds since the epoch of `pub_date`.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import ExpressionWrapper, F, FloatField, Func, Max, Value
+from django.db.models.functions import Greatest, Power
+from django.dispatch import receiver
+from django.utils import timezone
+
+from products.models import Product
+
+_UNIX_EPOCH_JULIAN_DAY = 2440587.5
+
+
+def score(votes_total, pub_date, now=None):
+    now = now or timezone.now()
+    if timezone.is_naive(pub_date):
+        pub_date = timezone.make_aware(pub_date, timezone.get_default_timezone())
+    return _score(votes_total, (now - pub_date) / timedelta(hours=1))
+
+
+class _EpochSeconds(Func):
+    """Seconds since the Unix epoch of a datetime expression."""
+    template = 'EXTRACT(EPOCH FROM %(expressions)s)'
+    output_field = FloatField()
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        # Unlike UNIX_TIMESTAMP() independent of the time zone of the session
+        template = "TIMESTAMPDIFF(MICROSECOND, '1970-01-01 00:00:00', %(expressions)s) / 1000000"
+        return self.as_sql(compiler, connection, template=template, **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        template = f'(julianday(%(expressions)s) - {_UNIX_EPOCH_JULIAN_DAY}) * 86400'
+        return self.as_sql(compiler, connection, template=template, **extra_context)
+
+
+def expression(votes_total, now=None):
+    """`score` of every updated row computed by the database, `votes_total` is an expression."""
+    now = now or timezone.now()
+    if connection.vendor != 'sqlite':
+        return _portable_expression(votes_total, now)
+    # `julianday()` parses the timestamps as SQLite stores them
+    pub_day = Func(F('pub_date'), function='julianday')
+    now_day = now.timestamp() / (24 * 60 * 60) + _UNIX_EPOCH_JULIAN_DAY
+    return Func(votes_total, pub_day, Value(now_day), function='hot_score', output_field=FloatField())
+
+
+def refresh(batch_size=1000, now=None):
+    """Recomputes the stored scores of voted products, returns how many were updated.
+
+    Every batch is a range of ids updated by one statement in its own
+    transaction, so votes are not blocked for long.
+    """
+    now = now or timezone.now()
+    last_pk = Product.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+    refreshed = 0
+    for start in range(0, last_pk, batch_size):
+        with transaction.atomic():
+            # Products with only the hunter's vote always score 0
+            refreshed += (Product.objects
+                          .filter(pk__gt=start, pk__lte=start + batch_size, votes_total__gt=1)
+                          .update(hot_score=expression(F('votes_total'), now)))
+    return refreshed
+
+
+def refresh_period():
+    """Number of the current refresh interval: hot pages cached before it may be stale."""
+    return int(time.time() // settings.HOT_SCORE_REFRESH_INTERVAL)
+
+
+def _portable_expression(votes_total, now):
+    age_hours = (Value(now.timestamp()) - _EpochSeconds(F('pub_date'))) / Value(60 * 60)
+    # Same as `_score`
+    base = Greatest(age_hours, Value(0.0)) + Value(2.0)
+    return ExpressionWrapper((votes_total - Value(1.0)) / Power(base, Value(settings.HOT_SCORE_GRAVITY)),
+                             output_field=FloatField())
+
+
+def _score(votes_total, age_hours):
+    # Clock skew between processes must not make the base negative
+    return (votes_total - 1) / (max(age_hours, 0) + 2) ** settings.HOT_SCORE_GRAVITY
+
+
+def _score_of_days(votes_total, pub_day, now_day):
+    if votes_total is None or pub_day is None:
+        return None
+    return _score(votes_total, (now_day - pub_day) * 24)
+
+
+@receiver(connection_created)
+def _register_function(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function('hot_score', 3, _score_of_days, deterministic=True)
@@ -0,0 +1,165 @@
+"""Responsive derivatives of uploaded product images.
+
+When a product is committed its icon is cut into square thumbnails and its
+image is resized to several widths, each saved in the original format and,
+if Pillow supports it, as WebP. The work runs as a background task, see
+`producthuntclone.tasks`; the widths that were generated are stored on the
+product, so templates can build `srcset` without touching the files.
+
+The product also carries the metadata of both images: dimensions, byte size
+and format, read from the header when the product is created, and a tiny
+blurred placeholder shown until the image loads, rendered by the task with
+the derivatives. `manage.py backfill_image_metadata` fills in older products.
+"""
+import base64
+import io
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageFilter, ImageOps
+
+from producthuntclone import tasks
+from producthuntclone.sqlite import retry_on_locked
+from products.models import Product
+
+# Fields whose derivatives are square
+SQUARE_FIELDS = ('icon',)
+
+# Width of the placeholders; browsers scale them up to the size of the image
+PLACEHOLDER_WIDTH = 16
+
+# EXIF orientations that swap the width and the height
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def derivative_name(name, width, webp=False):
+    root, extension = os.path.splitext(name)
+    return f'{root}_{width}w{".webp" if webp else _fallback_extension(extension)}'
+
+
+def webp_supported():
+    Image.init()
+    return 'WEBP' in Image.SAVE
+
+
+def render_derivatives(path, widths, square):
+    """Writes the derivatives next to `path`, returns the generated widths.
+
+    Widths larger than the source are skipped: images are never upscaled.
+    """
+    with _open_source(path) as source:
+        return _render_derivatives(source, path, widths, square)
+
+
+def process_image(path, widths, square):
+    """Renders the derivatives and the placeholder from one decoding, returns both."""
+    with _open_source(path) as source:
+        return _render_derivatives(source, path, widths, square), render_placeholder(source)
+
+
+def describe(file):
+    """Width, height, byte size and format of an image file, read from its header.
+
+    Width and height are those of the image as shown, after its EXIF
+    orientation is applied.
+    """
+    file.seek(0)
+    with Image.open(file) as image:
+        width, height = image.size
+        if image.getexif().get(0x0112) in _TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+        image_format = image.format
+    file.seek(0)
+    return {'width': width, 'height': height, 'size': file.size, 'format': image_format}
+
+
+def read_metadata(path):
+    """All the metadata of the image at `path`, placeholder included; decodes the image."""
+    with open(path, 'rb') as file:
+        metadata = describe(File(file))
+    with _open_source(path) as source:
+        metadata['placeholder'] = render_placeholder(source)
+    return metadata
+
+
+def render_placeholder(source):
+    """A `data:` URI of a blurred, PLACEHOLDER_WIDTH pixels wide JPEG of the image."""
+    placeholder = Image.new('RGB', source.size, 'white')
+    # Transparent parts are shown on white
+    placeholder.paste(source, mask=source if source.mode == 'RGBA' else None)
+    placeholder.thumbnail((PLACEHOLDER_WIDTH, PLACEHOLDER_WIDTH * 4), Image.BILINEAR)
+    placeholder = placeholder.filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    placeholder.save(buffer, 'JPEG', quality=60)
+    return f'data:image/jpeg;base64,{base64.b64encode(buffer.getvalue()).decode()}'
+
+
+def metadata_fields(field, metadata):
+    """Values of the `Product` fields holding the metadata of its `field` image."""
+    return {f'{field}_{key}': value for key, value in metadata.items()}
+
+
+def _open_source(path):
+    source = Image.open(path)
+    transposed = ImageOps.exif_transpose(source)
+    # Palette and bilevel images cannot be resampled smoothly
+    converted = transposed.convert('RGBA' if 'A' in transposed.getbands() or 'transparency' in transposed.info
+                                   else 'RGB')
+    source.close()
+    return converted
+
+
+def _render_derivatives(source, path, widths, square):
+    generated = []
+    webp = webp_supported()
+    for width in widths:
+        if width > (min(source.size) if square else source.width):
+            continue
+        if square:
+            derivative = ImageOps.fit(source, (width, width), Image.LANCZOS)
+        else:
+            derivative = source.resize((width, round(source.height * width / source.width)), Image.LANCZOS)
+        _save(derivative, derivative_name(path, width))
+        if webp:
+            _save(derivative, derivative_name(path, width, webp=True))
+        generated.append(width)
+    return generated
+
+
+def schedule_derivatives(product):
+    """Queues the generation of the derivatives of the product images, see `generate_derivatives`."""
+    for field in ('icon', 'image'):
+        name = getattr(product, field).name
+        tasks.enqueue(generate_derivatives, product.pk, field, name, key=f'derivatives:{product.pk}:{field}:{name}')
+
+
+@tasks.task
+def generate_derivatives(pk, field, name):
+    """Renders the derivatives and the placeholder of the `field` image `name` of a product and stores them."""
+    product = Product.objects.filter(pk=pk, **{field: name})
+    if not product.exists():
+        # Deleted, or the file was replaced in the meantime
+        return
+    widths = settings.PRODUCT_ICON_WIDTHS if field == 'icon' else settings.PRODUCT_IMAGE_WIDTHS
+    widths, placeholder = process_image(default_storage.path(name), widths, field in SQUARE_FIELDS)
+    retry_on_locked(product.update)(updated=timezone.now(), **{
+        f'{field}_widths': ','.join(map(str, widths)),
+        f'{field}_placeholder': placeholder,
+    })
+
+
+def _fallback_extension(extension):
+    # JPEGs stay JPEGs, everything else becomes PNG to keep transparency
+    return '.jpg' if extension.lower() in ('.jpg', '.jpeg') else '.png'
+
+
+def _save(image, path):
+    if path.endswith('.jpg'):
+        image.convert('RGB').save(path, 'JPEG', quality=85, optimize=True, progressive=True)
+    elif path.endswith('.webp'):
+        image.save(path, 'WEBP', quality=80, method=4)
+    else:
+        image.save(path, 'PNG', optimize=True)
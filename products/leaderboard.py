@@ -0,0 +1,180 @@
+"""In-memory ranking of products for the home page.
+
+Keeps the product ids sorted the same way as `HomeView.ORDERING`, so a page
+of the home listing is a slice of a list plus one `in_bulk` query instead of
+an ORDER BY over the whole table. The structure lives in the process memory:
+it is rebuilt at startup, updated when votes and products are committed and
+compared with the database by a background thread to pick up changes made
+by other processes. A rebuild sets `built_at`, which is part of the version
+of the pages ranked with it, so pages rendered from a drifted ranking are
+not served once it is fixed. While it is cold `HomeView` keeps using SQL.
+"""
+import logging
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from products.models import Product
+from products.pagination import NEXT, KeysetPage
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _key(pk, votes_total, pub_date):
+    if timezone.is_naive(pub_date):
+        pub_date = timezone.make_aware(pub_date, timezone.get_default_timezone())
+    # Ascending order of the key is the descending ranking order
+    return -votes_total, -((pub_date - _EPOCH) // timedelta(microseconds=1)), -pk
+
+
+class Leaderboard:
+    def __init__(self):
+        self._keys = []
+        self._keys_by_pk = {}
+        self._lock = threading.RLock()
+        # Set when rows of the ranking are missing, wakes the verifier up
+        self._stale = threading.Event()
+        self.is_warm = False
+        self.built_at = None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def rebuild(self):
+        try:
+            rows = Product.objects.values_list('pk', 'votes_total', 'pub_date').iterator()
+            keys_by_pk = {pk: _key(pk, votes_total, pub_date) for pk, votes_total, pub_date in rows}
+        except DatabaseError:
+            logger.exception('Could not build the leaderboard, using SQL ranking')
+            return
+        with self._lock:
+            self._keys_by_pk = keys_by_pk
+            self._keys = sorted(keys_by_pk.values())
+            self.is_warm = True
+            self.built_at = timezone.now()
+
+    def clear(self):
+        with self._lock:
+            self._keys = []
+            self._keys_by_pk = {}
+            self.is_warm = False
+            self.built_at = None
+
+    def update(self, pk, votes_total, pub_date):
+        with self._lock:
+            if self.is_warm:
+                self._remove(pk)
+                key = _key(pk, votes_total, pub_date)
+                insort(self._keys, key)
+                self._keys_by_pk[pk] = key
+
+    def add_votes(self, pk, count=1):
+        with self._lock:
+            key = self._keys_by_pk.get(pk)
+            if key is None:
+                return
+            self._remove(pk)
+            key = (key[0] - count,) + key[1:]
+            insort(self._keys, key)
+            self._keys_by_pk[pk] = key
+
+    def remove(self, pk):
+        with self._lock:
+            self._remove(pk)
+
+    def ids(self, start, stop):
+        with self._lock:
+            return [-key[2] for key in self._keys[start:stop]]
+
+    def page(self, direction, values, per_page):
+        """Same as `KeysetPaginator.page` for a decoded `HomeView` cursor."""
+        votes_total, pub_date, pk = values
+        key = _key(pk, votes_total, pub_date)
+        with self._lock:
+            if direction == NEXT:
+                start = bisect_right(self._keys, key)
+                keys = self._keys[start:start + per_page]
+                has_next, has_previous = start + per_page < len(self._keys), True
+            else:
+                stop = bisect_left(self._keys, key)
+                keys = self._keys[max(stop - per_page, 0):stop]
+                has_next, has_previous = True, stop > per_page
+        return KeysetPage(self.fetch([-key[2] for key in keys]), has_next=has_next, has_previous=has_previous)
+
+    def fetch(self, ids):
+        products = Product.objects.in_bulk(ids)
+        if len(products) != len(ids):
+            # Deleted by another process, verify right away
+            self._stale.set()
+        return [products[pk] for pk in ids if pk in products]
+
+    def verify(self):
+        """Compares the ranking with the database and rebuilds it on mismatch."""
+        expected = list(Product.objects.order_by('-votes_total', '-pub_date', '-pk').values_list('pk', flat=True))
+        with self._lock:
+            consistent = expected == [-key[2] for key in self._keys]
+        if not consistent:
+            logger.info('Leaderboard is out of sync with the database, rebuilding')
+            self.rebuild()
+        return consistent
+
+    def start_verifier(self, interval):
+        """Verifies the ranking every `interval` seconds in a daemon thread, off the request path."""
+        thread = threading.Thread(target=self._verify_periodically, args=(interval,),
+                                  name='leaderboard-verifier', daemon=True)
+        thread.start()
+        return thread
+
+    def _verify_periodically(self, interval):
+        while True:
+            self._stale.wait(interval)
+            self._stale.clear()
+            if not self.is_warm:
+                continue
+            try:
+                self.verify()
+            except DatabaseError:
+                logger.exception('Could not verify the leaderboard')
+            finally:
+                # The thread does not end with a request, which would close its connection
+                connection.close()
+
+    def _remove(self, pk):
+        key = self._keys_by_pk.pop(pk, None)
+        if key is not None:
+            del self._keys[bisect_left(self._keys, key)]
+
+
+class RankedProducts:
+    """Sequence of products in the leaderboard order, suitable for `Paginator`."""
+
+    def __init__(self, leaderboard):
+        self.leaderboard = leaderboard
+
+    def __len__(self):
+        return len(self.leaderboard)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.leaderboard.fetch(self.leaderboard.ids(index.start or 0, index.stop))
+        return self.leaderboard.fetch(self.leaderboard.ids(index, index + 1))[0]
+
+
+leaderboard = Leaderboard()
+
+
+@receiver(post_save, sender=Product)
+def _product_saved(instance, **kwargs):
+    transaction.on_commit(lambda: leaderboard.update(instance.pk, instance.votes_total, instance.pub_date))
+
+
+@receiver(post_delete, sender=Product)
+def _product_deleted(instance, **kwargs):
+    transaction.on_commit(lambda: leaderboard.remove(instance.pk))
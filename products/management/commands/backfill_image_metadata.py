@@ -0,0 +1,73 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from products.images import metadata_fields, read_metadata
+from products.models import Product
+
+FIELDS = ('icon', 'image')
+
+# Files are shared by products: the metadata of this many is kept between batches
+CACHED_FILES = 10000
+
+
+class Command(BaseCommand):
+    help = 'Stores the dimensions, byte size, format and placeholder of product images that lack them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of products updated per transaction')
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute the metadata of every product')
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if not options['all']:
+            missing = Q()
+            for field in FIELDS:
+                missing |= Q(**{f'{field}_width__isnull': True}) | Q(**{f'{field}_placeholder': ''})
+            products = products.filter(missing)
+
+        metadata = {}
+        updated = unreadable = 0
+        last_pk = 0
+        while True:
+            batch = list(products
+                         .filter(pk__gt=last_pk)
+                         .order_by('pk')
+                         .values_list('pk', *FIELDS)[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            if len(metadata) > CACHED_FILES:
+                metadata.clear()
+
+            changes = []
+            for pk, *names in batch:
+                values = {}
+                for field, name in zip(FIELDS, names):
+                    if name not in metadata:
+                        metadata[name] = self._read(pk, name)
+                    if metadata[name] is None:
+                        unreadable += 1
+                    else:
+                        values.update(metadata_fields(field, metadata[name]))
+                if values:
+                    changes.append((pk, dict(zip(FIELDS, names)), values))
+
+            now = timezone.now()
+            with transaction.atomic():
+                for pk, files, values in changes:
+                    # Skipped if a file was replaced in the meantime
+                    updated += Product.objects.filter(pk=pk, **files).update(updated=now, **values)
+
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated} products, {unreadable} files could not be read'))
+
+    def _read(self, pk, name):
+        try:
+            return read_metadata(default_storage.path(name))
+        except (OSError, SyntaxError, ValueError) as error:
+            self.stderr.write(f'Product {pk}: cannot read {name}: {error}')
+            return None
@@ -0,0 +1,45 @@
+import os
+import re
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from products.media import is_recent
+from products.models import Product
+
+_DERIVATIVE_SUFFIX = re.compile(r'_\d+w$')
+
+
+class Command(BaseCommand):
+    help = 'Deletes uploaded files and derivatives that are not referenced by any product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only list orphaned files, do not delete them')
+
+    def handle(self, *args, **options):
+        referenced_roots = set()
+        for names in Product.objects.values_list('icon', 'image').iterator():
+            referenced_roots.update(os.path.splitext(name)[0] for name in names)
+
+        deleted = 0
+        for name in self._walk(''):
+            root = _DERIVATIVE_SUFFIX.sub('', os.path.splitext(name)[0])
+            if root in referenced_roots or is_recent(name):
+                continue
+            self.stdout.write(f'Orphaned: {name}')
+            if not options['dry_run']:
+                default_storage.delete(name)
+            deleted += 1
+
+        verb = 'Found' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {deleted} orphaned files'))
+
+    def _walk(self, directory):
+        if not default_storage.exists(directory):
+            return
+        directories, files = default_storage.listdir(directory)
+        for name in files:
+            yield os.path.join(directory, name).replace('\\', '/')
+        for name in directories:
+            yield from self._walk(os.path.join(directory, name))
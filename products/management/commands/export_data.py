@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products import export
+
+
+class Command(BaseCommand):
+    help = 'Streams products, votes or hunters as CSV or JSON lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(export.DATASETS))
+        parser.add_argument('--format', choices=export.FORMATS, default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output')
+        parser.add_argument('--since', help='Only products updated or votes cast since this ISO 8601 time')
+        parser.add_argument('--after-id', type=int, help='Only rows with a larger id, continues an export')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the database at once')
+        parser.add_argument('--output', default='-', help='File to write, standard output by default')
+
+    def handle(self, *args, **options):
+        try:
+            since = export.parse_since(options['since']) if options['since'] else None
+            rows = export.rows(options['dataset'], since=since, after_id=options['after_id'],
+                               chunk_size=options['chunk_size'])
+        except export.ExportError as error:
+            raise CommandError(error)
+        chunks = export.encode(options['dataset'], rows, options['format'])
+
+        if options['output'] == '-':
+            if options['gzip']:
+                for data in export.compress(chunks):
+                    sys.stdout.buffer.write(data)
+            else:
+                for chunk in chunks:
+                    self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['output'], 'wb') as file:
+            for data in export.compress(chunks) if options['gzip'] else (chunk.encode() for chunk in chunks):
+                file.write(data)
+        self.stderr.write(self.style.SUCCESS(f"Exported {options['dataset']} to {options['output']}"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products import vote_buffer
+
+
+class Command(BaseCommand):
+    help = 'Applies votes accepted in buffered voting mode to the database'
+
+    def handle(self, *args, **options):
+        processed = vote_buffer.get_buffer().flush()
+        self.stdout.write(self.style.SUCCESS(f'Flushed {processed} buffered votes'))
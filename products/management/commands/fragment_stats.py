@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from products import fragments, page_cache
+
+
+class Command(BaseCommand):
+    help = ('Shows hit/miss counters of the product fragment and page caches '
+            '(shared only by a file or memcached backend)')
+
+    def handle(self, *args, **options):
+        for name, stats in (('fragments', fragments.stats()), ('pages', page_cache.stats())):
+            total = stats['hits'] + stats['misses']
+            ratio = stats['hits'] / total if total else 0
+            self.stdout.write(f"{name}: hits: {stats['hits']}, misses: {stats['misses']}, hit ratio: {ratio:.1%}")
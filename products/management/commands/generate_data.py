@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products import bulk
+
+
+class Command(BaseCommand):
+    help = 'Creates synthetic users, products and votes, e.g. for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--votes', type=int, default=10000)
+        parser.add_argument('--password', default='synthetic', help='Password of every synthetic user')
+        parser.add_argument('--seed', type=int, help='Makes the generated data reproducible')
+        parser.add_argument('--batch-size', type=int, default=bulk.BATCH_SIZE,
+                            help='Rows inserted per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            users, products, votes = bulk.generate(options['users'], options['products'], options['votes'],
+                                                   batch_size=options['batch_size'],
+                                                   password=options['password'], seed=options['seed'])
+        except bulk.BulkLoadError as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(f'Created {users} users, {products} products and {votes} votes'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products import bulk
+
+
+class Command(BaseCommand):
+    help = 'Loads users, products and votes from JSON lines or CSV files in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', help='File of users: username, email, password or password_hash')
+        parser.add_argument('--products', help='File of products: hunter, title_en, title_ru, body_en, '
+                                               'body_ru, url and optionally id, pub_date, icon, image')
+        parser.add_argument('--votes', help='File of votes: product_id and user or user_id')
+        parser.add_argument('--media-dir', help='Directory the icon and image paths of products are relative to; '
+                                                'without it they are names of files already in the storage')
+        parser.add_argument('--batch-size', type=int, default=bulk.BATCH_SIZE,
+                            help='Rows inserted per transaction')
+
+    def handle(self, *args, **options):
+        if not any(options[name] for name in ('users', 'products', 'votes')):
+            raise CommandError('Nothing to import, pass --users, --products or --votes')
+        batch_size = options['batch_size']
+
+        try:
+            if options['users']:
+                created = bulk.import_users(bulk.read_records(options['users']), batch_size)
+                self.stdout.write(f'Imported {created} users')
+            if options['products']:
+                created, skipped = bulk.import_products(bulk.read_records(options['products']), batch_size,
+                                                        media_dir=options['media_dir'])
+                self.stdout.write(f'Imported {created} products, skipped {skipped} of unknown hunters')
+            if options['votes']:
+                created, skipped = bulk.import_votes(bulk.read_records(options['votes']), batch_size)
+                self.stdout.write(f'Imported {created} votes, skipped {skipped}')
+        except (bulk.BulkLoadError, KeyError, OSError) as error:
+            raise CommandError(f'Import failed: {error!r}')
+        self.stdout.write(self.style.SUCCESS('Import finished'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of products'
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('The database has no full-text index, search falls back to icontains lookups')
+        indexed = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} products'))
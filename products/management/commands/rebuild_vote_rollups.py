@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from products import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the hourly and daily vote counts of products from the votes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Range of product ids rebuilt per transaction')
+        parser.add_argument('--prune-only', action='store_true',
+                            help='Only delete hourly counts older than VOTE_ROLLUP_HOURS, run periodically')
+
+    def handle(self, *args, **options):
+        if options['prune_only']:
+            pruned = rollups.prune()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {pruned} hourly rollups'))
+        else:
+            written = rollups.rebuild(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Wrote {written} rollups'))
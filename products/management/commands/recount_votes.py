@@ -0,0 +1,57 @@
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from products import hot
+from products.bulk import counted_votes
+from products.leaderboard import leaderboard
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recomputes Product.votes_total from ProductVote rows and repairs any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of products checked per transaction')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report drifted products, do not update them')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = repaired = 0
+        last_pk = 0
+
+        while True:
+            batch = list(Product.objects
+                         .filter(pk__gt=last_pk)
+                         .order_by('pk')
+                         .annotate(votes_count=Count('productvote'))
+                         .values_list('pk', 'votes_total', 'votes_count')[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            checked += len(batch)
+
+            # The creator's own vote is counted in `votes_total` but has no ProductVote row
+            drifted = [pk for pk, votes_total, votes_count in batch if votes_total != votes_count + 1]
+            for pk in drifted:
+                self.stdout.write(f'Product {pk}: votes_total is out of sync')
+            if drifted and not options['dry_run']:
+                now = timezone.now()
+                with transaction.atomic():
+                    # Count inside the UPDATE, so votes cast since the check are not lost. The new
+                    # `updated` changes the keys of the cached pages and fragments of the products
+                    Product.objects.filter(pk__in=drifted).update(votes_total=counted_votes() + 1,
+                                                                  hot_score=hot.expression(counted_votes() + 1, now),
+                                                                  updated=now)
+                    for row in Product.objects.filter(pk__in=drifted).values_list('pk', 'votes_total', 'pub_date'):
+                        transaction.on_commit(partial(leaderboard.update, *row))
+            repaired += len(drifted)
+
+        verb = 'found' if options['dry_run'] else 'repaired'
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} products, {verb} {repaired}'))
+
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from products import hot
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the time-decayed scores of the "hot" home page, run every HOT_SCORE_REFRESH_INTERVAL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Range of product ids updated per transaction')
+
+    def handle(self, *args, **options):
+        refreshed = hot.refresh(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Refreshed the scores of {refreshed} products'))
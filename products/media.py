@@ -0,0 +1,73 @@
+"""Lifetime of the uploaded files.
+
+With `ContentAddressedStorage` one file may be shared by the icons and
+images of several products, so a file is deleted only when no product
+references it anymore. References are counted with an indexed query on
+`Product.icon` and `Product.image`. Files released by a request are deleted
+by a background task.
+"""
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from producthuntclone import tasks
+from products.images import derivative_name
+from products.models import Product
+
+logger = logging.getLogger(__name__)
+
+
+def is_referenced(name):
+    return Product.objects.filter(Q(icon=name) | Q(image=name)).exists()
+
+
+def derivative_names(name):
+    widths = set(settings.PRODUCT_ICON_WIDTHS) | set(settings.PRODUCT_IMAGE_WIDTHS)
+    return [derivative_name(name, width, webp) for width in sorted(widths) for webp in (False, True)]
+
+
+def is_recent(name):
+    """Files touched within the grace period may belong to an uncommitted product."""
+    try:
+        modified = os.path.getmtime(default_storage.path(name))
+    except FileNotFoundError:
+        return False
+    return time.time() - modified < settings.MEDIA_ORPHAN_GRACE_PERIOD
+
+
+@tasks.task
+def delete_orphans(names):
+    """Deletes the files and their derivatives unless they are still in use."""
+    deleted = []
+    for name in names:
+        if not name or is_referenced(name) or is_recent(name):
+            continue
+        for file_name in [name] + derivative_names(name):
+            default_storage.delete(file_name)
+        deleted.append(name)
+        logger.info('Deleted orphaned file %s', name)
+    return deleted
+
+
+@receiver(pre_save, sender=Product)
+def _remember_files(instance, update_fields=None, **kwargs):
+    if instance.pk and (update_fields is None or {'icon', 'image'} & set(update_fields)):
+        instance._stored_files = Product.objects.filter(pk=instance.pk).values_list('icon', 'image').first()
+
+
+@receiver(post_save, sender=Product)
+def _release_replaced_files(instance, **kwargs):
+    replaced = set(getattr(instance, '_stored_files', None) or ()) - {instance.icon.name, instance.image.name}
+    if replaced:
+        tasks.enqueue(delete_orphans, sorted(replaced))
+
+
+@receiver(post_delete, sender=Product)
+def _release_deleted_files(instance, **kwargs):
+    tasks.enqueue(delete_orphans, sorted({instance.icon.name, instance.image.name}))
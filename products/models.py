@@ -1,17 +1,45 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 
 
 class Product(models.Model):
     title = models.CharField(max_length=200)
     body = models.TextField()
     url = models.URLField()
-    icon = models.ImageField(upload_to='images/')
-    image = models.ImageField(upload_to='images/')
+    # Indexed: files are shared between products, see `products.media`
+    icon = models.ImageField(upload_to='images/', db_index=True)
+    image = models.ImageField(upload_to='images/', db_index=True)
     pub_date = models.DateTimeField()
+    # Last change of anything shown on the product pages, votes included
+    updated = models.DateTimeField(auto_now=True, db_index=True)
     votes_total = models.IntegerField(default=1)
+    # Time-decayed rank of the "hot" home page, see `products.hot`
+    hot_score = models.FloatField(default=0, editable=False)
     hunter = models.ForeignKey(User, on_delete=models.CASCADE)
     voters = models.ManyToManyField(User, through='ProductVote', related_name='product_voters')
+    # Comma separated widths of the generated derivatives, see `products.images`
+    icon_widths = models.CharField(max_length=100, blank=True, editable=False)
+    image_widths = models.CharField(max_length=100, blank=True, editable=False)
+    # Metadata of the images, so pages are rendered without opening them, see `products.images`
+    icon_width = models.PositiveIntegerField(null=True, editable=False)
+    icon_height = models.PositiveIntegerField(null=True, editable=False)
+    icon_size = models.PositiveIntegerField(null=True, editable=False)
+    icon_format = models.CharField(max_length=10, blank=True, editable=False)
+    icon_placeholder = models.TextField(blank=True, editable=False)
+    image_width = models.PositiveIntegerField(null=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, editable=False)
+    image_size = models.PositiveIntegerField(null=True, editable=False)
+    image_format = models.CharField(max_length=10, blank=True, editable=False)
+    image_placeholder = models.TextField(blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Match the home page orderings, used for keyset pagination
+            models.Index(fields=['-votes_total', '-pub_date', '-id'], name='product_ranking_idx'),
+            models.Index(fields=['-hot_score', '-id'], name='product_hot_idx'),
+            models.Index(fields=['-pub_date', '-id'], name='product_newest_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -23,6 +51,7 @@ class Product(models.Model):
 class ProductVote(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    created = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         unique_together = ['user', 'product']
@@ -32,8 +61,35 @@ class ProductVote(models.Model):
 
     @staticmethod
     def is_already_voted(user, product):
-        try:
-            ProductVote.objects.get(user=user, product=product)
-            return True
-        except ProductVote.DoesNotExist:
-            return False
+        return ProductVote.objects.filter(user=user, product=product).exists()
+
+    @staticmethod
+    def voted_product_ids(user, product_ids=None):
+        """Ids of the products the user has voted on, limited to `product_ids` if given."""
+        votes = ProductVote.objects.filter(user=user)
+        if product_ids is not None:
+            votes = votes.filter(product_id__in=product_ids)
+        return set(votes.values_list('product_id', flat=True))
+
+
+class VoteRollup(models.Model):
+    """Number of votes a product received in an hour or a day (UTC), see `products.rollups`."""
+    HOUR = 'hour'
+    DAY = 'day'
+    RESOLUTIONS = [(HOUR, 'Hour'), (DAY, 'Day')]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    resolution = models.CharField(max_length=4, choices=RESOLUTIONS)
+    # Start of the hour or the day
+    start = models.DateTimeField()
+    votes = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['product', 'resolution', 'start']
+        indexes = [
+            # Trending lists sum the rollups of a period over all products
+            models.Index(fields=['resolution', 'start', 'product', 'votes'], name='vote_rollup_period_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.votes} votes on '{self.product.title}' in the {self.resolution} of {self.start:%Y-%m-%d %H:%M}"
@@ -0,0 +1,126 @@
+"""Cache of whole rendered pages, shared by anonymous and logged-in users.
+
+A page is cached under its path, query, language and a version computed by
+the view; the versions of `products.views` change with every product
+create, vote and edit (they bump `Product.updated`), so those events make
+the cached pages unreachable without any invalidation across processes.
+
+The parts of a page that depend on the user are holes, see the `hole`
+template tag. While a page is rendered for the cache, every hole is left
+as a marker; each request then fills the markers by rendering the hole's
+small template for its own user, so one cached page serves everyone.
+Holes are filled for anonymous users too: the language forms carry the
+CSRF token of the visitor.
+"""
+import base64
+import hashlib
+import json
+import re
+from functools import wraps
+
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils import translation
+from django.utils.safestring import mark_safe
+
+CACHE_ALIAS = 'pages'
+
+_HITS_KEY = 'page-stats:hits'
+_MISSES_KEY = 'page-stats:misses'
+
+# Autoescaping keeps user content from producing such a comment
+_MARKER = re.compile(r'<!--hole:([A-Za-z0-9_=-]+)-->')
+
+# Template name -> function(request, **params) returning the context of the hole
+_hole_contexts = {}
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def hole_context(template_name):
+    """Registers the function computing the context of a hole template from its parameters."""
+    def decorator(function):
+        _hole_contexts[template_name] = function
+        return function
+    return decorator
+
+
+def render_hole(request, template_name, params):
+    context = dict(params)
+    if template_name in _hole_contexts:
+        context.update(_hole_contexts[template_name](request, **params))
+    return render_to_string(template_name, context, request=request)
+
+
+def hole(request, template_name, params):
+    """The hole as rendered into a page: a marker while the page is being cached."""
+    if getattr(request, '_page_cache_holes', False):
+        data = base64.urlsafe_b64encode(json.dumps([template_name, params]).encode()).decode()
+        return mark_safe(f'<!--hole:{data}-->')
+    return render_hole(request, template_name, params)
+
+
+def fill(content, request):
+    def render(match):
+        template_name, params = json.loads(base64.urlsafe_b64decode(match.group(1)))
+        return render_hole(request, template_name, params)
+    return _MARKER.sub(render, content)
+
+
+def cached_page(version_func):
+    """Serves GET requests of the view from the cache.
+
+    `version_func(request, *args, **kwargs)` returns the version of the page,
+    or None to leave the request to the view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+            version = version_func(request, *args, **kwargs)
+            if version is None:
+                return view(request, *args, **kwargs)
+
+            key = _page_key(request, version)
+            content = get_cache().get(key)
+            if content is not None:
+                _count(_HITS_KEY)
+                return HttpResponse(fill(content, request))
+
+            _count(_MISSES_KEY)
+            request._page_cache_holes = True
+            try:
+                response = view(request, *args, **kwargs)
+                if hasattr(response, 'render'):
+                    response.render()
+            finally:
+                request._page_cache_holes = False
+            if response.status_code != 200 or response.streaming:
+                return response
+            content = response.content.decode(response.charset)
+            get_cache().set(key, content)
+            response.content = fill(content, request)
+            return response
+        return wrapper
+    return decorator
+
+
+def stats():
+    counters = get_cache().get_many([_HITS_KEY, _MISSES_KEY])
+    return {'hits': counters.get(_HITS_KEY, 0), 'misses': counters.get(_MISSES_KEY, 0)}
+
+
+def _page_key(request, version):
+    path = hashlib.md5(f'{request.get_full_path()}:{version}'.encode()).hexdigest()
+    return f'page:{translation.get_language()}:{path}'
+
+
+def _count(key):
+    try:
+        get_cache().incr(key)
+    except ValueError:
+        get_cache().set(key, 1, timeout=None)
@@ -0,0 +1,128 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    """Page of a keyset paginated queryset.
+
+    Mimics the part of `django.core.paginator.Page` used by templates
+    (iteration, `has_next`, `has_previous`) but knows nothing about the total
+    number of objects, so it never needs a COUNT query.
+    """
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+class KeysetPaginator:
+    """Seek pagination over a queryset ordered by a unique key.
+
+    `ordering` is a sequence of field names in `order_by` notation
+    (e.g. `('-votes_total', '-pub_date', '-pk')`), the last one must make
+    the ordering total. Every page is fetched with a `WHERE (key) < (cursor)`
+    condition and a `LIMIT`, so deep pages cost the same as the first one.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+
+    def page(self, cursor):
+        direction, values = self.decode(cursor)
+        condition = self._seek_condition(values, reverse=direction == PREVIOUS)
+        ordering = self.ordering if direction == NEXT else self._reversed_ordering()
+        rows = list(self.queryset.filter(condition).order_by(*ordering)[:self.per_page + 1])
+
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == NEXT:
+            return KeysetPage(rows, has_next=has_more, has_previous=True)
+        rows.reverse()
+        return KeysetPage(rows, has_next=True, has_previous=has_more)
+
+    def cursor_after(self, obj):
+        return self.encode(NEXT, self._key(obj))
+
+    def cursor_before(self, obj):
+        return self.encode(PREVIOUS, self._key(obj))
+
+    def encode(self, direction, values):
+        raw = json.dumps([direction] + list(values), default=_isoformat, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, *raw_values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        except (TypeError, ValueError):
+            raise InvalidCursor(cursor)
+        if direction not in (NEXT, PREVIOUS) or len(raw_values) != len(self.ordering):
+            raise InvalidCursor(cursor)
+        try:
+            values = [self._field(name).to_python(value) for name, value in zip(self._names(), raw_values)]
+        except ValidationError:
+            raise InvalidCursor(cursor)
+        if any(value is None for value in values):
+            raise InvalidCursor(cursor)
+        return direction, values
+
+    def _seek_condition(self, values, reverse):
+        condition = Q()
+        for i, name in enumerate(self._names()):
+            descending = self.ordering[i].startswith('-')
+            lookup = 'gt' if descending == reverse else 'lt'
+            equal = {prev_name: values[j] for j, prev_name in enumerate(self._names()[:i])}
+            condition |= Q(**equal, **{f'{name}__{lookup}': values[i]})
+        return condition
+
+    def _reversed_ordering(self):
+        return tuple(name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering)
+
+    def _names(self):
+        return [name.lstrip('-') for name in self.ordering]
+
+    def _field(self, name):
+        meta = self.queryset.model._meta
+        return meta.pk if name == 'pk' else meta.get_field(name)
+
+    def _key(self, obj):
+        return [getattr(obj, name) for name in self._names()]
+
+
+def _isoformat(value):
+    # Unlike DjangoJSONEncoder keeps microseconds: cursors must be exact
+    return value.isoformat()
@@ -0,0 +1,163 @@
+"""Per-product vote counts by hour and by day.
+
+Answering "votes in the last 24 hours" or drawing a trend from `ProductVote`
+would read every vote of a product, and a trending list every vote of the
+period. Instead each vote adds 1 to the `VoteRollup` rows of its hour and
+its day, in the transaction that inserts it, and the stats of the detail
+page and the trending list read only those rows. Hours and days are UTC.
+
+Bulk loads insert votes without touching the rollups and rebuild them
+afterwards. `manage.py rebuild_vote_rollups` does the same for all
+products, e.g. after votes were deleted, and prunes old hourly rows.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from products.models import Product, ProductVote, VoteRollup
+
+# Days in the trend of the detail page
+TREND_DAYS = 14
+TRENDING_DAYS = 7
+TRENDING_SIZE = 20
+
+
+def truncate(time, resolution):
+    time = time.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return time.replace(hour=0) if resolution == VoteRollup.DAY else time
+
+
+def current_hour():
+    return truncate(timezone.now(), VoteRollup.HOUR)
+
+
+def add(votes):
+    """Counts votes, given as (product_id, time) pairs, in the rollups of their hours and days."""
+    add_counts(count(votes))
+
+
+def count(votes, counts=None):
+    """Adds votes, given as (product_id, time) pairs, to a Counter of rollup keys.
+
+    Hours older than `VOTE_ROLLUP_HOURS` are skipped, as `prune` would delete them.
+    """
+    first_hour = _first_hour()
+    counts = Counter() if counts is None else counts
+    for product_id, time in votes:
+        hour = truncate(time, VoteRollup.HOUR)
+        if hour >= first_hour:
+            counts[product_id, VoteRollup.HOUR, hour] += 1
+        counts[product_id, VoteRollup.DAY, hour.replace(hour=0)] += 1
+    return counts
+
+
+def add_counts(counts):
+    """Adds the result of `count` to the rollups.
+
+    One statement inserts the missing rows and increments the existing ones.
+    """
+    if not counts:
+        return
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {quote(VoteRollup._meta.db_table)} '
+            f'({quote("product_id")}, {quote("resolution")}, {quote("start")}, {quote("votes")}) '
+            f'VALUES (%s, %s, %s, %s) '
+            f'ON CONFLICT ({quote("product_id")}, {quote("resolution")}, {quote("start")}) '
+            f'DO UPDATE SET {quote("votes")} = {quote("votes")} + excluded.{quote("votes")}',
+            # Sorted, the unique index is updated in order
+            [(product_id, resolution, connection.ops.adapt_datetimefield_value(start), votes)
+             for (product_id, resolution, start), votes in sorted(counts.items())])
+
+
+def product_stats(product_id, now=None):
+    """Votes of the last 24 hours and 7 days and the daily trend of a product, with one query."""
+    now = now or timezone.now()
+    first_hour = truncate(now, VoteRollup.HOUR) - timedelta(hours=23)
+    first_day = truncate(now, VoteRollup.DAY) - timedelta(days=TREND_DAYS - 1)
+    rows = (VoteRollup.objects
+            .filter(product_id=product_id)
+            .filter(Q(resolution=VoteRollup.HOUR, start__gte=first_hour) |
+                    Q(resolution=VoteRollup.DAY, start__gte=first_day))
+            .values_list('resolution', 'start', 'votes'))
+
+    last_day = 0
+    daily = {}
+    for resolution, start, votes in rows:
+        if resolution == VoteRollup.HOUR:
+            last_day += votes
+        else:
+            daily[start] = votes
+    trend = [(day, daily.get(day, 0)) for day in (first_day + timedelta(days=i) for i in range(TREND_DAYS))]
+    return {
+        'last_day': last_day,
+        'last_week': sum(votes for _, votes in trend[-7:]),
+        'trend': trend,
+        'peak': max(votes for _, votes in trend),
+    }
+
+
+def trending(days=TRENDING_DAYS, limit=TRENDING_SIZE, now=None):
+    """Products with the most votes in the last `days` days (today included), as (product, votes)."""
+    first_day = truncate(now or timezone.now(), VoteRollup.DAY) - timedelta(days=days - 1)
+    rows = list(VoteRollup.objects
+                .filter(resolution=VoteRollup.DAY, start__gte=first_day)
+                .values('product')
+                .annotate(total=Sum('votes'))
+                .order_by('-total', '-product')
+                .values_list('product', 'total')[:limit])
+    products = Product.objects.in_bulk([product_id for product_id, _ in rows])
+    return [(products[product_id], total) for product_id, total in rows if product_id in products]
+
+
+def rebuild(product_ids=None, batch_size=1000):
+    """Recomputes the rollups of `product_ids`, or of all products, from the votes.
+
+    Works through ranges of product ids, one transaction each. Hourly rows
+    are kept for `VOTE_ROLLUP_HOURS` hours. Returns the number of rows written.
+    """
+    if product_ids is None:
+        last_pk = Product.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+        batches = (Q(product_id__gt=start, product_id__lte=start + batch_size)
+                   for start in range(0, last_pk, batch_size))
+    else:
+        product_ids = sorted(product_ids)
+        batches = (Q(product_id__in=product_ids[start:start + batch_size])
+                   for start in range(0, len(product_ids), batch_size))
+
+    first_hour = _first_hour()
+    written = 0
+    for products in batches:
+        with transaction.atomic():
+            VoteRollup.objects.filter(products).delete()
+            rollups = []
+            for resolution, trunc, votes in (
+                    (VoteRollup.HOUR, TruncHour, ProductVote.objects.filter(products, created__gte=first_hour)),
+                    (VoteRollup.DAY, TruncDay, ProductVote.objects.filter(products))):
+                counts = (votes
+                          .annotate(start=trunc('created', tzinfo=timezone.utc))
+                          .order_by()
+                          .values('product_id', 'start')
+                          .annotate(votes=Count('pk'))
+                          .values_list('product_id', 'start', 'votes'))
+                rollups.extend(VoteRollup(product_id=product_id, resolution=resolution, start=start, votes=count)
+                               for product_id, start, count in counts)
+            VoteRollup.objects.bulk_create(rollups)
+            written += len(rollups)
+    return written
+
+
+def prune():
+    """Deletes the hourly rollups older than `VOTE_ROLLUP_HOURS`, returns how many."""
+    deleted, _ = VoteRollup.objects.filter(resolution=VoteRollup.HOUR, start__lt=_first_hour()).delete()
+    return deleted
+
+
+def _first_hour():
+    return current_hour() - timedelta(hours=settings.VOTE_ROLLUP_HOURS - 1)
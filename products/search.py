@@ -0,0 +1,159 @@
+"""Full-text search over the English and Russian titles and bodies.
+
+On SQLite the texts are indexed in the FTS5 table `products_search`, whose
+rowid is the product id. The `unicode61` tokenizer folds the case of Latin
+and Cyrillic letters alike (and `ё` to `е`), prefix indexes make the
+prefix queries of autocomplete cheap. Results are ranked by bm25, with
+title matches weighted higher, boosted by the logarithm of the product's
+votes. The index is updated in the transaction that saves or deletes a
+product; `manage.py rebuild_search_index` rebuilds it from scratch.
+
+Other databases fall back to `icontains` lookups ordered by votes.
+"""
+import math
+import re
+
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from products.models import Product
+
+TABLE = 'products_search'
+FIELDS = ('title_en', 'title_ru', 'body_en', 'body_ru')
+# bm25 weight of every column in FIELDS
+COLUMN_WEIGHTS = (10.0, 10.0, 1.0, 1.0)
+# How much the votes lift a match: the bm25 score is multiplied by 1 + VOTES_WEIGHT * ln(1 + votes)
+VOTES_WEIGHT = 0.1
+
+_TOKEN = re.compile(r'\w+')
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query, columns=None):
+    """Builds an FTS5 query in which every word of `query` is a required prefix.
+
+    Words are quoted, so operators typed by users are searched as text.
+    """
+    terms = ' '.join(f'"{token}"*' for token in _TOKEN.findall(query.lower()))
+    if not terms or columns is None:
+        return terms
+    return f'{{{" ".join(columns)}}} : ({terms})'
+
+
+class SearchResults:
+    """Ranked products matching `query`, a sequence usable with `Paginator`."""
+
+    def __init__(self, query):
+        self.query = query
+        self.match = match_expression(query)
+
+    def count(self):
+        if not self.match:
+            return 0
+        if not is_available():
+            return _fallback(self.query).count()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {TABLE} WHERE {TABLE} MATCH %s', [self.match])
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        if not self.match or stop <= start:
+            return []
+        if not is_available():
+            return list(_fallback(self.query)[start:stop])
+
+        weights = ', '.join(map(str, COLUMN_WEIGHTS))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT s.rowid FROM {TABLE} s JOIN {Product._meta.db_table} p ON p.id = s.rowid '
+                f'WHERE {TABLE} MATCH %s '
+                f'ORDER BY bm25({TABLE}, {weights}) * (1 + %s * search_log1p(p.votes_total)), s.rowid '
+                f'LIMIT %s OFFSET %s', [self.match, VOTES_WEIGHT, stop - start, start])
+            ids = [row[0] for row in cursor.fetchall()]
+        products = Product.objects.in_bulk(ids)
+        return [products[pk] for pk in ids if pk in products]
+
+
+def suggest(query, limit=8):
+    """Titles starting with the words of `query`, best matches first, as (id, title_en, title_ru)."""
+    if not is_available():
+        return list(Product.objects
+                    .filter(Q(title_en__istartswith=query) | Q(title_ru__istartswith=query))
+                    .order_by('-votes_total')
+                    .values_list('pk', 'title_en', 'title_ru')[:limit])
+    match = match_expression(query, columns=('title_en', 'title_ru'))
+    if not match:
+        return []
+    with connection.cursor() as cursor:
+        # Only the FTS table is read: no join, no ranking by votes
+        cursor.execute(f'SELECT rowid, title_en, title_ru FROM {TABLE} WHERE {TABLE} MATCH %s '
+                       f'ORDER BY rank LIMIT %s', [match, limit])
+        return cursor.fetchall()
+
+
+def index_products(queryset):
+    """(Re)indexes the products of `queryset` with one statement per step."""
+    if not is_available():
+        return
+    query, params = queryset.order_by().values_list('pk').query.sql_with_params()
+    columns = ', '.join(FIELDS)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid IN ({query})', params)
+        cursor.execute(f'INSERT INTO {TABLE} (rowid, {columns}) '
+                       f'SELECT id, {columns} FROM {Product._meta.db_table} WHERE id IN ({query})', params)
+
+
+def rebuild():
+    """Indexes all products anew, returns their number."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+    index_products(Product.objects.all())
+    with connection.cursor() as cursor:
+        # Merges the index segments written by the inserts
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {TABLE}')
+        return cursor.fetchone()[0]
+
+
+def _fallback(query):
+    condition = Q()
+    for token in _TOKEN.findall(query):
+        condition &= Q(title_en__icontains=token) | Q(title_ru__icontains=token) | \
+                     Q(body_en__icontains=token) | Q(body_ru__icontains=token)
+    return Product.objects.filter(condition).order_by('-votes_total', '-pk')
+
+
+@receiver(connection_created)
+def _prepare_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    connection.connection.create_function('search_log1p', 1, math.log1p, deterministic=True)
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+                       f"{', '.join(FIELDS)}, tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+
+
+@receiver(post_save, sender=Product)
+def _index_saved(instance, update_fields=None, **kwargs):
+    # `title` and `body` are the translated fields of modeltranslation
+    if update_fields is None or (set(FIELDS) | {'title', 'body'}) & set(update_fields):
+        index_products(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Product)
+def _remove_deleted(instance, **kwargs):
+    if is_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [instance.pk])
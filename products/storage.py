@@ -0,0 +1,67 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+_HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{62}(_\d+w)?\.\w+$')
+
+
+def is_content_addressed(name):
+    """Whether the file `name` can never change, so it may be cached forever."""
+    return bool(_HASHED_NAME.search(name))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Stores files under the SHA-256 of their content.
+
+    `images/logo.png` is saved as `images/3f/a4...e1.png`: uploading the same
+    content twice stores it once, and a URL always refers to the same bytes.
+    The content is hashed while it is written to a temporary file, which is
+    then renamed to its final name. Uploads streamed by
+    `products.uploads.ImageUploadHandler` are already such a file.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The name is derived from the content, colliding names are the same file
+        return name
+
+    def _save(self, name, content):
+        os.makedirs(self.location, exist_ok=True)
+        if getattr(content, 'sha256', None) and self._is_local(content.temporary_file_path()):
+            digest, temp_path = content.sha256, content.temporary_file_path()
+        else:
+            digest, temp_path = self._spool(content)
+        try:
+            directory, client_name = os.path.split(name)
+            extension = os.path.splitext(client_name)[1].lower()
+            name = os.path.join(directory, digest[:2], digest[2:] + extension)
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                # Marks the file as in use again, see `products.media.delete_orphans`
+                os.utime(full_path)
+                return name.replace('\\', '/')
+
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            os.replace(temp_path, full_path)
+            if self.file_permissions_mode is not None:
+                os.chmod(full_path, self.file_permissions_mode)
+            return name.replace('\\', '/')
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _is_local(self, path):
+        # Renamed only within the file system of the storage
+        return os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.location)
+
+    def _spool(self, content):
+        """Copies `content` next to the final location, returns its hash and the copy's path."""
+        sha256 = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=self.location, prefix='.upload-')
+        with os.fdopen(fd, 'wb') as temp_file:
+            for chunk in content.chunks():
+                sha256.update(chunk)
+                temp_file.write(chunk)
+        return sha256.hexdigest(), temp_path
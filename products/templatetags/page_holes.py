@@ -0,0 +1,16 @@
+from django import template
+
+from products import page_cache
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, template_name, **params):
+    """Renders a part of a page that depends on the user, see `products.page_cache`.
+
+    Parameters are passed to the template and must be JSON serializable::
+
+        {% hole 'products/upvote_button.html' product_id=product.pk %}
+    """
+    return page_cache.hole(context.get('request'), template_name, params)
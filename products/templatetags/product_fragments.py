@@ -0,0 +1,38 @@
+from django import template
+
+from products import fragments
+
+register = template.Library()
+
+
+@register.tag
+def productfragment(parser, token):
+    """Caches the enclosed part of a template per product, see `products.fragments`.
+
+    Usage::
+
+        {% productfragment 'home-row' product %}
+            ...
+        {% endproductfragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name and a product")
+    nodelist = parser.parse(('endproductfragment',))
+    parser.delete_first_token()
+    return ProductFragmentNode(nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]))
+
+
+class ProductFragmentNode(template.Node):
+    def __init__(self, nodelist, name, product):
+        self.nodelist = nodelist
+        self.name = name
+        self.product = product
+
+    def render(self, context):
+        key = fragments.fragment_key(self.name.resolve(context), self.product.resolve(context))
+        content = fragments.get_fragment(key)
+        if content is None:
+            content = self.nodelist.render(context)
+            fragments.set_fragment(key, content)
+        return content
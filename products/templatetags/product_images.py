@@ -0,0 +1,36 @@
+from django import template
+
+from products.images import SQUARE_FIELDS, derivative_name, webp_supported
+
+register = template.Library()
+
+
+@register.inclusion_tag('products/responsive_image.html')
+def responsive_image(product, field, sizes, css_class='', loading='lazy'):
+    """Renders `<picture>` with `srcset`s of the derivatives of `product.<field>`.
+
+    Until the derivatives are generated only the original is referenced.
+    The stored metadata size the `<img>` and fill it with the placeholder
+    while it loads; the file itself is never opened.
+    """
+    image = getattr(product, field)
+    widths = [int(width) for width in getattr(product, f'{field}_widths').split(',') if width]
+    width, height = getattr(product, f'{field}_width'), getattr(product, f'{field}_height')
+    if width and height and widths and field in SQUARE_FIELDS:
+        # The derivatives are cut square
+        width = height = min(width, height)
+    return {
+        'src': image.url,
+        'srcset': _srcset(image, widths, webp=False),
+        'webp_srcset': _srcset(image, widths, webp=True) if webp_supported() else '',
+        'sizes': sizes,
+        'css_class': css_class,
+        'loading': loading,
+        'width': width,
+        'height': height,
+        'placeholder': getattr(product, f'{field}_placeholder'),
+    }
+
+
+def _srcset(image, widths, webp):
+    return ', '.join(f'{image.storage.url(derivative_name(image.name, width, webp))} {width}w' for width in widths)
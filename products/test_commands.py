@@ -0,0 +1,280 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db.models import F, Sum
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from producthuntclone.test_utils import *
+from products import bulk, hot
+from products.leaderboard import leaderboard
+from products.models import Product, ProductVote, VoteRollup
+
+
+class RecountVotesTests(TestCase):
+    def setUp(self):
+        create_test_user_with_endpoint(self.client)
+        create_test_products_in_range(self.client, 3)
+        self.voter = User.objects.create_user('voter', password='voter')
+
+    def recount(self, *args):
+        call_command('recount_votes', *args, stdout=StringIO())
+
+    def test_drifted_votes_total_is_repaired(self):
+        product = Product.objects.get(title='title1')
+        ProductVote.objects.create(user=self.voter, product=product)
+        Product.objects.filter(pk=product.pk).update(votes_total=10)
+
+        self.recount('--batch-size', '2')
+        product.refresh_from_db()
+        self.assertEqual(product.votes_total, 2)
+
+    def test_repaired_products_are_updated_and_ranked_again(self):
+        product = Product.objects.get(title='title1')
+        Product.objects.filter(pk=product.pk).update(votes_total=10)
+        leaderboard.rebuild()
+        self.addCleanup(leaderboard.clear)
+        self.assertEqual(leaderboard.ids(0, 1), [product.pk])
+
+        self.recount()
+        run_on_commit_callbacks()
+        self.assertGreater(Product.objects.get(pk=product.pk).updated, product.updated)
+        self.assertNotEqual(leaderboard.ids(0, 1), [product.pk])
+
+    def test_products_without_votes_are_reset_to_creator_vote(self):
+        Product.objects.update(votes_total=0)
+
+        self.recount()
+        self.assertEqual(set(Product.objects.values_list('votes_total', flat=True)), {1})
+
+    def test_dry_run_does_not_update(self):
+        Product.objects.filter(title='title0').update(votes_total=7)
+
+        self.recount('--dry-run')
+        self.assertEqual(Product.objects.get(title='title0').votes_total, 7)
+
+
+class RefreshHotScoresTests(TestCase):
+    def setUp(self):
+        create_test_user_with_endpoint(self.client)
+        create_test_products_in_range(self.client, 3)
+        Product.objects.update(pub_date=timezone.now() - timedelta(hours=5))
+        Product.objects.filter(title='title1').update(votes_total=4, hot_score=100)
+
+    def test_stale_scores_are_recomputed(self):
+        call_command('refresh_hot_scores', '--batch-size', '1', stdout=StringIO())
+
+        product = Product.objects.get(title='title1')
+        self.assertAlmostEqual(product.hot_score, hot.score(4, product.pub_date), places=6)
+        self.assertAlmostEqual(product.hot_score, 3 / 7 ** settings.HOT_SCORE_GRAVITY, places=6)
+
+    def test_products_without_votes_are_skipped(self):
+        self.assertEqual(hot.refresh(), 1)
+        self.assertEqual(set(Product.objects.exclude(title='title1').values_list('hot_score', flat=True)), {0})
+
+    def test_portable_expression_matches_score(self):
+        # The expression used on databases without the `hot_score()` function
+        Product.objects.update(hot_score=hot._portable_expression(F('votes_total'), timezone.now()))
+
+        product = Product.objects.get(title='title1')
+        self.assertAlmostEqual(product.hot_score, 3 / 7 ** settings.HOT_SCORE_GRAVITY, places=6)
+        self.assertEqual(Product.objects.get(title='title0').hot_score, 0)
+
+    def test_recount_updates_hot_score(self):
+        call_command('recount_votes', stdout=StringIO())
+        self.assertEqual(Product.objects.get(title='title1').hot_score, 0)
+
+
+class ExportDataTests(TestCase):
+    def setUp(self):
+        create_test_user_with_endpoint(self.client)
+        create_test_products_in_range(self.client, 3)
+        self.voter = User.objects.create_user('voter', password='voter')
+        self.first, self.second, self.third = Product.objects.order_by('pk')
+        ProductVote.objects.create(user=self.voter, product=self.first)
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('export_data', *args, stdout=out)
+        return out.getvalue()
+
+    def test_products_as_csv(self):
+        lines = list(csv.reader(self.export('products').splitlines()))
+        self.assertEqual(lines[0][:5], ['id', 'title_en', 'title_ru', 'body_en', 'body_ru'])
+        self.assertEqual([int(line[0]) for line in lines[1:]], [self.first.pk, self.second.pk, self.third.pk])
+        self.assertEqual(lines[1][-1], 'test')
+
+    def test_votes_as_jsonl(self):
+        rows = [json.loads(line) for line in self.export('votes', '--format=jsonl').splitlines()]
+        vote = ProductVote.objects.get()
+        self.assertEqual(rows, [{'id': vote.pk, 'user_id': self.voter.pk, 'user': 'voter',
+                                 'product_id': self.first.pk, 'created': vote.created.isoformat()}])
+
+    def test_after_id_continues_an_export(self):
+        rows = self.export('products', '--format=jsonl', f'--after-id={self.first.pk}').splitlines()
+        self.assertEqual([json.loads(row)['id'] for row in rows], [self.second.pk, self.third.pk])
+
+    def test_since_limits_products_to_updated_ones(self):
+        Product.objects.filter(pk=self.second.pk).update(updated=timezone.now() + timedelta(days=1))
+        since = (timezone.now() + timedelta(hours=1)).isoformat()
+        rows = self.export('products', '--format=jsonl', f'--since={since}').splitlines()
+        self.assertEqual([json.loads(row)['id'] for row in rows], [self.second.pk])
+
+    def test_gzipped_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'hunters.jsonl.gz')
+            call_command('export_data', 'hunters', '--format=jsonl', '--gzip', f'--output={path}', stderr=StringIO())
+            with gzip.open(path, 'rt') as file:
+                self.assertEqual([json.loads(line)['username'] for line in file], ['test'])
+
+    def test_since_limits_votes_to_recent_ones(self):
+        ProductVote.objects.update(created=timezone.now() - timedelta(days=2))
+        recent = ProductVote.objects.create(user=self.voter, product=self.second)
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        rows = self.export('votes', '--format=jsonl', f'--since={since}').splitlines()
+        self.assertEqual([json.loads(row)['id'] for row in rows], [recent.pk])
+
+    def test_since_is_rejected_for_hunters(self):
+        with self.assertRaises(CommandError):
+            self.export('hunters', '--since=2019-01-01')
+
+
+class BulkLoadTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+
+class ImportDataTests(BulkLoadTestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = self.write('users.csv', 'username,email,password\nann,ann@example.com,secret\nbob,,secret\n')
+        self.products = self.write('products.jsonl', '\n'.join(json.dumps(record) for record in [
+            {'id': 10, 'hunter': 'ann', 'title_en': 'Tool', 'title_ru': 'Инструмент',
+             'body_en': 'A tool', 'body_ru': 'Инструмент', 'url': 'http://example.com'},
+            {'id': 11, 'hunter': 'nobody', 'title_en': 'Lost', 'body_en': 'Lost', 'url': 'http://example.com'},
+        ]))
+        self.votes = self.write('votes.csv', 'user,product_id\nbob,10\nbob,10\nann,10\nbob,11\n')
+
+    def load(self, *args):
+        call_command('import_data', *args, stdout=StringIO())
+
+    def test_everything_is_imported(self):
+        self.load(f'--users={self.users}', f'--products={self.products}', f'--votes={self.votes}')
+
+        self.assertTrue(User.objects.get(username='ann').check_password('secret'))
+        product = Product.objects.get()
+        self.assertEqual((product.pk, product.title_en, product.title_ru), (10, 'Tool', 'Инструмент'))
+        self.assertTrue(product.icon.storage.exists(product.icon.name))
+        # Bob's vote once, Ann's on her own product is dropped
+        self.assertEqual(ProductVote.objects.get().user.username, 'bob')
+        self.assertEqual(product.votes_total, 2)
+
+    def test_vote_times_are_imported_into_rollups(self):
+        votes = self.write('votes.jsonl', json.dumps({'user': 'bob', 'product_id': 10,
+                                                      'created': '2019-06-01T12:30:00+00:00'}))
+        self.load(f'--users={self.users}', f'--products={self.products}', f'--votes={votes}')
+
+        self.assertEqual(ProductVote.objects.get().created.isoformat(), '2019-06-01T12:30:00+00:00')
+        rollup = VoteRollup.objects.get()
+        self.assertEqual((rollup.resolution, rollup.start.isoformat(), rollup.votes),
+                         (VoteRollup.DAY, '2019-06-01T00:00:00+00:00', 1))
+
+    def test_import_can_be_repeated(self):
+        for _ in range(2):
+            self.load(f'--users={self.users}', f'--products={self.products}', f'--votes={self.votes}')
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(Product.objects.get().votes_total, 2)
+
+    def test_created_rows_are_counted(self):
+        self.assertEqual(bulk.import_users(bulk.read_records(self.users)), 2)
+        self.assertEqual(bulk.import_products(bulk.read_records(self.products)), (1, 1))
+        self.assertEqual(bulk.import_votes(bulk.read_records(self.votes)), (1, 3))
+
+        self.assertEqual(bulk.import_users(bulk.read_records(self.users)), 0)
+        self.assertEqual(bulk.import_products(bulk.read_records(self.products)), (0, 1))
+        self.assertEqual(bulk.import_votes(bulk.read_records(self.votes)), (0, 4))
+
+    def test_products_share_the_placeholder_file(self):
+        self.load(f'--users={self.users}')
+        products = self.write('more.csv', 'hunter,title_en,body_en,url\nann,A,a,http://a.com\nbob,B,b,http://b.com\n')
+        self.load(f'--products={products}')
+        self.assertEqual(len(set(Product.objects.values_list('icon', flat=True))), 1)
+
+    def test_placeholder_metadata_is_stored(self):
+        self.load(f'--users={self.users}', f'--products={self.products}')
+        product = Product.objects.get()
+        self.assertEqual((product.image_width, product.image_height, product.image_format), (1440, 960, 'PNG'))
+        self.assertTrue(product.image_placeholder.startswith('data:image/jpeg;base64,'))
+
+    def test_nothing_to_import(self):
+        with self.assertRaises(CommandError):
+            self.load()
+
+
+class GenerateDataTests(BulkLoadTestCase):
+    def test_synthetic_data_is_consistent(self):
+        call_command('generate_data', '--users=20', '--products=10', '--votes=150', '--seed=1', stdout=StringIO())
+
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Product.objects.count(), 10)
+        self.assertGreater(ProductVote.objects.count(), 100)
+        self.assertFalse(ProductVote.objects.filter(product__hunter=F('user')).exists())
+        out = StringIO()
+        call_command('recount_votes', '--dry-run', stdout=out)
+        self.assertIn('found 0', out.getvalue())
+        daily = VoteRollup.objects.filter(resolution=VoteRollup.DAY).aggregate(votes=Sum('votes'))['votes']
+        self.assertEqual(daily, ProductVote.objects.count())
+
+    def test_more_votes_than_possible(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_data', '--users=2', '--products=2', '--votes=5', stdout=StringIO())
+
+
+class BackfillImageMetadataTests(BulkLoadTestCase):
+    def setUp(self):
+        super().setUp()
+        create_test_user_with_endpoint(self.client)
+        create_test_products_in_range(self.client, 3)
+
+    def backfill(self, *args):
+        out = StringIO()
+        call_command('backfill_image_metadata', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_missing_metadata_is_stored(self):
+        self.assertIn('Updated 3 products', self.backfill('--batch-size=2'))
+        for product in Product.objects.all():
+            self.assertEqual((product.icon_width, product.icon_height, product.icon_format), (1, 1, 'PNG'))
+            self.assertEqual(product.image_size, product.image.size)
+            self.assertTrue(product.icon_placeholder.startswith('data:image/jpeg;base64,'))
+
+    def test_complete_products_are_skipped(self):
+        self.backfill()
+        self.assertIn('Updated 0 products', self.backfill())
+        self.assertIn('Updated 3 products', self.backfill('--all'))
+
+    def test_unreadable_files_are_reported(self):
+        product = Product.objects.first()
+        os.remove(product.icon.path)
+        self.assertIn('Updated 0 products, 6 files could not be read', self.backfill())
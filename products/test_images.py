@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+
+from django.core.files import File
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from producthuntclone import tasks
+from producthuntclone.test_utils import *
+from products.images import derivative_name, describe, process_image, render_derivatives
+from products.models import Product
+
+
+class RenderDerivativesTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'image.png')
+        Image.new('RGB', (600, 400), 'red').save(self.path)
+
+    def test_square_derivatives_are_not_upscaled(self):
+        widths = render_derivatives(self.path, (64, 256, 512), square=True)
+        self.assertEqual(widths, [64, 256])
+        with Image.open(derivative_name(self.path, 256)) as derivative:
+            self.assertEqual(derivative.size, (256, 256))
+        self.assertFalse(os.path.exists(derivative_name(self.path, 512)))
+
+    def test_derivatives_keep_aspect_ratio(self):
+        widths = render_derivatives(self.path, (300, 480, 960), square=False)
+        self.assertEqual(widths, [300, 480])
+        with Image.open(derivative_name(self.path, 300)) as derivative:
+            self.assertEqual(derivative.size, (300, 200))
+
+    def test_jpeg_derivatives_stay_jpeg(self):
+        path = os.path.join(self.directory, 'photo.jpeg')
+        Image.new('RGB', (600, 400), 'red').save(path, 'JPEG')
+
+        render_derivatives(path, (300,), square=False)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'photo_300w.jpg')))
+
+    def test_placeholder_is_rendered_with_the_derivatives(self):
+        widths, placeholder = process_image(self.path, (300,), square=False)
+        self.assertEqual(widths, [300])
+        self.assertTrue(placeholder.startswith('data:image/jpeg;base64,'))
+        self.assertLess(len(placeholder), 1000)
+
+
+class DescribeTests(TestCase):
+    def test_metadata_is_read_from_the_header(self):
+        upload = test_image(content=png(30, 20))
+        self.assertEqual(describe(upload), {'width': 30, 'height': 20, 'size': upload.size, 'format': 'PNG'})
+
+    def test_exif_orientation_swaps_the_dimensions(self):
+        path = os.path.join(tempfile.mkdtemp(), 'photo.jpeg')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        Image.new('RGB', (30, 20)).save(path, 'JPEG', exif=exif.tobytes())
+        with open(path, 'rb') as file:
+            self.assertEqual(describe(File(file))['width'], 20)
+
+
+class ResponsiveImageTests(TestCase):
+    def setUp(self):
+        # The worker writes derivatives next to the uploads
+        media_root = tempfile.mkdtemp()
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, media_root)
+        create_test_user_with_endpoint(self.client)
+        self.product = create_test_product(self.client)
+
+    def test_original_is_used_until_derivatives_are_generated(self):
+        response = self.client.get(reverse('detail', args=(self.product.pk,)))
+        self.assertContains(response, f'src="{self.product.image.url}"')
+        self.assertNotContains(response, 'srcset')
+
+    def test_srcset_lists_generated_widths(self):
+        Product.objects.filter(pk=self.product.pk).update(image_widths='480,960')
+
+        response = self.client.get(reverse('detail', args=(self.product.pk,)))
+        root = os.path.splitext(self.product.image.url)[0]
+        self.assertContains(response, f'srcset="{root}_480w.png 480w, {root}_960w.png 960w"')
+
+    def test_home_icons_are_lazy_loaded(self):
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_images_are_sized_and_have_placeholders(self):
+        Product.objects.filter(pk=self.product.pk).update(image_width=1200, image_height=800,
+                                                          image_placeholder='data:image/jpeg;base64,AAAA')
+
+        response = self.client.get(reverse('detail', args=(self.product.pk,)))
+        self.assertContains(response, 'width="1200" height="800"')
+        self.assertContains(response, 'url(data:image/jpeg;base64,AAAA)')
+
+    def test_square_icons_are_sized_as_their_derivatives(self):
+        Product.objects.filter(pk=self.product.pk).update(icon_width=300, icon_height=200, icon_widths='64')
+
+        response = self.client.get(reverse('detail', args=(self.product.pk,)))
+        self.assertContains(response, 'width="200" height="200"')
+
+    def test_created_product_carries_the_metadata(self):
+        self.client.post(reverse('create'), {'title': 'title', 'title-ru': '', 'body': 'body', 'body-ru': '',
+                                             'url': 'google.com', 'icon': test_image(content=png(30, 20)),
+                                             'image': test_image()})
+        product = Product.objects.latest('id')
+        self.assertEqual((product.icon_width, product.icon_height, product.icon_format), (30, 20, 'PNG'))
+        self.assertEqual(product.icon_size, len(png(30, 20)))
+
+    def test_worker_generates_the_derivatives_of_a_created_product(self):
+        self.client.post(reverse('create'), {'title': 'title', 'title-ru': '', 'body': 'body', 'body-ru': '',
+                                             'url': 'google.com', 'icon': test_image(content=png(300, 300)),
+                                             'image': test_image(content=png(500, 300))})
+        product = Product.objects.latest('id')
+        self.assertEqual((product.icon_widths, product.image_placeholder), ('', ''))
+
+        run_on_commit_callbacks()
+        self.assertEqual(tasks.run(1, once=True), 2)
+        product.refresh_from_db()
+        self.assertEqual((product.icon_widths, product.image_widths), ('64,128,256', '480'))
+        self.assertTrue(product.icon_placeholder.startswith('data:image/jpeg;base64,'))
@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils.translation import gettext as _
+from PIL import Image
+
+from producthuntclone.test_utils import *
+from producthuntclone.views import serve_media
+from products.images import derivative_name
+from products.media import delete_orphans
+from products.models import Product
+from products.storage import is_content_addressed
+from products.uploads import image_error
+
+
+class MediaTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        settings = override_settings(MEDIA_ROOT=media_root, MEDIA_ORPHAN_GRACE_PERIOD=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, media_root)
+        create_test_user_with_endpoint(self.client)
+
+
+class ContentAddressedStorageTests(MediaTestCase):
+    def test_file_is_stored_under_content_hash(self):
+        product = create_test_product(self.client)
+        self.assertTrue(is_content_addressed(product.icon.name))
+        self.assertTrue(product.icon.name.startswith('images/'))
+        self.assertTrue(product.icon.name.endswith('.png'))
+
+    def test_identical_uploads_are_stored_once(self):
+        first = create_test_product(self.client, title='first')
+        second = create_test_product(self.client, title='second')
+        self.assertEqual(first.icon.name, second.image.name)
+        self.assertEqual(len(os.listdir(os.path.dirname(first.icon.path))), 1)
+
+    def test_different_content_gets_different_name(self):
+        product = create_test_product(self.client)
+        product.image.save('image.png', SimpleUploadedFile('image.png', b'other_content'))
+        self.assertNotEqual(product.icon.name, product.image.name)
+
+
+class DeleteOrphansTests(MediaTestCase):
+    def test_shared_file_is_kept_while_referenced(self):
+        first = create_test_product(self.client, title='first')
+        second = create_test_product(self.client, title='second')
+        first.delete()
+
+        self.assertEqual(delete_orphans([second.icon.name]), [])
+        self.assertTrue(default_storage.exists(second.icon.name))
+
+    def test_unreferenced_file_and_derivatives_are_deleted(self):
+        product = create_test_product(self.client)
+        name = product.icon.name
+        with open(default_storage.path(derivative_name(name, 64)), 'wb') as derivative:
+            derivative.write(b'derivative')
+        product.delete()
+
+        self.assertEqual(delete_orphans([name]), [name])
+        self.assertFalse(os.listdir(os.path.dirname(default_storage.path(name))))
+
+    def test_cleanup_command_deletes_only_orphans(self):
+        product = create_test_product(self.client)
+        orphan = default_storage.save('images/orphan.png', SimpleUploadedFile('orphan.png', b'orphan'))
+
+        call_command('cleanup_media', stdout=StringIO())
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(default_storage.exists(product.icon.name))
+
+
+class ServeMediaTests(MediaTestCase):
+    def test_content_addressed_files_are_cached_forever(self):
+        product = create_test_product(self.client)
+        response = serve_media(RequestFactory().get('/'), product.icon.name)
+        self.assertIn('immutable', response['Cache-Control'])
+
+
+class UploadTests(MediaTestCase):
+    def post(self, icon):
+        return self.client.post(reverse('create'), {'title': 'title', 'title-ru': '', 'body': 'body', 'body-ru': '',
+                                                    'url': 'google.com', 'icon': icon, 'image': test_image()})
+
+    def assertRejected(self, response, error):
+        self.assertEqual(response.context[CONTEXT_INDEX]['error'], _(error))
+        self.assertFalse(Product.objects.exists())
+        self.assertEqual(os.listdir(settings.MEDIA_ROOT), [])
+
+    def test_upload_is_moved_to_its_final_name(self):
+        self.post(test_image())
+        product = Product.objects.get()
+        self.assertTrue(is_content_addressed(product.icon.name))
+        self.assertEqual(product.icon.name, product.image.name)
+        # No temporary files are left behind
+        self.assertEqual(os.listdir(settings.MEDIA_ROOT), ['images'])
+
+    def test_file_that_is_not_an_image_is_rejected(self):
+        self.assertRejected(self.post(test_image(content=b'<html></html>')), 'upload_not_image')
+
+    def test_image_in_other_format_is_rejected(self):
+        buffer = BytesIO()
+        Image.new('RGB', (1, 1)).save(buffer, 'BMP')
+        self.assertRejected(self.post(test_image('image.bmp', buffer.getvalue())), 'upload_not_image')
+
+    def test_oversized_file_is_rejected(self):
+        with override_settings(UPLOAD_MAX_FILE_SIZE=len(png()) - 1):
+            self.assertRejected(self.post(test_image()), 'upload_too_large')
+
+    def test_oversized_request_is_rejected(self):
+        with override_settings(UPLOAD_MAX_REQUEST_SIZE=100):
+            self.assertRejected(self.post(test_image()), 'upload_too_large')
+
+    def test_image_with_too_many_pixels_is_rejected(self):
+        with override_settings(UPLOAD_MAX_IMAGE_PIXELS=99):
+            self.assertRejected(self.post(test_image(content=png(10, 10))), 'upload_too_many_pixels')
+
+    def test_only_the_header_is_read(self):
+        path = os.path.join(settings.MEDIA_ROOT, 'truncated.png')
+        with open(path, 'wb') as file:
+            file.write(png(3000, 3000)[:100])
+        self.assertIsNone(image_error(path))
@@ -1,5 +1,56 @@
-from django.test import TestCase
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache.backends.filebased import FileBasedCache
+from django.test import TestCase, override_settings
+
+from producthuntclone.test_utils import *
+from products import vote_state
+from products.models import Product, ProductVote
 
 
 class ProductTests(TestCase):
     pass
+
+
+class ProductVoteTests(TestCase):
+    def setUp(self):
+        create_test_user_with_endpoint(self.client)
+        create_test_products_in_range(self.client, 3)
+        self.voter = User.objects.create_user('voter', password='voter')
+        self.first, self.second, self.third = Product.objects.order_by('pk')
+        ProductVote.objects.create(user=self.voter, product=self.first)
+        ProductVote.objects.create(user=self.voter, product=self.third)
+
+    def test_voted_product_ids(self):
+        self.assertEqual(ProductVote.voted_product_ids(self.voter), {self.first.pk, self.third.pk})
+
+    def test_voted_product_ids_limited_to_given_products(self):
+        with self.assertNumQueries(1):
+            voted = ProductVote.voted_product_ids(self.voter, [self.first.pk, self.second.pk])
+        self.assertEqual(voted, {self.first.pk})
+
+    def test_vote_state_caches_only_the_products_looked_up(self):
+        vote_state.get_cache().clear()
+        self.assertEqual(vote_state.voted_product_ids(self.voter, [self.first.pk, self.second.pk]), {self.first.pk})
+        with self.assertNumQueries(0):
+            self.assertEqual(vote_state.voted_product_ids(self.voter, [self.second.pk]), set())
+        with self.assertNumQueries(1):
+            self.assertEqual(vote_state.voted_product_ids(self.voter, [self.third.pk]), {self.third.pk})
+
+    @override_settings(VOTED_STATES_CACHE_SIZE=2)
+    def test_cached_vote_states_are_bounded(self):
+        vote_state.get_cache().clear()
+        vote_state.voted_product_ids(self.voter, [self.first.pk, self.second.pk])
+        vote_state.voted_product_ids(self.voter, [self.third.pk])
+        self.assertEqual(len(vote_state.get_cache().get(f'voted-products:{self.voter.pk}')), 1)
+
+    def test_vote_drops_the_states_cached_by_other_processes(self):
+        # What another process reads from the same files
+        other = FileBasedCache(settings.CACHES['vote_states']['LOCATION'], {})
+        with mock.patch.object(vote_state, 'get_cache', return_value=other):
+            self.assertEqual(vote_state.voted_product_ids(self.voter, [self.second.pk]), set())
+        ProductVote.objects.create(user=self.voter, product=self.second)
+        with mock.patch.object(vote_state, 'get_cache', return_value=other):
+            self.assertEqual(vote_state.voted_product_ids(self.voter, [self.second.pk]), {self.second.pk})
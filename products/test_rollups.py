@@ -0,0 +1,109 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from producthuntclone.test_utils import *
+from producthuntclone.queries import record_queries
+from products import rollups, vote_buffer
+from products.models import Product, ProductVote, VoteRollup
+
+
+class VoteRollupTests(TestCase):
+    def setUp(self):
+        create_test_user_with_endpoint(self.client)
+        create_test_products_in_range(self.client, 3)
+        self.first, self.second, self.third = Product.objects.order_by('pk')
+        logout_test_user_with_endpoint(self.client)
+        self.voters = [User.objects.create_user(f'voter{i}', password='voter') for i in range(3)]
+
+    def vote(self, user, product, days_ago=0, hours_ago=0):
+        created = timezone.now() - timedelta(days=days_ago, hours=hours_ago)
+        ProductVote.objects.create(user=user, product=product, created=created)
+        rollups.add([(product.pk, created)])
+
+    def rollup_rows(self):
+        return set(VoteRollup.objects.values_list('product_id', 'resolution', 'start', 'votes'))
+
+    def test_upvote_counts_in_its_hour_and_day(self):
+        self.client.force_login(self.voters[0])
+        self.client.post(reverse('upvote', args=(self.first.pk,)))
+
+        created = ProductVote.objects.get().created
+        self.assertEqual(self.rollup_rows(), {
+            (self.first.pk, VoteRollup.HOUR, rollups.truncate(created, VoteRollup.HOUR), 1),
+            (self.first.pk, VoteRollup.DAY, rollups.truncate(created, VoteRollup.DAY), 1),
+        })
+
+    def test_votes_of_one_hour_share_a_row(self):
+        self.vote(self.voters[0], self.first)
+        self.vote(self.voters[1], self.first)
+        self.assertEqual(set(VoteRollup.objects.values_list('votes', flat=True)), {2})
+
+    def test_buffered_votes_are_counted_when_flushed(self):
+        journal = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False).name
+        self.addCleanup(os.remove, journal)
+        with override_settings(VOTE_BUFFER_ENABLED=True, VOTE_BUFFER_JOURNAL=journal, VOTE_BUFFER_FLUSH_INTERVAL=0):
+            for voter in self.voters:
+                self.client.force_login(voter)
+                self.client.post(reverse('upvote', args=(self.second.pk,)))
+            vote_buffer.get_buffer().flush()
+        self.assertEqual(VoteRollup.objects.get(product=self.second, resolution=VoteRollup.DAY).votes, 3)
+
+    def test_product_stats(self):
+        self.vote(self.voters[0], self.first)
+        self.vote(self.voters[1], self.first, hours_ago=30)
+        self.vote(self.voters[2], self.first, days_ago=10)
+
+        stats = rollups.product_stats(self.first.pk)
+        self.assertEqual(stats['last_day'], 1)
+        self.assertLessEqual(stats['last_week'], 2)
+        self.assertEqual(len(stats['trend']), rollups.TREND_DAYS)
+        self.assertEqual(sum(votes for _, votes in stats['trend']), 3)
+
+    def test_detail_page_shows_stats(self):
+        self.vote(self.voters[0], self.first)
+        response = self.client.get(reverse('detail', args=(self.first.pk,)))
+        self.assertEqual(response.context['stats']['last_day'], 1)
+        self.assertContains(response, 'style="height: 100%')
+
+    def test_trending_lists_votes_of_the_week(self):
+        self.vote(self.voters[0], self.first, days_ago=30)
+        self.vote(self.voters[1], self.first, days_ago=30)
+        self.vote(self.voters[0], self.second, days_ago=2)
+        self.vote(self.voters[0], self.third)
+        self.vote(self.voters[1], self.third)
+
+        self.assertEqual(rollups.trending(), [(self.third, 2), (self.second, 1)])
+        response = self.client.get(reverse('trending'))
+        self.assertEqual(response.context['products'], [(self.third, 2), (self.second, 1)])
+
+    def test_stats_and_trending_do_not_read_votes(self):
+        self.vote(self.voters[0], self.first)
+        with record_queries() as recorder:
+            self.client.get(reverse('detail', args=(self.first.pk,)))
+            self.client.get(reverse('trending'))
+        self.assertFalse([sql for sql, _, _ in recorder.queries if 'products_productvote' in sql])
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.vote(self.voters[0], self.first, hours_ago=3)
+        self.vote(self.voters[1], self.first, days_ago=3)
+        self.vote(self.voters[2], self.second, days_ago=5)
+        expected = self.rollup_rows()
+
+        VoteRollup.objects.update(votes=100)
+        call_command('rebuild_vote_rollups', '--batch-size', '1', stdout=StringIO())
+        self.assertEqual(self.rollup_rows(), expected)
+
+    def test_old_hourly_rollups_are_pruned(self):
+        self.vote(self.voters[0], self.first)
+        self.vote(self.voters[1], self.first, days_ago=30)
+
+        call_command('rebuild_vote_rollups', '--prune-only', stdout=StringIO())
+        self.assertEqual(VoteRollup.objects.filter(resolution=VoteRollup.HOUR).count(), 1)
+        self.assertEqual(VoteRollup.objects.filter(resolution=VoteRollup.DAY).count(), 2)
@@ -0,0 +1,75 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from producthuntclone.test_utils import *
+from products import search
+from products.models import Product
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        create_test_user_with_endpoint(self.client)
+        self.editor = self.product('Text editor', 'Текстовый редактор', 'Edits plain text files', 'Редактирует файлы')
+        self.player = self.product('Music player', 'Музыкальный плеер', 'Plays music, edits playlists', 'Играет')
+
+    def product(self, title_en, title_ru, body_en, body_ru):
+        product = create_test_product(self.client, title=title_en, body=body_en)
+        product.title_ru = title_ru
+        product.body_ru = body_ru
+        product.save()
+        return product
+
+    def results(self, query):
+        return list(search.SearchResults(query)[0:10])
+
+    def test_english_and_russian_words_are_found(self):
+        self.assertEqual(self.results('editor'), [self.editor])
+        self.assertEqual(self.results('РЕДАКТОР'), [self.editor])
+
+    def test_words_match_as_prefixes(self):
+        self.assertEqual(self.results('музык'), [self.player])
+
+    def test_title_matches_rank_above_body_matches(self):
+        self.assertEqual(self.results('edit'), [self.editor, self.player])
+
+    def test_votes_lift_equal_matches(self):
+        first = self.product('Notes', 'Заметки', 'Keeps notes', 'Хранит заметки')
+        second = self.product('Notes', 'Заметки', 'Keeps notes', 'Хранит заметки')
+        self.assertEqual(self.results('notes'), [first, second])
+
+        Product.objects.filter(pk=second.pk).update(votes_total=100)
+        self.assertEqual(self.results('notes'), [second, first])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.editor.title_en = 'Code editor'
+        self.editor.save()
+        self.assertEqual(self.results('code'), [self.editor])
+        self.assertEqual(search.suggest('text'), [])
+
+        self.editor.delete()
+        self.assertEqual(self.results('editor'), [])
+
+    def test_operators_are_searched_as_text(self):
+        self.assertEqual(self.results('"editor" OR (player'), [])
+        self.assertEqual(self.results('editor*) -'), [self.editor])
+
+    def test_rebuild(self):
+        Product.objects.filter(pk=self.editor.pk).update(title_en='Renamed')
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.results('renamed'), [self.editor])
+
+    def test_search_page(self):
+        response = self.client.get(reverse('search'), {'q': 'player'})
+        self.assertContains(response, reverse('detail', args=(self.player.pk,)))
+        self.assertNotContains(response, reverse('detail', args=(self.editor.pk,)))
+
+    def test_suggestions(self):
+        response = self.client.get(reverse('search_suggest'), {'q': 'mus'})
+        self.assertEqual(response.json(), {'suggestions': [
+            {'id': self.player.pk, 'title': 'Music player', 'url': reverse('detail', args=(self.player.pk,))}]})
+
+    def test_suggestions_ignore_bodies(self):
+        self.assertEqual(search.suggest('plain'), [])
@@ -1,15 +1,39 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.http import Http404
-from django.test import TestCase
+from django.test import Client, TestCase, override_settings
 from django_bs_test import TestCase as BsTestCase
+from django.utils import timezone, translation
 from django.utils.translation import gettext as _
 
+from producthuntclone.queries import record_queries
 from producthuntclone.test_utils import *
-from products.models import Product
+from products import fragments, hot, page_cache, vote_buffer
+from products.leaderboard import Leaderboard, leaderboard
+from products.models import Product, ProductVote
+
+
+def voted_badge():
+    return f'<span class="badge badge-success">{_("voted")}</span>'
 
 
 class HomeTests(TestCase):
     PAGE_SIZE = 5
 
+    def setUp(self):
+        # Pages cached by other tests would be served without rendering the templates
+        page_cache.get_cache().clear()
+
     def test_home_without_params(self):
         response = self.client.get(reverse('home'))
         self.assertEqual(response.status_code, 200)
@@ -70,6 +94,57 @@ class HomeTests(TestCase):
         index_5 = text_response.index('TITLE0')
         self.assertTrue(index_1 < index_2 < index_3 < index_4 < index_5)
 
+    def test_next_cursor_shows_next_page(self):
+        create_test_user_with_endpoint(self.client)
+        create_test_products_in_range(self.client, HomeTests.PAGE_SIZE * 2)
+
+        response = self.client.get(reverse('home'))
+        response = self.client.get(f"{reverse('home')}?cursor={response.context['next_cursor']}")
+        self.assertContains(response, 'TITLE4')
+        self.assertNotContains(response, 'TITLE5')
+        self.assertNotContains(response, f'{_("page")} 2 {_("of")} 2')
+
+    def test_cursor_pages_cover_all_products_in_order(self):
+        create_test_user_with_endpoint(self.client)
+        create_test_products_in_range(self.client, HomeTests.PAGE_SIZE * 3)
+        Product.objects.filter(title='title7').update(votes_total=5)
+
+        expected = list(Product.objects.order_by('-votes_total', '-pub_date', '-pk'))
+        seen = []
+        response = self.client.get(reverse('home'))
+        while True:
+            seen.extend(response.context['products'])
+            if not response.context['next_cursor']:
+                break
+            response = self.client.get(f"{reverse('home')}?cursor={response.context['next_cursor']}")
+        self.assertEqual(seen, expected)
+
+    def test_previous_cursor_shows_previous_page(self):
+        create_test_user_with_endpoint(self.client)
+        create_test_products_in_range(self.client, HomeTests.PAGE_SIZE * 3)
+
+        first = self.client.get(reverse('home'))
+        second = self.client.get(f"{reverse('home')}?cursor={first.context['next_cursor']}")
+        third = self.client.get(f"{reverse('home')}?cursor={second.context['next_cursor']}")
+        response = self.client.get(f"{reverse('home')}?cursor={third.context['previous_cursor']}")
+        self.assertEqual(list(response.context['products']), list(second.context['products']))
+
+    def test_first_page_is_shown_if_incorrect_cursor_is_passed(self):
+        create_test_user_with_endpoint(self.client)
+        create_test_products_in_range(self.client, HomeTests.PAGE_SIZE * 2)
+
+        response = self.client.get(f"{reverse('home')}?cursor=garbage")
+        self.assertContains(response, 'TITLE9')
+        self.assertContains(response, f'{_("page")} 1 {_("of")} 2')
+
+    def test_page_param_is_still_supported(self):
+        create_test_user_with_endpoint(self.client)
+        create_test_products_in_range(self.client, HomeTests.PAGE_SIZE * 2)
+
+        response = self.client.get(f"{reverse('home')}?page=2")
+        self.assertContains(response, f'{_("page")} 2 {_("of")} 2')
+        self.assertContains(response, 'TITLE0')
+
 
 class CreateProductTests(TestCase):
     def setUp(self):
@@ -94,21 +169,21 @@ class CreateProductTests(TestCase):
         If `title` parameter is empty, 'products/create.html'
         with `error` parameter should be loaded.
         """
-        self.empty_param_raises_error({'title': '', 'body': '', 'url': '', 'icon': test_image, 'image': test_image})
+        self.empty_param_raises_error({'title': '', 'body': '', 'url': '', 'icon': test_image(), 'image': test_image()})
 
     def test_empty_body_raises_error(self):
         """
         If `body` parameter is empty, 'products/create.html'
         with `error` parameter should be loaded.
         """
-        self.empty_param_raises_error({'title': 'title', 'body': '', 'url': '', 'icon': test_image, 'image': test_image})
+        self.empty_param_raises_error({'title': 'title', 'body': '', 'url': '', 'icon': test_image(), 'image': test_image()})
 
     def test_empty_url_raises_error(self):
         """
         If `url` parameter is empty, 'products/create.html'
         with `error` parameter should be loaded.
         """
-        self.empty_param_raises_error({'title': 'title', 'body': 'body', 'url': '', 'icon': test_image, 'image': test_image})
+        self.empty_param_raises_error({'title': 'title', 'body': 'body', 'url': '', 'icon': test_image(), 'image': test_image()})
 
     def test_valid_url_without_schema_creates_product(self):
         """
@@ -119,7 +194,7 @@ class CreateProductTests(TestCase):
         response = self.client.post(reverse('create'),
                                     {'title': 'title', 'title-ru': 'title-ru',
                                      'body': 'body', 'body-ru': 'body-ru',
-                                     'url': url, 'icon': test_image, 'image': test_image})
+                                     'url': url, 'icon': test_image(), 'image': test_image()})
         self.assertEqual(response.status_code, 302)
 
     def test_malformed_url_raises_error(self):
@@ -131,7 +206,7 @@ class CreateProductTests(TestCase):
         response = self.client.post(reverse('create'),
                                     {'title': 'title', 'title-ru': 'title-ru',
                                      'body': 'body', 'body-ru': 'body-ru',
-                                     'url': url, 'icon': test_image, 'image': test_image})
+                                     'url': url, 'icon': test_image(), 'image': test_image()})
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'products/create.html')
         self.assertEqual(response.context[CONTEXT_INDEX]['error'], _('url_error'))
@@ -154,6 +229,23 @@ class CreateProductTests(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response['Location'], f'/products/{last_product.pk}')
 
+    def test_post_without_csrf_token_is_forbidden(self):
+        """
+        `create` is exempt from the middleware's CSRF check, which would
+        read the upload before its handlers are set; it checks the token itself.
+        """
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(auth.get_user(self.client))
+        data = {'title': 'title', 'title-ru': '', 'body': 'body', 'body-ru': '', 'url': 'google.com',
+                'icon': test_image(), 'image': test_image()}
+        response = client.post(reverse('create'), data)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Product.objects.exists())
+
+        client.get(reverse('create'))
+        data.update(icon=test_image(), image=test_image(), csrfmiddlewaretoken=client.cookies['csrftoken'].value)
+        self.assertEqual(client.post(reverse('create'), data).status_code, 302)
+
 
 class DetailTests(BsTestCase):
     @staticmethod
@@ -325,3 +417,585 @@ class UpvoteTests(TestCase):
         self.client.post(reverse('upvote', args=(self.product.pk,)))
         self.client.post(reverse('upvote', args=(self.product.pk,)))
         self.assertRaises(Http404)
+
+
+class BufferedUpvoteTests(TestCase):
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp()
+        settings = override_settings(VOTE_BUFFER_ENABLED=True,
+                                     VOTE_BUFFER_JOURNAL=os.path.join(self.journal_dir, 'journal.sqlite3'),
+                                     VOTE_BUFFER_FLUSH_INTERVAL=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.journal_dir)
+
+        create_test_user_with_endpoint(self.client)
+        create_test_product_with_endpoint(self.client)
+        self.hunter = auth.get_user(self.client)
+        logout_test_user_with_endpoint(self.client)
+        create_test_user_with_endpoint(self.client, username='test_another', password='test_another')
+        self.product = Product.objects.latest('id')
+
+    def test_vote_is_applied_on_flush(self):
+        response = self.client.post(reverse('upvote', args=(self.product.pk,)))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).votes_total, 1)
+
+        call_command('flush_votes', stdout=StringIO())
+        self.assertEqual(Product.objects.get(pk=self.product.pk).votes_total, 2)
+        self.assertTrue(ProductVote.is_already_voted(auth.get_user(self.client), self.product))
+
+    def test_pending_vote_is_shown_on_home(self):
+        self.client.post(reverse('upvote', args=(self.product.pk,)))
+        self.assertContains(self.client.get(reverse('home')), voted_badge(), count=1)
+
+    def test_pending_vote_cannot_be_repeated(self):
+        self.client.post(reverse('upvote', args=(self.product.pk,)))
+        response = self.client.post(reverse('upvote', args=(self.product.pk,)))
+        self.assertEqual(response.status_code, 404)
+
+        call_command('flush_votes', stdout=StringIO())
+        response = self.client.post(reverse('upvote', args=(self.product.pk,)))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).votes_total, 2)
+
+    def test_pending_votes_of_a_page_are_looked_up_at_once(self):
+        for i in range(3):
+            Product.objects.create(title=f'other{i}', body='body', url='google.com', icon=self.product.icon,
+                                   image=self.product.image, pub_date=timezone.now(), hunter=self.hunter)
+        self.client.post(reverse('upvote', args=(self.product.pk,)))
+
+        with mock.patch.object(vote_buffer.VoteBuffer, 'contains') as contains, \
+                mock.patch.object(vote_buffer.VoteBuffer, 'pending_products', autospec=True,
+                                  side_effect=vote_buffer.VoteBuffer.pending_products) as pending_products:
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, voted_badge(), count=1)
+        self.assertEqual(pending_products.call_count, 1)
+        contains.assert_not_called()
+
+    def test_pending_vote_is_shown_on_detail_page(self):
+        self.client.post(reverse('upvote', args=(self.product.pk,)))
+        response = self.client.get(reverse('detail', args=(self.product.pk,)))
+        self.assertTrue(response.context['is_voted'])
+
+    def test_vote_flushed_by_another_process_is_not_pending(self):
+        self.client.post(reverse('upvote', args=(self.product.pk,)))
+        # Another process has a buffer of its own on the same journal
+        vote_buffer.VoteBuffer(os.path.join(self.journal_dir, 'journal.sqlite3')).flush()
+
+        self.assertFalse(vote_buffer.get_buffer().contains(auth.get_user(self.client).id, self.product.pk))
+        response = self.client.get(reverse('detail', args=(self.product.pk,)))
+        self.assertTrue(response.context['is_voted'])
+
+    def test_json_total_counts_a_vote_flushed_by_another_process_once(self):
+        url = reverse('upvote_json', args=(self.product.pk,))
+        self.assertEqual(self.client.post(url).json()['votes_total'], 2)
+        vote_buffer.VoteBuffer(os.path.join(self.journal_dir, 'journal.sqlite3')).flush()
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['votes_total'], 2)
+
+    def test_flush_drops_votes_on_own_product(self):
+        vote_buffer.get_buffer().add(self.hunter.id, self.product.pk)
+
+        call_command('flush_votes', stdout=StringIO())
+        self.assertEqual(Product.objects.get(pk=self.product.pk).votes_total, 1)
+        self.assertFalse(ProductVote.objects.exists())
+
+
+class LeaderboardHomeTests(TestCase):
+    PAGE_SIZE = 5
+
+    def setUp(self):
+        create_test_user_with_endpoint(self.client)
+        create_test_products_in_range(self.client, LeaderboardHomeTests.PAGE_SIZE * 3)
+        Product.objects.filter(title='title3').update(votes_total=3)
+        leaderboard.rebuild()
+        self.addCleanup(leaderboard.clear)
+
+    def get_all_pages(self):
+        products = []
+        response = self.client.get(reverse('home'))
+        while True:
+            products.extend(response.context['products'])
+            if not response.context['next_cursor']:
+                return products
+            response = self.client.get(f"{reverse('home')}?cursor={response.context['next_cursor']}")
+
+    def test_pages_match_database_ranking(self):
+        expected = list(Product.objects.order_by('-votes_total', '-pub_date', '-pk'))
+        self.assertEqual(self.get_all_pages(), expected)
+
+    def test_page_param_uses_leaderboard(self):
+        response = self.client.get(f"{reverse('home')}?page=3")
+        self.assertContains(response, f'{_("page")} 3 {_("of")} 3')
+        self.assertContains(response, 'TITLE0')
+
+    def test_added_votes_change_ranking(self):
+        product = Product.objects.get(title='title0')
+        Product.objects.filter(pk=product.pk).update(votes_total=10)
+        leaderboard.add_votes(product.pk, 9)
+
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['products'][0], product)
+
+    def test_verify_rebuilds_drifted_ranking(self):
+        Product.objects.filter(title='title0').update(votes_total=10)
+        self.assertFalse(leaderboard.verify())
+        self.assertTrue(leaderboard.verify())
+        self.assertEqual(self.get_all_pages()[0].title, 'title0')
+
+    def test_rebuild_changes_the_version_of_cached_pages(self):
+        self.client.get(reverse('home'))
+        # A vote of another process: neither this ranking nor the version of the page see it
+        Product.objects.filter(title='title0').update(votes_total=10)
+        self.assertNotContains(self.client.get(reverse('home')), 'TITLE0')
+
+        leaderboard.verify()
+        self.assertContains(self.client.get(reverse('home')), 'TITLE0')
+
+    def test_ranking_is_not_verified_by_requests(self):
+        with mock.patch.object(leaderboard, 'verify') as verify:
+            self.client.get(reverse('home'))
+        verify.assert_not_called()
+
+    def test_missing_rows_wake_the_verifier_up(self):
+        board = Leaderboard()
+        board.is_warm = True
+        verified = threading.Event()
+        with mock.patch.object(board, 'verify', side_effect=verified.set):
+            board.start_verifier(60 * 60)
+            board.fetch([0])
+            self.assertTrue(verified.wait(5))
+
+    def test_cold_leaderboard_falls_back_to_sql(self):
+        leaderboard.clear()
+        Product.objects.filter(title='title0').update(votes_total=10)
+
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['products'][0].title, 'title0')
+
+
+class HomeSortTests(TestCase):
+    PAGE_SIZE = 5
+
+    def setUp(self):
+        create_test_user_with_endpoint(self.client)
+        now = timezone.now()
+        for i in range(HomeSortTests.PAGE_SIZE * 2):
+            product = create_test_product(self.client, title=f'title{i}')
+            # title0 is the oldest
+            Product.objects.filter(pk=product.pk).update(pub_date=now - timedelta(days=10 - i))
+        logout_test_user_with_endpoint(self.client)
+        create_test_user_with_endpoint(self.client, username='voter', password='voter')
+
+    def get_all_pages(self, sort):
+        products = []
+        response = self.client.get(f"{reverse('home')}?sort={sort}")
+        while True:
+            products.extend(response.context['products'])
+            if not response.context['next_cursor']:
+                return products
+            response = self.client.get(f"{reverse('home')}?sort={sort}&cursor={response.context['next_cursor']}")
+
+    def test_new_shows_latest_products_first(self):
+        expected = list(Product.objects.order_by('-pub_date', '-pk'))
+        self.assertEqual(self.get_all_pages('new'), expected)
+
+    def test_vote_updates_hot_score(self):
+        product = Product.objects.get(title='title3')
+        self.client.post(reverse('upvote', args=(product.pk,)))
+
+        product.refresh_from_db()
+        self.assertAlmostEqual(product.hot_score, hot.score(2, product.pub_date), places=6)
+        self.assertEqual(self.client.get(f"{reverse('home')}?sort=hot").context['products'][0], product)
+
+    def test_recent_votes_outrank_older_ones(self):
+        old, recent = Product.objects.get(title='title0'), Product.objects.get(title='title9')
+        Product.objects.filter(pk=old.pk).update(votes_total=4)
+        self.client.post(reverse('upvote', args=(old.pk,)))
+        self.client.post(reverse('upvote', args=(recent.pk,)))
+
+        self.assertEqual(self.get_all_pages('top')[0], old)
+        self.assertEqual(self.get_all_pages('hot')[0], recent)
+
+    def test_hot_cursor_pages_cover_all_products_in_order(self):
+        for title in ('title2', 'title6', 'title8'):
+            self.client.post(reverse('upvote', args=(Product.objects.get(title=title).pk,)))
+
+        expected = list(Product.objects.order_by('-hot_score', '-pk'))
+        self.assertEqual(self.get_all_pages('hot'), expected)
+        self.assertEqual(expected[0].title, 'title8')
+
+    def test_unknown_sort_falls_back_to_top(self):
+        Product.objects.filter(title='title0').update(votes_total=5)
+        response = self.client.get(f"{reverse('home')}?sort=garbage")
+        self.assertEqual(response.context['sort'], 'top')
+        self.assertEqual(response.context['products'][0].title, 'title0')
+
+    def test_pagination_links_keep_the_sort(self):
+        response = self.client.get(f"{reverse('home')}?sort=new")
+        self.assertContains(response, f'href="?sort=new&amp;cursor={response.context["next_cursor"]}"')
+
+    def test_hot_pages_are_revalidated_after_a_refresh_period(self):
+        etag = self.client.get(f"{reverse('home')}?sort=hot")['ETag']
+        self.assertEqual(self.client.get(f"{reverse('home')}?sort=hot", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with override_settings(HOT_SCORE_REFRESH_INTERVAL=1e-9):
+            response = self.client.get(f"{reverse('home')}?sort=hot", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        create_test_user_with_endpoint(self.client)
+        self.product = create_test_product(self.client)
+
+    def test_second_render_is_served_from_cache(self):
+        self.client.get(reverse('home'))
+        hits = fragments.stats()['hits']
+        page_cache.get_cache().clear()
+        self.client.get(reverse('home'))
+        self.assertEqual(fragments.stats()['hits'], hits + 1)
+
+    def test_saved_product_is_rendered_again(self):
+        self.client.get(reverse('detail', args=(self.product.pk,)))
+        self.product.body = 'changed body'
+        self.product.save()
+
+        response = self.client.get(reverse('detail', args=(self.product.pk,)))
+        self.assertContains(response, 'changed body')
+
+    def test_row_changed_by_another_process_is_rendered_again(self):
+        self.client.get(reverse('detail', args=(self.product.pk,)))
+        # No signal reaches this process, the new `updated` alone leads to the new row
+        Product.objects.filter(pk=self.product.pk).update(body_en='changed body', updated=timezone.now())
+
+        response = self.client.get(reverse('detail', args=(self.product.pk,)))
+        self.assertContains(response, 'changed body')
+
+    def test_vote_changes_cached_row(self):
+        self.client.get(reverse('home'))
+        logout_test_user_with_endpoint(self.client)
+        create_test_user_with_endpoint(self.client, username='test_another', password='test_another')
+        self.client.post(reverse('upvote', args=(self.product.pk,)))
+
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, '<i>2</i> votes')
+
+    def test_fragments_are_cached_per_language(self):
+        self.product.body_ru = 'русский текст'
+        self.product.save()
+        self.client.get(reverse('detail', args=(self.product.pk,)))
+
+        with translation.override('ru'):
+            key = fragments.fragment_key('detail-body', self.product)
+        self.assertIsNone(fragments.get_cache().get(key))
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        create_test_user_with_endpoint(self.client)
+        self.product = create_test_product(self.client)
+        logout_test_user_with_endpoint(self.client)
+        self.url = reverse('detail', args=(self.product.pk,))
+
+    def test_anonymous_page_is_served_from_cache(self):
+        self.client.get(self.url)
+        hits = page_cache.stats()['hits']
+        with record_queries() as recorder:
+            response = self.client.get(self.url)
+        self.assertEqual(page_cache.stats()['hits'], hits + 1)
+        self.assertTemplateNotUsed(response, 'products/detail.html')
+        self.assertContains(response, self.product.title)
+        # Only the version of the page is read
+        self.assertEqual(len(recorder.queries), 1)
+
+    def test_cached_page_is_filled_for_authenticated_users(self):
+        self.client.get(self.url)
+        create_test_user_with_endpoint(self.client, username='test_another', password='test_another')
+        hits = page_cache.stats()['hits']
+        response = self.client.get(self.url)
+        self.assertEqual(page_cache.stats()['hits'], hits + 1)
+        self.assertContains(response, _('logout'))
+        self.assertContains(response, f'action="{reverse("upvote", args=(self.product.pk,))}"')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertNotContains(response, _('signup'))
+
+    def test_page_cached_for_authenticated_user_is_filled_for_anonymous_users(self):
+        create_test_user_with_endpoint(self.client, username='test_another', password='test_another')
+        self.client.get(self.url)
+        logout_test_user_with_endpoint(self.client)
+
+        hits = page_cache.stats()['hits']
+        response = self.client.get(self.url)
+        self.assertEqual(page_cache.stats()['hits'], hits + 1)
+        self.assertNotContains(response, _('logout'))
+        self.assertContains(response, _('signup'))
+
+    def test_vote_changes_cached_page(self):
+        self.client.get(self.url)
+        create_test_user_with_endpoint(self.client, username='test_another', password='test_another')
+        self.client.post(reverse('upvote', args=(self.product.pk,)))
+        logout_test_user_with_endpoint(self.client)
+
+        response = self.client.get(self.url)
+        self.assertContains(response, f'{_("votes_last_day")}: <strong>1</strong>')
+
+    def test_edit_changes_cached_page(self):
+        self.client.get(self.url)
+        self.product.title = 'changed title'
+        self.product.save()
+        self.assertContains(self.client.get(self.url), 'changed title')
+
+    def test_created_product_is_listed(self):
+        self.client.get(reverse('home'))
+        create_test_user_with_endpoint(self.client, username='test_another', password='test_another')
+        create_test_product(self.client, title='brand new')
+        logout_test_user_with_endpoint(self.client)
+        self.assertContains(self.client.get(reverse('home')), 'BRAND NEW')
+
+    def test_deleted_product_is_not_listed(self):
+        create_test_user_with_endpoint(self.client, username='test_another', password='test_another')
+        # The latest `updated` stays the same
+        create_test_product(self.client, title='newer')
+        logout_test_user_with_endpoint(self.client)
+        self.client.get(reverse('home'))
+        self.product.delete()
+        self.assertNotContains(self.client.get(reverse('home')), self.url)
+
+    def test_cached_home_page_does_not_count_products(self):
+        self.client.get(reverse('home'))
+        with record_queries() as recorder:
+            self.client.get(reverse('home'))
+        # Only the latest `updated` is read, from its index
+        self.assertEqual(len(recorder.queries), 1)
+        self.assertNotIn('COUNT', recorder.queries[0][0])
+
+    def test_pages_are_cached_per_language(self):
+        self.product.title_ru = 'русский'
+        self.product.save()
+        self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_ACCEPT_LANGUAGE='ru')
+        self.assertContains(response, 'русский')
+
+
+class ConditionalResponseTests(TestCase):
+    def setUp(self):
+        create_test_user_with_endpoint(self.client)
+        self.product = create_test_product(self.client)
+        logout_test_user_with_endpoint(self.client)
+
+    def test_detail_returns_304_for_matching_etag(self):
+        url = reverse('detail', args=(self.product.pk,))
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_etag_changes_after_vote(self):
+        url = reverse('detail', args=(self.product.pk,))
+        create_test_user_with_endpoint(self.client, username='test_another', password='test_another')
+        etag = self.client.get(url)['ETag']
+        self.client.post(reverse('upvote', args=(self.product.pk,)))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail_etag_depends_on_user(self):
+        url = reverse('detail', args=(self.product.pk,))
+        etag = self.client.get(url)['ETag']
+        create_test_user_with_endpoint(self.client, username='test_another', password='test_another')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_home_returns_304_until_product_changes(self):
+        etag = self.client.get(reverse('home'))['ETag']
+        self.assertEqual(self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.product.title = 'changed'
+        self.product.save()
+        self.assertEqual(self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_home_etag_depends_on_page(self):
+        etag = self.client.get(reverse('home'))['ETag']
+        response = self.client.get(f"{reverse('home')}?page=2", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_last_modified_is_sent_only_to_anonymous_users(self):
+        url = reverse('detail', args=(self.product.pk,))
+        self.assertTrue(self.client.get(url).has_header('Last-Modified'))
+        create_test_user_with_endpoint(self.client, username='test_another', password='test_another')
+        self.assertFalse(self.client.get(url).has_header('Last-Modified'))
+
+
+class QueryBudgetTests(TestCase):
+    """Per-view query budgets: an N+1 or a lazily loaded relation fails these."""
+    HOME = 4
+    HOME_AUTHENTICATED = 4
+    DETAIL = 3
+    # Both include the vote rollups: read for the stats, written by the vote.
+    # Sessions and users come from the cache
+    DETAIL_AUTHENTICATED = 5
+    UPVOTE = 7
+    ADMIN_VOTES = 5
+
+    def setUp(self):
+        create_test_user_with_endpoint(self.client)
+        create_test_products_in_range(self.client, 7)
+        self.product = Product.objects.latest('id')
+        logout_test_user_with_endpoint(self.client)
+
+    def test_home(self):
+        for page in (1, 2):
+            with query_budget(self, self.HOME):
+                self.client.get(reverse('home'), {'page': page})
+
+    def test_home_for_authenticated(self):
+        create_test_user_with_endpoint(self.client, username='test_another', password='test_another')
+        with query_budget(self, self.HOME_AUTHENTICATED):
+            self.client.get(reverse('home'))
+
+    def test_detail(self):
+        with query_budget(self, self.DETAIL):
+            self.client.get(reverse('detail', args=(self.product.pk,)))
+
+    def test_detail_for_authenticated(self):
+        create_test_user_with_endpoint(self.client, username='test_another', password='test_another')
+        with query_budget(self, self.DETAIL_AUTHENTICATED):
+            self.client.get(reverse('detail', args=(self.product.pk,)))
+
+    def test_upvote(self):
+        create_test_user_with_endpoint(self.client, username='test_another', password='test_another')
+        with query_budget(self, self.UPVOTE):
+            self.client.post(reverse('upvote', args=(self.product.pk,)))
+
+    def test_admin_vote_list_does_not_load_rows_one_by_one(self):
+        for i in range(5):
+            create_test_user_with_endpoint(self.client, username=f'voter{i}', password='voter')
+            self.client.post(reverse('upvote', args=(self.product.pk,)))
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        with query_budget(self, self.ADMIN_VOTES):
+            response = self.client.get(reverse('admin:products_productvote_changelist'))
+        self.assertContains(response, "VOTER0 voted on")
+
+
+class HomeVoteStateTests(TestCase):
+    def setUp(self):
+        create_test_user_with_endpoint(self.client)
+        create_test_products_in_range(self.client, 2)
+        self.voted, self.not_voted = Product.objects.order_by('pk')
+        logout_test_user_with_endpoint(self.client)
+        create_test_user_with_endpoint(self.client, username='test_another', password='test_another')
+        self.own = create_test_product(self.client, title='own')
+        self.client.post(reverse('upvote', args=(self.voted.pk,)))
+
+    def test_badges_and_upvote_buttons_are_shown(self):
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, voted_badge(), count=1)
+        self.assertContains(response, f'<span class="badge badge-secondary">{_("yours")}</span>', count=1)
+        self.assertContains(response, f'action="{reverse("upvote", args=(self.not_voted.pk,))}"')
+        self.assertNotContains(response, f'action="{reverse("upvote", args=(self.voted.pk,))}"')
+
+    def test_nothing_is_shown_to_anonymous_users(self):
+        logout_test_user_with_endpoint(self.client)
+        response = self.client.get(reverse('home'))
+        self.assertNotContains(response, voted_badge())
+        self.assertNotContains(response, f'action="{reverse("upvote", args=(self.not_voted.pk,))}"')
+
+    def test_vote_state_of_a_page_is_cached(self):
+        self.client.get(reverse('home'))
+        with record_queries() as recorder:
+            self.client.get(reverse('home'))
+        self.assertFalse([sql for sql, _, _ in recorder.queries if 'products_productvote' in sql])
+
+    def test_upvote_invalidates_cached_vote_state(self):
+        self.client.get(reverse('home'))
+        self.client.post(reverse('upvote', args=(self.not_voted.pk,)))
+        self.assertContains(self.client.get(reverse('home')), voted_badge(), count=2)
+
+    def test_inline_upvote_returns_to_the_page(self):
+        response = self.client.post(reverse('upvote', args=(self.not_voted.pk,)), {'next': '/?page=1'})
+        self.assertRedirects(response, '/?page=1', fetch_redirect_response=False)
+
+    def test_upvote_ignores_external_next_url(self):
+        response = self.client.post(reverse('upvote', args=(self.not_voted.pk,)), {'next': 'http://example.com/'})
+        self.assertEqual(response['Location'], f'/products/{self.not_voted.pk}')
+
+
+class UpvoteJsonTests(TestCase):
+    def setUp(self):
+        create_test_user_with_endpoint(self.client)
+        create_test_product_with_endpoint(self.client)
+        logout_test_user_with_endpoint(self.client)
+        self.product = Product.objects.latest('id')
+        self.url = reverse('upvote_json', args=(self.product.pk,))
+
+    def test_vote_returns_new_total_and_state(self):
+        create_test_user_with_endpoint(self.client, username='test_another', password='test_another')
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['votes_total'], 2)
+        self.assertEqual(response.json()['state'], 'voted')
+        self.assertEqual(response.json()['votes_label'], '<i>2</i> votes')
+
+    def test_repeated_vote_is_a_conflict_and_counted_once(self):
+        create_test_user_with_endpoint(self.client, username='test_another', password='test_another')
+        self.client.post(self.url)
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['state'], 'voted')
+        self.assertEqual(response.json()['votes_total'], 2)
+
+    def test_vote_on_own_product_is_forbidden(self):
+        self.client.login(username='test', password='test')
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['state'], 'yours')
+        self.assertEqual(Product.objects.get(pk=self.product.pk).votes_total, 1)
+
+    def test_anonymous_vote_is_unauthorized(self):
+        self.assertEqual(self.client.post(self.url).status_code, 401)
+
+    def test_unknown_product_is_not_found(self):
+        create_test_user_with_endpoint(self.client, username='test_another', password='test_another')
+        response = self.client.post(reverse('upvote_json', args=(self.product.pk + 1,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_get_is_not_allowed(self):
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+    def test_pages_keep_the_form_fallback(self):
+        create_test_user_with_endpoint(self.client, username='test_another', password='test_another')
+        response = self.client.get(reverse('detail', args=(self.product.pk,)))
+        self.assertContains(response, f'action="{reverse("upvote", args=(self.product.pk,))}" data-upvote-url="{self.url}"')
+
+
+class ExportViewTests(TestCase):
+    def setUp(self):
+        create_test_user_with_endpoint(self.client)
+        create_test_products_in_range(self.client, 2)
+        logout_test_user_with_endpoint(self.client)
+        User.objects.create_user('analyst', password='analyst', is_staff=True)
+
+    def test_staff_gets_a_stream(self):
+        self.client.login(username='analyst', password='analyst')
+        response = self.client.get(reverse('export', args=('products', 'jsonl')))
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['title_en'] for row in rows], ['title0', 'title1'])
+
+    def test_gzip_is_used_when_accepted(self):
+        self.client.login(username='analyst', password='analyst')
+        response = self.client.get(reverse('export', args=('votes', 'csv')), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), b'id,user_id,user,product_id,created\r\n')
+
+    def test_invalid_since_is_a_bad_request(self):
+        self.client.login(username='analyst', password='analyst')
+        response = self.client.get(reverse('export', args=('products', 'csv')), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_other_users_are_forbidden(self):
+        self.client.login(username='test', password='test')
+        self.assertEqual(self.client.get(reverse('export', args=('products', 'csv'))).status_code, 403)
@@ -0,0 +1,117 @@
+"""Bounded, single pass handling of uploaded product images.
+
+`ImageUploadHandler` writes every uploaded file straight to a temporary
+file in MEDIA_ROOT while it is read from the request, hashing it on the
+way; `ContentAddressedStorage` then only renames it to its final name.
+Nothing is kept in memory and nothing is copied.
+
+Files are checked while they are read: a file larger than
+`UPLOAD_MAX_FILE_SIZE` stops the upload, and as soon as its header has
+arrived Pillow identifies the format and the dimensions without decoding
+the bitmap, so other formats and decompression bombs are rejected before
+the rest is read. The view shows why, see `rejection`.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from PIL import Image
+
+# Bytes after which the header of the common formats has arrived. Formats
+# that are not identified by then are checked again once the file is complete.
+HEADER_SIZE = 64 * 1024
+
+
+class HashedUploadedFile(UploadedFile):
+    """An upload in a temporary file of MEDIA_ROOT with the SHA-256 of its content."""
+
+    def __init__(self, name, content_type, charset, content_type_extra=None):
+        os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+        file = tempfile.NamedTemporaryFile(dir=settings.MEDIA_ROOT, prefix='.upload-')
+        super().__init__(file, name, content_type, 0, charset, content_type_extra)
+        self.sha256 = None
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            # Moved to its final name
+            pass
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """Streams the uploaded files to MEDIA_ROOT, rejecting oversized files and non-images."""
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # Rejected with the first file: the text fields before it are still parsed
+        self.request_too_large = content_length > settings.UPLOAD_MAX_REQUEST_SIZE
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        if self.request_too_large:
+            # Not worth reading at all
+            self._reject('upload_too_large', connection_reset=True)
+        self.file = HashedUploadedFile(self.file_name, self.content_type, self.charset, self.content_type_extra)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.checked = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > settings.UPLOAD_MAX_FILE_SIZE:
+            self._reject('upload_too_large')
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+        if not self.checked and self.size >= HEADER_SIZE:
+            self._check(complete=False)
+
+    def file_complete(self, file_size):
+        if not self.checked:
+            self._check(complete=True)
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.sha256.hexdigest()
+        return self.file
+
+    def _check(self, complete):
+        self.file.flush()
+        error = image_error(self.file.temporary_file_path())
+        # A partial file may just end before its header does
+        if error == 'upload_not_image' and not complete:
+            return
+        self.checked = True
+        if error:
+            self._reject(error)
+
+    def _reject(self, error, connection_reset=False):
+        self.request._upload_rejection = error
+        # The rest of the request is read and dropped, the temporary file is deleted
+        raise StopUpload(connection_reset=connection_reset)
+
+
+def image_error(path):
+    """Why the image at `path` is rejected, as a message id, or None; reads only its header."""
+    try:
+        with Image.open(path) as image:
+            if image.format not in settings.UPLOAD_IMAGE_FORMATS:
+                return 'upload_not_image'
+            if image.width * image.height > settings.UPLOAD_MAX_IMAGE_PIXELS:
+                return 'upload_too_many_pixels'
+    except Image.DecompressionBombError:
+        return 'upload_too_many_pixels'
+    except (OSError, SyntaxError, ValueError):
+        return 'upload_not_image'
+    return None
+
+
+def rejection(request):
+    """Why the upload handler rejected the files of the request, as a message id, or None."""
+    # Reading the files parses the request
+    request.FILES
+    return getattr(request, '_upload_rejection', None)
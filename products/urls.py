@@ -6,4 +6,9 @@ urlpatterns = [
     path('create', views.create, name='create'),
     path('<int:pk>', views.ProductDetailView.as_view(), name='detail'),
     path('<int:pk>/upvote', views.upvote, name='upvote'),
+    path('<int:pk>/upvote.json', views.upvote_json, name='upvote_json'),
+    path('trending', views.trending, name='trending'),
+    path('search', views.search, name='search'),
+    path('search/suggest.json', views.search_suggest, name='search_suggest'),
+    path('export/<slug:dataset>.<slug:format>', views.export_data, name='export'),
 ]
@@ -0,0 +1,51 @@
+"""Version of the product listings, shared by the processes of the host.
+
+Creates, votes and edits of products set `Product.updated`, so the latest
+`updated`, read from its index, changes with each of them. A delete leaves
+no row behind to tell; it replaces a token kept in the file-based
+'versions' cache instead. The two together version the home pages without
+counting the products.
+"""
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from products.models import Product
+
+CACHE_ALIAS = 'versions'
+
+_DELETES_KEY = 'versions:product-deletes'
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def listing_version():
+    """The latest `updated` of the products and the token of their deletes."""
+    return Product.objects.aggregate(updated=Max('updated'))['updated'], deletes_token()
+
+
+def deletes_token():
+    token = get_cache().get(_DELETES_KEY)
+    if token is None:
+        # A fresh token: a lost entry must not bring back the version of an older listing
+        get_cache().add(_DELETES_KEY, uuid.uuid4().hex, timeout=None)
+        token = get_cache().get(_DELETES_KEY)
+    return token
+
+
+def bump_deletes():
+    # A new random token rather than `incr`, which is not atomic in a file-based cache
+    get_cache().set(_DELETES_KEY, uuid.uuid4().hex, timeout=None)
+
+
+@receiver(post_delete, sender=Product)
+def _product_deleted(**kwargs):
+    # Again after the commit: a concurrent request may have cached the old listing meanwhile
+    bump_deletes()
+    transaction.on_commit(bump_deletes)
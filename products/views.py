@@ -1,34 +1,195 @@
+import hashlib
+
 from django.contrib.auth.decorators import login_required
-from django.core.exceptions import ValidationError
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.core.paginator import Paginator
 from django.core.validators import URLValidator
-from django.db import IntegrityError
-from django.http import Http404
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
-from django.utils import timezone
+from django.urls import reverse
+from django.utils import timezone, translation
+from django.utils.decorators import method_decorator
+from django.utils.http import is_safe_url
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import condition, require_POST
 from django.views.generic import DetailView, ListView
-from django.utils.translation import gettext as _
+from django.utils.translation import gettext as _, ngettext
 
+from products import (export, hot, images, page_cache, rollups, search as product_search, uploads,
+                      versions, vote_buffer, vote_state)
+from products.leaderboard import RankedProducts, leaderboard
 from products.models import Product, ProductVote
+from products.pagination import InvalidCursor, KeysetPaginator
+from producthuntclone.sqlite import retry_on_locked
+from producthuntclone.templatetags.italic_first import italic_first
+
+
+def _etag(*parts):
+    return hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+
+
+def _ranking_version(request):
+    # Any create, vote, edit or delete changes it, without counting the products
+    if not hasattr(request, '_ranking_version'):
+        request._ranking_version = versions.listing_version()
+    return request._ranking_version
+
+
+def _leaderboard_built_at(request):
+    # A rebuild fixes a ranking that missed the changes of other processes
+    if HomeView.get_sort(request) == 'top' and leaderboard.is_warm:
+        return leaderboard.built_at
+    return None
+
+
+def _home_version(request):
+    updated, deletes = _ranking_version(request)
+    # Hot scores also change when they are refreshed, without any update of the products
+    period = hot.refresh_period() if HomeView.get_sort(request) == 'hot' else None
+    return updated, deletes, period, _leaderboard_built_at(request)
+
+
+def _home_etag(request):
+    return _etag(*_home_version(request), request.GET.urlencode(), request.user.pk, translation.get_language())
+
+
+def _home_last_modified(request):
+    # Pages of authenticated users also depend on their session
+    if request.user.is_authenticated or HomeView.get_sort(request) == 'hot':
+        return None
+    updated = _ranking_version(request)[0]
+    built_at = _leaderboard_built_at(request)
+    return max(updated, built_at) if updated and built_at else updated
+
+
+def _detail_updated(request, pk):
+    if not hasattr(request, '_product_updated'):
+        request._product_updated = Product.objects.filter(pk=pk).values_list('updated', flat=True).first()
+    return request._product_updated
+
+
+def _detail_version(request, pk):
+    updated = _detail_updated(request, pk)
+    # The vote stats also change as the hours pass
+    return updated and max(updated, rollups.current_hour())
+
+
+def _detail_etag(request, pk):
+    version = _detail_version(request, pk)
+    if version is None:
+        return None
+    is_voted = request.user.is_authenticated and _is_voted_by_request_user(request, pk)
+    return _etag(pk, version, request.user.pk, is_voted, translation.get_language())
 
 
+def _detail_last_modified(request, pk):
+    return None if request.user.is_authenticated else _detail_version(request, pk)
+
+
+@method_decorator(condition(etag_func=_home_etag, last_modified_func=_home_last_modified), name='get')
+@method_decorator(page_cache.cached_page(_home_version), name='get')
 class HomeView(ListView):
     PAGE_SIZE = 5
+    # `?sort=` -> ordering, each backed by an index of `Product`.
+    # `pk` makes the orderings total, so they can be used as keysets
+    ORDERINGS = {
+        'top': ('-votes_total', '-pub_date', '-pk'),
+        'hot': ('-hot_score', '-pk'),
+        'new': ('-pub_date', '-pk'),
+    }
+    DEFAULT_SORT = 'top'
+    # The ordering kept in memory by the leaderboard
+    ORDERING = ORDERINGS['top']
 
     template_name = 'products/home.html'
     context_object_name = 'products'
 
     def get_queryset(self):
+        sort = self.get_sort(self.request)
+        # Only the top ranking is kept in memory
+        ranked = sort == 'top' and leaderboard.is_warm
+        keyset = self._get_keyset_paginator(sort)
+        cursor = self.request.GET.get('cursor')
+        if cursor:
+            try:
+                direction, values = keyset.decode(cursor)
+            except InvalidCursor:
+                pass
+            else:
+                if ranked:
+                    return leaderboard.page(direction, values, HomeView.PAGE_SIZE)
+                return keyset.page(cursor)
+
+        # `?page=N` links and the first page keep using OFFSET pagination
         page = self.request.GET.get('page')
-        queryset = Product.objects.all().order_by('-votes_total', '-pub_date')
-        paginator = Paginator(queryset, HomeView.PAGE_SIZE)
-        return paginator.get_page(page)
+        if ranked:
+            ranking = RankedProducts(leaderboard)
+        else:
+            ranking = keyset.queryset.order_by(*keyset.ordering)
+        return Paginator(ranking, HomeView.PAGE_SIZE).get_page(page)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+
+        page = context['products']
+        sort = self.get_sort(self.request)
+        keyset = self._get_keyset_paginator(sort)
+        context['sort'] = sort
+        context['sorts'] = list(HomeView.ORDERINGS)
+        # Lets the vote badges look up the states of the whole page at once
+        context['page_ids'] = [product.pk for product in page]
+        context['next_cursor'] = keyset.cursor_after(page[-1]) if page.has_next() else None
+        context['previous_cursor'] = keyset.cursor_before(page[0]) if page.has_previous() else None
+        return context
 
+    @staticmethod
+    def get_sort(request):
+        sort = request.GET.get('sort')
+        return sort if sort in HomeView.ORDERINGS else HomeView.DEFAULT_SORT
 
+    @staticmethod
+    def _get_keyset_paginator(sort):
+        return KeysetPaginator(Product.objects.all(), HomeView.ORDERINGS[sort], HomeView.PAGE_SIZE)
+
+
+def trending(request):
+    return render(request, 'products/trending.html', {'products': rollups.trending()})
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    results = Paginator(product_search.SearchResults(query), HomeView.PAGE_SIZE).get_page(request.GET.get('page'))
+    return render(request, 'products/search.html', {'query': query, 'products': results})
+
+
+def search_suggest(request):
+    """Titles for autocomplete, called on every keystroke."""
+    ru = translation.get_language() == 'ru'
+    suggestions = [{'id': pk, 'title': title_ru if ru and title_ru else title_en,
+                    'url': reverse('detail', args=(pk,))}
+                   for pk, title_en, title_ru in product_search.suggest(request.GET.get('q', ''))]
+    response = JsonResponse({'suggestions': suggestions})
+    response['Cache-Control'] = 'private, max-age=60'
+    return response
+
+
+@csrf_exempt
 @login_required
 def create(request):
+    # Handlers must be replaced before the CSRF check reads the request
+    request.upload_handlers = [uploads.ImageUploadHandler(request)]
+    return _create(request)
+
+
+@csrf_protect
+def _create(request):
     if request.method == 'POST':
         from django.utils.datastructures import MultiValueDictKeyError
+        rejection = uploads.rejection(request)
+        if rejection:
+            return render(request, 'products/create.html', {'error': _(rejection)})
         try:
             title_en = request.POST['title']
             title_ru = request.POST['title-ru']
@@ -53,9 +214,14 @@ def create(request):
                 product.url = url
                 product.icon = icon
                 product.image = image
+                # The placeholders follow with the derivatives
+                for field, file in (('icon', icon), ('image', image)):
+                    for name, value in images.metadata_fields(field, images.describe(file)).items():
+                        setattr(product, name, value)
                 product.pub_date = timezone.datetime.now()
                 product.hunter = request.user
-                product.save()
+                retry_on_locked(product.save)()
+                images.schedule_derivatives(product)
                 return redirect('detail', str(product.pk))
             else:
                 return render(request, 'products/create.html', {'error': _('fields_error')})
@@ -76,39 +242,168 @@ def _validate_url(url):
         return False
 
 
+@method_decorator(condition(etag_func=_detail_etag, last_modified_func=_detail_last_modified), name='get')
+@method_decorator(page_cache.cached_page(_detail_version), name='get')
 class ProductDetailView(DetailView):
-    model = Product
+    # The template shows the hunter's name
+    queryset = Product.objects.select_related('hunter')
     template_name = 'products/detail.html'
     pk_url_kwarg = 'pk'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        product = context['product']
-        context['is_author'] = product.hunter.id == self.request.user.id
-        if self.request.user.is_authenticated:
-            context['is_voted'] = ProductVote.is_already_voted(self.request.user, product)
-
+        context['stats'] = rollups.product_stats(context['product'].pk)
         return context
 
 
+# The parts of the cached pages that depend on the user, see `products.page_cache`
+
+@page_cache.hole_context('products/upvote_button.html')
+def _upvote_button_context(request, product_id, hunter_id, votes_total):
+    if not request.user.is_authenticated:
+        return {}
+    return {'is_author': hunter_id == request.user.id, 'is_voted': _is_voted_by_request_user(request, product_id)}
+
+
+@page_cache.hole_context('products/vote_badge.html')
+def _vote_badge_context(request, product_id, hunter_id, page_ids):
+    if not request.user.is_authenticated:
+        return {}
+    if hunter_id == request.user.id:
+        return {'vote_state': 'yours'}
+    return {'vote_state': 'voted' if product_id in _voted_on_page(request, page_ids) else None}
+
+
+def _voted_on_page(request, page_ids):
+    # Asked by every badge of the page: the votes of the whole page, pending ones included,
+    # are looked up once, with at most one query and one journal lookup
+    if not hasattr(request, '_voted_on_page'):
+        voted = vote_state.voted_product_ids(request.user, page_ids)
+        if vote_buffer.is_enabled():
+            voted |= vote_buffer.get_buffer().pending_products(request.user.id, page_ids)
+        request._voted_on_page = voted
+    return request._voted_on_page
+
+
 @login_required
 def upvote(request, pk):
     if request.method == 'POST':
-        product = get_object_or_404(Product, pk=pk)
-
-        if product.hunter.id == request.user.id:
-            # User cannot vote on their own questions
+        product = get_object_or_404(Product.objects.only('hunter'), pk=pk)
+        if _vote(request.user, product):
             raise Http404()
+        return _redirect_after_vote(request, pk)
+    else:
+        raise Http404()
 
-        try:
-            ProductVote.objects.create(user=request.user, product=product)
-        except IntegrityError:
-            # User has already voted on this question
-            raise Http404()
 
-        product.votes_total += 1
-        product.save()
-        return redirect('detail', str(pk))
-    else:
+@require_POST
+def upvote_json(request, pk):
+    """Same as `upvote` for scripts, answers with the product's new vote count.
+
+    Repeating a vote changes nothing: it is answered with 409 and the same
+    state, a vote on the user's own product with 403.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'login_required'}, status=401)
+    product = Product.objects.only('hunter').filter(pk=pk).first()
+    if product is None:
+        return JsonResponse({'error': 'not_found'}, status=404)
+
+    rejected = _vote(request.user, product)
+    state = rejected or 'voted'
+    votes_total = Product.objects.values_list('votes_total', flat=True).get(pk=pk)
+    if vote_buffer.is_enabled() and vote_buffer.get_buffer().contains(request.user.id, pk):
+        # Still in the journal, so not applied to the database yet. Once any process has flushed it,
+        # the journal row is gone and the total above already counts the vote.
+        votes_total += 1
+    return JsonResponse({
+        'product': pk,
+        'state': state,
+        'votes_total': votes_total,
+        'votes_label': italic_first(ngettext('%(d)s vote', '%(d)s votes', votes_total) % {'d': votes_total}),
+        'message': _('cannot_vote_on_own') if state == 'yours' else _('vote_once'),
+    }, status={None: 200, 'yours': 403, 'voted': 409}[rejected])
+
+
+def _vote(user, product):
+    """Casts the vote, returns why it was rejected: 'yours', 'voted' or None."""
+    if product.hunter_id == user.id:
+        # User cannot vote on their own questions
+        return 'yours'
+
+    if vote_buffer.is_enabled():
+        # The vote is journaled and applied to the database later by the flusher
+        if _is_voted(user, product) or not vote_buffer.get_buffer().add(user.id, product.pk):
+            return 'voted'
+        return None
+
+    try:
+        _cast_vote(user, product)
+    except IntegrityError:
+        # User has already voted on this question
+        return 'voted'
+    return None
+
+
+@retry_on_locked
+def _cast_vote(user, product):
+    with transaction.atomic():
+        vote = ProductVote.objects.create(user=user, product=product)
+        rollups.add([(product.pk, vote.created)])
+        # Increment in the database: concurrent votes are not lost
+        # and only one column is written
+        Product.objects.filter(pk=product.pk).update(votes_total=F('votes_total') + 1,
+                                                     hot_score=hot.expression(F('votes_total') + 1),
+                                                     updated=timezone.now())
+        transaction.on_commit(lambda: leaderboard.add_votes(product.pk))
+
+
+def _is_voted_by_request_user(request, pk):
+    # Asked by both the ETag and the template
+    if not hasattr(request, '_is_voted'):
+        request._is_voted = _is_voted(request.user, Product(pk=pk))
+    return request._is_voted
+
+
+@login_required
+def export_data(request, dataset, format):
+    """Streams a dataset of `products.export` to staff, gzipped if the client accepts it.
+
+    `?since=<ISO time>` limits products to those updated and votes to those
+    cast since then, `?after_id=<id>` continues an earlier export.
+    """
+    if not request.user.is_staff:
+        raise PermissionDenied
+    if dataset not in export.DATASETS or format not in export.FORMATS:
         raise Http404()
+    try:
+        since = export.parse_since(request.GET['since']) if request.GET.get('since') else None
+        after_id = int(request.GET.get('after_id') or 0)
+        rows = export.rows(dataset, since=since, after_id=after_id)
+    except (export.ExportError, ValueError) as error:
+        return HttpResponseBadRequest(str(error))
+
+    chunks = export.encode(dataset, rows, format)
+    gzipped = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    response = StreamingHttpResponse(export.compress(chunks) if gzipped else chunks,
+                                     content_type=export.CONTENT_TYPES[format])
+    if gzipped:
+        response['Content-Encoding'] = 'gzip'
+    response['Vary'] = 'Accept-Encoding'
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{format}"'
+    return response
+
+
+def _redirect_after_vote(request, pk):
+    # Votes cast from the home page return there
+    next_url = request.POST.get('next')
+    if next_url and is_safe_url(next_url, allowed_hosts={request.get_host()}, require_https=request.is_secure()):
+        return redirect(next_url)
+    return redirect('detail', str(pk))
+
+
+def _is_voted(user, product):
+    if vote_buffer.is_enabled() and vote_buffer.get_buffer().contains(user.id, product.pk):
+        return True
+    return product.pk in vote_state.voted_product_ids(user, [product.pk])
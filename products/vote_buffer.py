@@ -0,0 +1,172 @@
+"""Write-behind buffer for votes.
+
+When `settings.VOTE_BUFFER_ENABLED` is set, `upvote` does not write to the
+main database. Accepted votes are appended to a small SQLite journal (a
+separate file, so it never competes for the main database lock) and applied
+later in batches by `VoteBuffer.flush`, either from the in-process flusher
+thread or from the `flush_votes` management command.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+
+from products import hot, rollups, vote_state
+from products.leaderboard import leaderboard
+from products.models import Product, ProductVote
+from producthuntclone.sqlite import retry_on_locked
+
+logger = logging.getLogger(__name__)
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def is_enabled():
+    return getattr(settings, 'VOTE_BUFFER_ENABLED', False)
+
+
+def get_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = VoteBuffer(settings.VOTE_BUFFER_JOURNAL,
+                                 batch_size=settings.VOTE_BUFFER_BATCH_SIZE,
+                                 flush_interval=settings.VOTE_BUFFER_FLUSH_INTERVAL)
+        return _buffer
+
+
+@receiver(setting_changed)
+def _reset_buffer(setting, **kwargs):
+    global _buffer
+    if setting.startswith('VOTE_BUFFER_'):
+        with _buffer_lock:
+            _buffer = None
+
+
+class VoteBuffer:
+    def __init__(self, path, batch_size=500, flush_interval=0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._flusher = None
+
+    def add(self, user_id, product_id):
+        """Durably records a vote. Returns False if it is already pending."""
+        # The journal's UNIQUE constraint catches duplicates from every process
+        cursor = self._connection().execute(
+            'INSERT OR IGNORE INTO vote_journal (user_id, product_id) VALUES (?, ?)', (user_id, product_id))
+        self._ensure_flusher()
+        return cursor.rowcount == 1
+
+    def contains(self, user_id, product_id):
+        # Only the journal knows whether a flush, possibly by another process, applied the vote
+        row = self._connection().execute(
+            'SELECT 1 FROM vote_journal WHERE user_id = ? AND product_id = ?', (user_id, product_id)).fetchone()
+        return row is not None
+
+    def pending_products(self, user_id, product_ids):
+        """Which of `product_ids` the user has a pending vote on."""
+        product_ids = list(product_ids)
+        if not product_ids:
+            return set()
+        placeholders = ', '.join('?' * len(product_ids))
+        rows = self._connection().execute(
+            f'SELECT product_id FROM vote_journal WHERE user_id = ? AND product_id IN ({placeholders})',
+            [user_id] + product_ids).fetchall()
+        return {product_id for product_id, in rows}
+
+    def pending_count(self):
+        return self._connection().execute('SELECT COUNT(*) FROM vote_journal').fetchone()[0]
+
+    def flush(self):
+        """Applies all journaled votes, returns the number of journal entries processed."""
+        processed = 0
+        while True:
+            rows = self._connection().execute(
+                'SELECT id, user_id, product_id FROM vote_journal ORDER BY id LIMIT ?', (self.batch_size,)).fetchall()
+            if not rows:
+                return processed
+            _apply_votes({(user_id, product_id) for _, user_id, product_id in rows})
+            # Entries are removed only after the votes are committed: a crash in between
+            # just replays them, which `_apply_votes` tolerates
+            self._connection().execute('DELETE FROM vote_journal WHERE id <= ?', (rows[-1][0],))
+            processed += len(rows)
+
+    def _connection(self):
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS vote_journal ('
+                         'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                         'user_id INTEGER NOT NULL, '
+                         'product_id INTEGER NOT NULL, '
+                         'UNIQUE (user_id, product_id))')
+            self._local.connection = conn
+        return conn
+
+    def _ensure_flusher(self):
+        if not self.flush_interval or self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_periodically, name='vote-flusher', daemon=True)
+                self._flusher.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush buffered votes')
+            finally:
+                connection.close()
+
+
+@retry_on_locked
+def _apply_votes(pairs):
+    """Inserts the votes and bumps every affected counter once.
+
+    Votes that violate the same rules as `upvote` (own product, second vote,
+    deleted user or product) are dropped. The transaction reads before it
+    writes, so SQLite may refuse to upgrade it to a write lock; it is retried.
+    """
+    user_ids = {user_id for user_id, _ in pairs}
+    product_ids = {product_id for _, product_id in pairs}
+
+    now = timezone.now()
+    with transaction.atomic():
+        hunters = dict(Product.objects.filter(pk__in=product_ids).values_list('pk', 'hunter_id'))
+        users = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        existing = set(ProductVote.objects
+                       .filter(user_id__in=user_ids, product_id__in=product_ids)
+                       .values_list('user_id', 'product_id'))
+        votes = [(user_id, product_id) for user_id, product_id in pairs
+                 if product_id in hunters and user_id in users
+                 and hunters[product_id] != user_id and (user_id, product_id) not in existing]
+
+        # The journal keeps no times: votes count as cast when they are flushed, seconds later
+        ProductVote.objects.bulk_create([ProductVote(user_id=user_id, product_id=product_id, created=now)
+                                         for user_id, product_id in votes], ignore_conflicts=True)
+        rollups.add((product_id, now) for _, product_id in votes)
+        for product_id, count in Counter(product_id for _, product_id in votes).items():
+            Product.objects.filter(pk=product_id).update(votes_total=F('votes_total') + count,
+                                                         hot_score=hot.expression(F('votes_total') + count, now),
+                                                         updated=now)
+            transaction.on_commit(partial(leaderboard.add_votes, product_id, count))
+        for user_id in {user_id for user_id, _ in votes}:
+            vote_state.invalidate_on_commit(user_id)
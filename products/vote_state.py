@@ -0,0 +1,68 @@
+"""Per-user cache of the products a user has voted on.
+
+List and detail pages need to know for every product shown whether the
+current user has voted on it. The states looked up for a user are cached
+as one dict, product id -> voted, so repeated page views resolve the state
+of a whole page without a query, and a page of products not seen before
+costs one query for the page only: the whole vote history of a user is
+never loaded. The dict holds at most `VOTED_STATES_CACHE_SIZE` products and
+is dropped whenever one of the user's votes is written or deleted; it lives
+in the file-based 'vote_states' cache, so the drop reaches every process.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from products.models import ProductVote
+
+CACHE_ALIAS = 'vote_states'
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def voted_product_ids(user, product_ids):
+    """Which of `product_ids` the user has voted on."""
+    product_ids = set(product_ids)
+    key = _key(user.pk)
+    states = get_cache().get(key) or {}
+    unknown = product_ids - states.keys()
+    if unknown:
+        voted = ProductVote.voted_product_ids(user, unknown)
+        if len(states) + len(unknown) > settings.VOTED_STATES_CACHE_SIZE:
+            # Starts over with the products at hand
+            states = {}
+        states.update((product_id, product_id in voted) for product_id in unknown)
+        get_cache().set(key, states, settings.VOTED_SET_CACHE_TIMEOUT)
+    return {product_id for product_id in product_ids if states[product_id]}
+
+
+def invalidate(user_id):
+    get_cache().delete(_key(user_id))
+
+
+def invalidate_on_commit(user_id):
+    # Also dropped right away: the cache must not keep the set read before the vote
+    invalidate(user_id)
+    transaction.on_commit(lambda: invalidate(user_id))
+
+
+def _key(user_id):
+    return f'voted-products:{user_id}'
+
+
+@receiver(post_save, sender=ProductVote)
+@receiver(post_delete, sender=ProductVote)
+def _invalidate_voter(instance, **kwargs):
+    invalidate_on_commit(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def _invalidate_new_user(instance, created, **kwargs):
+    # A reused id must not inherit the votes of a deleted user
+    if created:
+        invalidate(instance.pk)